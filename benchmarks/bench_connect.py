@@ -0,0 +1,62 @@
+#!/usr/bin/env python
+"""Dashboard startup benchmark: Dataset.connect on a many-partition store.
+
+Compares the lazy `Dataset.connect` (schema from kartothek metadata) with
+the previous behaviour of also building the full coadd table graph.
+
+    python benchmarks/bench_connect.py /tmp/bench_store --n_tracts 40 --n_buckets 25
+"""
+import time
+from pathlib import Path
+
+import click
+
+from lsst_dashboard.dataset import Dataset
+
+from synthetic import make_coadd_store
+
+
+def timeit(fn, repeat):
+    times = []
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        fn()
+        times.append(time.perf_counter() - t0)
+    return min(times)
+
+
+@click.command()
+@click.argument("path")
+@click.option("--n_filters", default=5)
+@click.option("--n_tracts", default=40)
+@click.option("--n_buckets", default=25)
+@click.option("--rows_per_bucket", default=50)
+@click.option("--repeat", default=3)
+def main(path, n_filters, n_tracts, n_buckets, rows_per_bucket, repeat):
+    if not Path(path).joinpath("analysisVisitTable_stats.parq").exists():
+        print(f"writing {n_filters * n_tracts * n_buckets} partitions to {path} ...")
+        make_coadd_store(
+            path,
+            n_filters=n_filters,
+            n_tracts=n_tracts,
+            n_buckets=n_buckets,
+            rows_per_bucket=rows_per_bucket,
+        )
+
+    def lazy():
+        Dataset(path).connect()
+
+    def eager():
+        d = Dataset(path)
+        d.connect()
+        d.fetch_coadd_table(coadd_version=d.coadd_version)
+
+    t_lazy = timeit(lazy, repeat)
+    t_eager = timeit(eager, repeat)
+    print(f"connect (lazy schema):       {t_lazy:8.3f} s")
+    print(f"connect + full coadd graph:  {t_eager:8.3f} s")
+    print(f"speedup:                     {t_eager / t_lazy:8.1f} x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,72 @@
+#!/usr/bin/env python
+"""Driver memory of the partitioner ingest path as the number of input files grows.
+
+"eager" reproduces the previous df_generator, which called pd.read_parquet
+on the client and wrapped the result in delayed; "lazy" is
+`lsst_dashboard.ingest.ddf_from_files`, where each read is a worker task,
+which `DatasetPartitioner.get_df` builds its dataframe with.
+Each measurement runs in a fresh process and reports its peak RSS.
+
+    python benchmarks/bench_ingest.py /tmp/bench_ingest --n_files 10,50,200
+"""
+import multiprocessing
+import resource
+import time
+
+import click
+import pandas as pd
+import dask.dataframe as dd
+from dask import delayed
+from distributed import Client, LocalCluster
+
+from lsst_dashboard.ingest import ddf_from_files
+
+from synthetic import make_butler_files
+
+
+def eager_ddf(filenames, dataIds):
+    parts = []
+    for filename, dataId in zip(filenames, dataIds):
+        df = delayed(pd.read_parquet(filename))
+        parts.append(delayed(pd.DataFrame.assign)(df, **dataId))
+    return dd.from_delayed(parts)
+
+
+def lazy_ddf(filenames, dataIds):
+    filters = sorted(set(d["filter"] for d in dataIds))
+    tracts = sorted(set(d["tract"] for d in dataIds))
+    return ddf_from_files(filenames, dataIds, category_values={"filter": filters, "tract": tracts})
+
+
+def run(mode, filenames, dataIds, queue):
+    with LocalCluster(n_workers=2, threads_per_worker=1, dashboard_address=None) as cluster:
+        with Client(cluster):
+            t0 = time.perf_counter()
+            ddf = (eager_ddf if mode == "eager" else lazy_ddf)(filenames, dataIds)
+            n_rows = ddf.map_partitions(len).compute().sum()
+            elapsed = time.perf_counter() - t0
+    queue.put((n_rows, elapsed, resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024))
+
+
+@click.command()
+@click.argument("path")
+@click.option("--n_files", default="10,50,200", help="comma separated numbers of input files")
+@click.option("--rows_per_file", default=20000)
+def main(path, n_files, rows_per_file):
+    counts = [int(n) for n in n_files.split(",")]
+    filenames, dataIds = make_butler_files(path, max(counts), rows_per_file=rows_per_file)
+
+    ctx = multiprocessing.get_context("spawn")
+    print(f"{'files':>6} {'mode':>6} {'rows':>10} {'time [s]':>9} {'driver peak RSS [MB]':>21}")
+    for n in counts:
+        for mode in ["eager", "lazy"]:
+            queue = ctx.Queue()
+            proc = ctx.Process(target=run, args=(mode, filenames[:n], dataIds[:n], queue))
+            proc.start()
+            n_rows, elapsed, rss = queue.get()
+            proc.join()
+            print(f"{n:>6} {mode:>6} {n_rows:>10} {elapsed:>9.2f} {rss:>21.0f}")
+
+
+if __name__ == "__main__":
+    main()
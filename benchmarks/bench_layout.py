@@ -0,0 +1,92 @@
+#!/usr/bin/env python
+"""Write time, size on disk and read times of the coadd tables under several Parquet layouts.
+
+The same synthetic store is written once per layout (see
+`lsst_dashboard.layout.LAYOUTS`, or pass ``key=value`` specs), then read
+with the Dataset access patterns of the dashboard:
+
+- ``metrics``: a few metric columns of one filter over all tracts;
+- ``query``: the same with a pushed-down ``psfMag < 20`` predicate.
+
+The write time covers both (forced and unforced) coadd tables and the
+size is that of the whole store.  Reads run in fresh processes, in both
+load modes; the OS page cache is not dropped, so run with stores larger
+than memory to measure cold reads.
+
+    python benchmarks/bench_layout.py /tmp/bench_layout --layouts default,zstd-64mb,lz4-64mb
+"""
+import multiprocessing
+import shutil
+import time
+from pathlib import Path
+
+import click
+
+from lsst_dashboard.layout import LAYOUTS, StorageLayout
+
+from synthetic import METRICS, make_coadd_store
+
+
+def disk_usage(path):
+    return sum(f.stat().st_size for f in Path(path).rglob("*") if f.is_file())
+
+
+def read(path, mode, query, queue):
+    from lsst_dashboard.dataset import Dataset
+
+    d = Dataset(path, cache_size=0, load_mode=mode)
+    d.connect()
+    t0 = time.perf_counter()
+    df = d.get_coadd_ddf_by_filter_metric(
+        d.filters[0], METRICS[:2], d.tracts, coadd_version=d.coadd_version, query=query
+    )
+    queue.put((len(df), time.perf_counter() - t0))
+
+
+@click.command()
+@click.argument("path")
+@click.option(
+    "--layouts", default=",".join(LAYOUTS), help="comma separated presets, or ';' separated key=value specs"
+)
+@click.option("--n_tracts", default=20)
+@click.option("--n_buckets", default=8)
+@click.option("--rows_per_bucket", default=50000)
+@click.option("--keep", is_flag=True, help="keep the written stores")
+def main(path, layouts, n_tracts, n_buckets, rows_per_bucket, keep):
+    names = layouts.split(";") if ";" in layouts else layouts.split(",")
+    ctx = multiprocessing.get_context("spawn")
+
+    print(f"{'layout':>20} {'write [s]':>10} {'size [MB]':>10} {'pattern':>8} {'mode':>6} {'read [s]':>9}")
+    for name in names:
+        layout = StorageLayout.parse(name)
+        store_path = Path(path).joinpath(name.replace("=", "_").replace(",", "-"))
+        if store_path.exists():
+            shutil.rmtree(store_path)
+
+        t0 = time.perf_counter()
+        make_coadd_store(
+            store_path,
+            n_filters=1,
+            n_tracts=n_tracts,
+            n_buckets=n_buckets,
+            rows_per_bucket=rows_per_bucket,
+            df_serializer=layout.serializer(),
+        )
+        write_time = time.perf_counter() - t0
+        size = disk_usage(store_path) / 1024 ** 2
+
+        for pattern, query in [("metrics", None), ("query", "psfMag < 20")]:
+            for mode in ["dask", "arrow"]:
+                queue = ctx.Queue()
+                proc = ctx.Process(target=read, args=(str(store_path), mode, query, queue))
+                proc.start()
+                _, elapsed = queue.get()
+                proc.join()
+                print(f"{name:>20} {write_time:>10.2f} {size:>10.1f} {pattern:>8} {mode:>6} {elapsed:>9.2f}")
+
+        if not keep:
+            shutil.rmtree(store_path)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,61 @@
+#!/usr/bin/env python
+"""Peak RSS and wall time of loading one filter of the coadd table.
+
+"dask" is the kartothek `read_dataset_as_ddf(...).compute()` path; "arrow"
+reads the same partition files with pyarrow into one Arrow table that is
+converted to pandas once (``Dataset(load_mode="arrow")``).  The total
+number of rows is fixed while the number of partitions of the filter
+varies, and each measurement runs in a fresh process.
+
+    python benchmarks/bench_load.py /tmp/bench_load --n_partitions 10,100,1000
+"""
+import multiprocessing
+import resource
+import time
+from pathlib import Path
+
+import click
+
+from synthetic import METRICS, make_coadd_store
+
+
+def run(path, mode, queue):
+    from lsst_dashboard.dataset import Dataset
+
+    d = Dataset(path, cache_size=0, load_mode=mode)
+    d.connect()
+    t0 = time.perf_counter()
+    df = d.get_coadd_ddf_by_filter_metric(d.filters[0], METRICS, d.tracts, coadd_version=d.coadd_version)
+    elapsed = time.perf_counter() - t0
+    queue.put((len(df), elapsed, resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024))
+
+
+@click.command()
+@click.argument("path")
+@click.option("--n_partitions", default="10,100,1000", help="comma separated partitions per filter")
+@click.option("--n_rows", default=2000000, help="total rows of the filter")
+def main(path, n_partitions, n_rows):
+    ctx = multiprocessing.get_context("spawn")
+    print(f"{'partitions':>10} {'mode':>6} {'rows':>10} {'time [s]':>9} {'peak RSS [MB]':>14}")
+    for n in [int(n) for n in n_partitions.split(",")]:
+        store_path = Path(path).joinpath(f"partitions_{n}")
+        n_tracts = max(1, n // 10)
+        if not store_path.joinpath("analysisVisitTable_stats.parq").exists():
+            make_coadd_store(
+                store_path,
+                n_filters=1,
+                n_tracts=n_tracts,
+                n_buckets=n // n_tracts,
+                rows_per_bucket=n_rows // n,
+            )
+        for mode in ["dask", "arrow"]:
+            queue = ctx.Queue()
+            proc = ctx.Process(target=run, args=(str(store_path), mode, queue))
+            proc.start()
+            rows, elapsed, rss = queue.get()
+            proc.join()
+            print(f"{n:>10} {mode:>6} {rows:>10} {elapsed:>9.2f} {rss:>14.0f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,141 @@
+"""Synthetic kartothek stores shaped like the repartitioned dashboard data.
+
+Used by the benchmark scripts in this directory; nothing here is needed to
+run the dashboard itself.
+"""
+from functools import partial
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+
+METRICS = [
+    "base_Footprint_nPix",
+    "Gaussian-PSF_magDiff_mmag",
+    "CModel-PSF_magDiff_mmag",
+    "e1ResidsSdss_milli",
+    "e2ResidsSdss_milli",
+]
+FLAGS = ["calib_psf_used", "calib_psf_candidate", "qaBad_flag"]
+STATISTICS = ["count", "mean", "std", "min", "1%", "5%", "25%", "50%", "75%", "95%", "99%", "max"]
+
+
+def make_coadd_frame(filt, tract, n_rows, metrics=None, flags=None, seed=0):
+    """Random coadd-like table for a single (filter, tract)
+    """
+    metrics = METRICS if metrics is None else metrics
+    flags = FLAGS if flags is None else flags
+    rng = np.random.default_rng(seed)
+
+    data = {
+        "ra": rng.uniform(0, 2, n_rows) + tract % 100,
+        "dec": rng.uniform(-1, 1, n_rows),
+        "psfMag": rng.uniform(16, 26, n_rows),
+        "patch": [f"{i},{j}" for i, j in rng.integers(0, 9, (n_rows, 2))],
+    }
+    for metric in metrics:
+        data[metric] = rng.normal(0, 1, n_rows)
+    for flag in flags:
+        data[flag] = rng.random(n_rows) < 0.1
+
+    df = pd.DataFrame(data)
+    df["filter"] = filt
+    df["tract"] = tract
+    return df
+
+
+def make_stats_frame(dataIds, columns):
+    """Summary statistics table indexed like the *_stats.parq files
+    """
+    keys = list(dataIds[0].keys())
+    index = pd.MultiIndex.from_tuples(
+        [(*dataId.values(), s) for dataId in dataIds for s in STATISTICS], names=[*keys, "statistic"]
+    )
+    rng = np.random.default_rng(0)
+    return pd.DataFrame(rng.normal(size=(len(index), len(columns))), index=index, columns=columns)
+
+
+def make_coadd_store(
+    path,
+    n_filters=5,
+    n_tracts=20,
+    n_buckets=20,
+    rows_per_bucket=100,
+    metrics=None,
+    flags=None,
+    df_serializer=None,
+):
+    """Writes synthetic coadd (and matching stats) tables to `path`
+
+    Each (filter, tract) gets `n_buckets` partition files, so the coadd
+    tables have ``n_filters * n_tracts * n_buckets`` partitions.  The files
+    are written with `df_serializer` (kartothek's default if None).
+    """
+    from kartothek.io.eager import store_dataframes_as_dataset
+    from storefact import get_store_from_url
+
+    path = Path(path)
+    path.mkdir(parents=True, exist_ok=True)
+    store = partial(get_store_from_url, "hfs://" + str(path))
+
+    filters = [f"HSC-{i}" for i in range(n_filters)]
+    tracts = list(range(9000, 9000 + n_tracts))
+    metrics = METRICS if metrics is None else metrics
+
+    dfs = []
+    for i, filt in enumerate(filters):
+        for tract in tracts:
+            for bucket in range(n_buckets):
+                seed = hash((i, tract, bucket)) % 2 ** 32
+                dfs.append(make_coadd_frame(filt, tract, rows_per_bucket, metrics, flags, seed=seed))
+
+    for version in ["forced", "unforced"]:
+        store_dataframes_as_dataset(
+            store=store,
+            dataset_uuid=f"analysisCoaddTable_{version}",
+            dfs=dfs,
+            partition_on=["filter", "tract"],
+            df_serializer=df_serializer,
+            overwrite=True,
+        )
+
+    coadd_dataIds = [{"filter": f, "tract": t} for f in filters for t in tracts]
+    visit_dataIds = [dict(d, visit=v) for d in coadd_dataIds for v in range(2)]
+    columns = metrics + ["ra", "dec", "psfMag"]
+    for table, dataIds in [
+        ("CoaddTable_forced", coadd_dataIds),
+        ("CoaddTable_unforced", coadd_dataIds),
+        ("VisitTable", visit_dataIds),
+    ]:
+        make_stats_frame(dataIds, columns).to_parquet(path.joinpath(f"analysis{table}_stats.parq"))
+
+    return path
+
+
+def make_butler_files(path, n_files, rows_per_file=20000, metrics=None, flags=None):
+    """Writes Butler-style analysisCoaddTable Parquet files (one per dataId)
+
+    Returns the list of filenames and matching dataIds.
+    """
+    path = Path(path)
+    path.mkdir(parents=True, exist_ok=True)
+    metrics = METRICS if metrics is None else metrics
+
+    filenames, dataIds = [], []
+    for i in range(n_files):
+        dataId = {"filter": f"HSC-{i % 5}", "tract": 9000 + i // 5}
+        filename = path.joinpath(f"analysisCoaddTable-{dataId['filter']}-{dataId['tract']}.parq")
+        if not filename.exists():
+            df = make_coadd_frame(dataId["filter"], dataId["tract"], rows_per_file, metrics, flags, seed=i)
+            df = df.drop(columns=["filter", "tract"]).rename(columns={"patch": "patchId"})
+            df = df.assign(
+                coord_ra=np.deg2rad(df.pop("ra")),
+                coord_dec=np.deg2rad(df.pop("dec")),
+                base_PsfFlux_instFlux=10 ** (-0.4 * df.pop("psfMag")),
+            )
+            df.index.name = "id"
+            df.to_parquet(filename)
+        filenames.append(str(filename))
+        dataIds.append(dataId)
+    return filenames, dataIds
@@ -0,0 +1,435 @@
+"""Precomputed sky and histogram aggregates.
+
+The partitioners write, per (filter, metric), the count, sum and sum of
+squares of the metric in ra/dec cells at several resolutions (a pyramid).
+Zoomed-out sky maps are then drawn from these tiles, and objects only need
+to be loaded once the view is small enough to show them individually.
+
+Cells of level ``l`` are ``BASE_CELL / 2**l`` degrees on a side, indexed by
+``ix = floor(ra / cell)`` and ``iy = floor((dec + 90) / cell)``, so the four
+cells of level ``l + 1`` inside a cell of level ``l`` are ``(2 ix + i, 2 iy + j)``.
+Only non-empty cells are stored.
+
+They also write `HistogramCube` tables: per (filter, tract), the 2D
+histograms of psfMag against each metric with the sum and sum of squares of
+the metric in every bin.  Summed over any selection of tracts they give the
+zoomed-out psfMag-vs-metric views and their per-bin mean/std exactly.
+"""
+import numpy as np
+import pandas as pd
+import pyarrow.parquet as pq
+
+
+BASE_CELL = 4.0
+N_LEVELS = 8
+
+_STATS = ("count", "sum", "sumsq")
+
+
+def cell_size(level):
+    return BASE_CELL / 2 ** level
+
+
+def cell_index(ra, dec, level):
+    """Cell indices of finite ra/dec coordinates; non-finite ones must be masked by the caller
+    """
+    ra = np.asarray(ra, dtype="float64")
+    dec = np.asarray(dec, dtype="float64")
+    if not (np.isfinite(ra).all() and np.isfinite(dec).all()):
+        raise ValueError("Cell index of non-finite ra/dec coordinates")
+    size = cell_size(level)
+    ix = np.floor(ra / size).astype("int64")
+    iy = np.floor((dec + 90) / size).astype("int64")
+    return ix, iy
+
+
+def _column(metric, stat):
+    return f"{metric}__{stat}"
+
+
+def sky_aggregates(df, metrics, level=N_LEVELS - 1):
+    """Per-cell count, sum and sum of squares of `metrics` at `level`
+
+    Non-finite metric values are ignored.  Returns a `pandas.DataFrame` with
+    ``ix``, ``iy``, the object count ``n`` and ``{metric}__{count,sum,sumsq}``
+    columns.
+    """
+    ra = df["ra"].to_numpy(dtype="float64")
+    dec = df["dec"].to_numpy(dtype="float64")
+    valid = np.isfinite(ra) & np.isfinite(dec)
+    ix, iy = cell_index(ra[valid], dec[valid], level)
+    data = {"ix": ix, "iy": iy, "n": np.ones(len(ix), dtype="int64")}
+    for metric in metrics:
+        values = df[metric].to_numpy(dtype="float64", na_value=np.nan)[valid]
+        finite = np.isfinite(values)
+        values = np.where(finite, values, 0.0)
+        data[_column(metric, "count")] = finite.astype("int64")
+        data[_column(metric, "sum")] = values
+        data[_column(metric, "sumsq")] = values ** 2
+    return pd.DataFrame(data).groupby(["ix", "iy"], sort=False).sum().reset_index()
+
+
+def combine_aggregates(frames):
+    """Sums per-cell aggregates of the same level (e.g. of several files)
+    """
+    frames = [df for df in frames if len(df)]
+    if not frames:
+        return None
+    return pd.concat(frames, ignore_index=True).groupby(["ix", "iy"], sort=False).sum().reset_index()
+
+
+def file_sky_aggregates(key, store, metrics, level=N_LEVELS - 1):
+    """`sky_aggregates` of a partition file, read one row group at a time
+    """
+    if callable(store):
+        store = store()
+    frames = []
+    with store.open(key) as f:
+        parquet_file = pq.ParquetFile(f)
+        names = parquet_file.schema_arrow.names
+        metrics = [m for m in metrics if m in names]
+        for i in range(parquet_file.num_row_groups):
+            df = parquet_file.read_row_group(i, columns=["ra", "dec"] + metrics).to_pandas()
+            frames.append(sky_aggregates(df, metrics, level))
+    agg = combine_aggregates(frames)
+    return agg if agg is not None else pd.DataFrame(columns=["ix", "iy", "n"])
+
+
+def build_pyramid(finest, n_levels=N_LEVELS):
+    """All levels of a pyramid from the aggregates of its finest level
+
+    Returns one table with a ``level`` column.
+    """
+    levels = []
+    for level in range(n_levels - 1, -1, -1):
+        if level < n_levels - 1:
+            factor = 2 ** (n_levels - 1 - level)
+            coarse = finest.assign(ix=finest["ix"] // factor, iy=finest["iy"] // factor)
+            agg = coarse.groupby(["ix", "iy"], sort=False).sum().reset_index()
+        else:
+            agg = finest
+        levels.append(agg.assign(level=level))
+    return pd.concat(levels, ignore_index=True, sort=False)
+
+
+class SkyPyramid(object):
+    """Multi-resolution sky aggregates of a dataset, by filter and tract
+
+    Parameters
+    ----------
+    tiles : `pandas.DataFrame`
+        Non-empty cells with ``filter``, ``tract``, ``level``, ``ix``, ``iy``,
+        ``n`` and ``{metric}__{count,sum,sumsq}`` columns.  Cells spanning
+        a tract boundary have one row per tract; `select` sums them.
+    """
+
+    def __init__(self, tiles, n_levels=None):
+        self.tiles = tiles
+        self.n_levels = int(tiles["level"].max()) + 1 if n_levels is None else n_levels
+        self._levels = None
+
+    @classmethod
+    def read(cls, path, filters=None, metrics=None):
+        """Reads the pyramid written by the partitioners, optionally only some filters/metrics
+        """
+        columns = None
+        if metrics is not None:
+            schema = pq.read_schema(path)
+            keep = {"filter", "tract", "level", "ix", "iy", "n"}
+            keep.update(_column(m, stat) for m in metrics for stat in _STATS)
+            columns = [c for c in schema.names if c in keep]
+        pq_filters = None if filters is None else [("filter", "in", list(filters))]
+        return cls(pd.read_parquet(path, columns=columns, filters=pq_filters))
+
+    def write(self, path):
+        self.tiles.to_parquet(path, index=False)
+
+    @property
+    def metrics(self):
+        suffix = "__count"
+        return [c[: -len(suffix)] for c in self.tiles.columns if c.endswith(suffix)]
+
+    def select(self, filt, tracts=None):
+        """Pyramid of a single filter and, optionally, some of its tracts
+
+        The cells of the selected tracts are summed, so that every cell has
+        a single row.  No (or an empty list of) `tracts` selects all tracts.
+        """
+        tiles = self.tiles[self.tiles["filter"] == filt]
+        tracts = [] if tracts is None else list(tracts)
+        if "tract" in tiles.columns:
+            if tracts:
+                tiles = tiles[tiles["tract"].isin(tracts)]
+            tiles = tiles.drop(columns=["filter", "tract"]).groupby(["level", "ix", "iy"], sort=False).sum()
+            tiles = tiles.reset_index().assign(filter=filt)
+        return SkyPyramid(tiles, n_levels=self.n_levels)
+
+    def extent(self):
+        """ra and dec ranges covered by the cells of the pyramid, or None if it has none
+        """
+        if not len(self.tiles):
+            return None
+        level = int(self.tiles["level"].max())
+        tiles = self._level(level)
+        size = cell_size(level)
+        ra_range = (float(tiles["ix"].min() * size), float((tiles["ix"].max() + 1) * size))
+        dec_range = (float(tiles["iy"].min() * size - 90), float((tiles["iy"].max() + 1) * size - 90))
+        return ra_range, dec_range
+
+    def level_for(self, x_range, width):
+        """Coarsest level whose cells are at most about one pixel wide for a view
+        """
+        span = max(x_range[1] - x_range[0], 1e-9)
+        level = int(np.ceil(np.log2(BASE_CELL * max(width, 1) / span)))
+        return int(np.clip(level, 0, self.n_levels - 1))
+
+    def _level(self, level):
+        if self._levels is None:
+            self._levels = dict(iter(self.tiles.groupby("level", sort=False)))
+        return self._levels.get(level, self.tiles.iloc[:0])
+
+    def grid(self, metric, x_range, y_range, level, aggregator="mean"):
+        """Dense aggregate of `metric` over a ra/dec range at `level`
+
+        Returns cell center coordinates ``xs``, ``ys`` and the 2D array
+        (NaN for empty cells) of the mean, std or count.  The ranges must be
+        finite (see `extent` for a default view).
+        """
+        size = cell_size(level)
+        ix0, iy0 = cell_index(x_range[0], y_range[0], level)
+        ix1, iy1 = cell_index(x_range[1], y_range[1], level)
+        nx, ny = int(ix1 - ix0) + 1, int(iy1 - iy0) + 1
+
+        tiles = self._level(level)
+        inside = (tiles["ix"] >= ix0) & (tiles["ix"] <= ix1) & (tiles["iy"] >= iy0) & (tiles["iy"] <= iy1)
+        tiles = tiles[inside]
+
+        count = np.zeros((ny, nx))
+        total = np.zeros((ny, nx))
+        totalsq = np.zeros((ny, nx))
+        rows = (tiles["iy"] - iy0).to_numpy()
+        cols = (tiles["ix"] - ix0).to_numpy()
+        count[rows, cols] = tiles[_column(metric, "count")].to_numpy()
+        total[rows, cols] = tiles[_column(metric, "sum")].to_numpy()
+        totalsq[rows, cols] = tiles[_column(metric, "sumsq")].to_numpy()
+
+        with np.errstate(divide="ignore", invalid="ignore"):
+            if aggregator == "count":
+                values = np.where(count > 0, count, np.nan)
+            elif aggregator == "std":
+                mean = total / count
+                values = np.sqrt(np.maximum(totalsq / count - mean ** 2, 0) * count / (count - 1))
+                values[count < 2] = np.nan
+            else:
+                values = total / count
+
+        xs = (np.arange(ix0, ix0 + nx) + 0.5) * size
+        ys = (np.arange(iy0, iy0 + ny) + 0.5) * size - 90
+        return xs, ys, values
+
+    def image(self, metric, x_range, y_range, width=400, aggregator="mean"):
+        """`holoviews.Image` of `metric` for a view of `width` pixels
+        """
+        import holoviews as hv
+
+        level = self.level_for(x_range, width)
+        xs, ys, values = self.grid(metric, x_range, y_range, level, aggregator)
+        return hv.Image((xs, ys, values), kdims=["ra", "dec"], vdims=[metric])
+
+
+# psfMag bins of the histogram cubes, 0.05 mag wide
+CUBE_XDIM = "psfMag"
+CUBE_X_EDGES = np.linspace(14.0, 28.0, 281)
+CUBE_NY = 200
+
+CUBE_COLUMNS = ["filter", "tract", "metric", "ix", "iy", "count", "sum", "sumsq", "y_min", "y_max"]
+
+
+def cube_y_ranges(stats, lower="1%", upper="99%", pad=0.1):
+    """Metric bin ranges of the histogram cubes from per-filter stats
+
+    `stats` is indexed by (filter, statistic), like
+    `DatasetPartitioner.rollup_stats`; the [`lower`, `upper`] percentile
+    range is widened by `pad` of its width on each side.  Returns
+    ``{filter: {metric: (y_min, y_max)}}``.
+    """
+    ranges = {}
+    for filt in stats.index.unique(level=0):
+        lo, hi = stats.loc[(filt, lower)], stats.loc[(filt, upper)]
+        for metric in stats.columns:
+            if not (np.isfinite(lo[metric]) and np.isfinite(hi[metric])):
+                continue
+            width = hi[metric] - lo[metric] or 1.0
+            y_range = (lo[metric] - pad * width, hi[metric] + pad * width)
+            ranges.setdefault(filt, {})[metric] = y_range
+    return ranges
+
+
+def histogram_cells(x, y, y_range, x_edges=CUBE_X_EDGES, ny=CUBE_NY):
+    """Non-empty cells of the 2D histogram of `y` against `x`
+
+    Like `numpy.histogram2d`, values outside of the bin ranges (and
+    non-finite ones) are not counted, so that the edge bins only hold the
+    values that fall in them.
+    """
+    x = np.asarray(x, dtype="float64")
+    y = np.asarray(y, dtype="float64")
+    nx = len(x_edges) - 1
+    y_min, y_max = y_range
+    with np.errstate(invalid="ignore"):
+        inside = (x >= x_edges[0]) & (x <= x_edges[-1]) & (y >= y_min) & (y <= y_max)
+    x, y = x[inside], y[inside]
+
+    # the upper edges are included in the last bins
+    ix = np.minimum(np.searchsorted(x_edges, x, side="right") - 1, nx - 1)
+    iy = np.minimum(np.floor((y - y_min) / (y_max - y_min) * ny).astype("int64"), ny - 1)
+    flat = ix * ny + iy
+
+    count = np.bincount(flat, minlength=nx * ny)
+    total = np.bincount(flat, weights=y, minlength=nx * ny)
+    totalsq = np.bincount(flat, weights=y ** 2, minlength=nx * ny)
+    cells = np.flatnonzero(count)
+    return pd.DataFrame(
+        {
+            "ix": cells // ny,
+            "iy": cells % ny,
+            "count": count[cells],
+            "sum": total[cells],
+            "sumsq": totalsq[cells],
+        }
+    )
+
+
+def file_histogram_cells(key, store, y_ranges):
+    """Histogram cells of the metrics of a partition file, by row group
+
+    `y_ranges` maps each metric to its bin range.  Returns a frame with a
+    ``metric`` column and the `histogram_cells` columns.
+    """
+    if callable(store):
+        store = store()
+    frames = []
+    with store.open(key) as f:
+        parquet_file = pq.ParquetFile(f)
+        names = parquet_file.schema_arrow.names
+        metrics = [m for m in y_ranges if m in names]
+        if CUBE_XDIM not in names:
+            metrics = []
+        for i in range(parquet_file.num_row_groups if metrics else 0):
+            df = parquet_file.read_row_group(i, columns=[CUBE_XDIM] + metrics).to_pandas()
+            x = df[CUBE_XDIM].to_numpy(dtype="float64", na_value=np.nan)
+            for metric in metrics:
+                y = df[metric].to_numpy(dtype="float64", na_value=np.nan)
+                frames.append(histogram_cells(x, y, y_ranges[metric]).assign(metric=metric))
+    if not frames:
+        return pd.DataFrame(columns=["metric", "ix", "iy", "count", "sum", "sumsq"])
+    cells = pd.concat(frames, ignore_index=True)
+    return cells.groupby(["metric", "ix", "iy"], sort=False).sum().reset_index()
+
+
+class HistogramCube(object):
+    """2D histograms of `CUBE_XDIM` against each metric, by filter and tract
+
+    The cells store the object count and the sum and sum of squares of the
+    metric, so histograms and per-bin mean/std over any selection of tracts
+    are exact sums of the stored cells.
+
+    Parameters
+    ----------
+    cells : `pandas.DataFrame`
+        Non-empty cells with the `CUBE_COLUMNS` columns; ``y_min`` and
+        ``y_max`` give the metric bin range of each (filter, metric).
+    """
+
+    xdim = CUBE_XDIM
+    x_edges = CUBE_X_EDGES
+    ny = CUBE_NY
+
+    def __init__(self, cells):
+        self.cells = cells
+        self._metric_cells = None
+
+    @classmethod
+    def read(cls, path, filters=None, tracts=None, metrics=None):
+        """Reads the cubes written by the partitioners, optionally only some filters/tracts/metrics
+        """
+        pq_filters = []
+        if filters is not None:
+            pq_filters.append(("filter", "in", list(filters)))
+        if tracts is not None:
+            pq_filters.append(("tract", "in", list(tracts)))
+        if metrics is not None:
+            pq_filters.append(("metric", "in", list(metrics)))
+        return cls(pd.read_parquet(path, filters=pq_filters or None))
+
+    def write(self, path):
+        self.cells.to_parquet(path, index=False)
+
+    @property
+    def metrics(self):
+        return list(self.cells["metric"].unique())
+
+    def select(self, filt, tracts=None):
+        """Cube of a single filter and, optionally, some of its tracts
+
+        No (or an empty list of) `tracts` selects all tracts, like the
+        dashboard's empty tract selection.
+        """
+        keep = self.cells["filter"] == filt
+        tracts = [] if tracts is None else list(tracts)
+        if tracts:
+            keep &= self.cells["tract"].isin(tracts)
+        return HistogramCube(self.cells[keep])
+
+    def _cells(self, metric):
+        if self._metric_cells is None:
+            self._metric_cells = dict(iter(self.cells.groupby("metric", sort=False)))
+        return self._metric_cells.get(metric, self.cells.iloc[:0])
+
+    def y_edges(self, metric):
+        cells = self._cells(metric)
+        if not len(cells):
+            return np.linspace(0.0, 1.0, self.ny + 1)
+        return np.linspace(cells["y_min"].iloc[0], cells["y_max"].iloc[0], self.ny + 1)
+
+    def range(self, metric):
+        """Ranges of the histogram axes, for use instead of `Dataset.range`
+        """
+        y_edges = self.y_edges(metric)
+        return (self.x_edges[0], self.x_edges[-1]), (y_edges[0], y_edges[-1])
+
+    def histogram(self, metric):
+        """Dense ``count``, ``sum`` and ``sumsq`` arrays of shape (ny, nx), summed over filters and tracts
+        """
+        cells = self._cells(metric)
+        shape = (self.ny, len(self.x_edges) - 1)
+        rows, cols = cells["iy"].to_numpy(), cells["ix"].to_numpy()
+        arrays = []
+        for column in ["count", "sum", "sumsq"]:
+            values = np.zeros(shape)
+            np.add.at(values, (rows, cols), cells[column].to_numpy(dtype="float64"))
+            arrays.append(values)
+        return tuple(arrays)
+
+    def profile(self, metric):
+        """Count, mean and std of `metric` in each `xdim` bin
+        """
+        count, total, totalsq = (a.sum(axis=0) for a in self.histogram(metric))
+        with np.errstate(divide="ignore", invalid="ignore"):
+            mean = total / count
+            std = np.sqrt(np.maximum(totalsq / count - mean ** 2, 0) * count / (count - 1))
+        std[count < 2] = np.nan
+        x = (self.x_edges[:-1] + self.x_edges[1:]) / 2
+        return pd.DataFrame({self.xdim: x, "count": count, "mean": mean, "std": std})
+
+    def image(self, metric):
+        """`holoviews.Image` of the object counts in each bin (NaN where empty)
+        """
+        import holoviews as hv
+
+        count, _, _ = self.histogram(metric)
+        y_edges = self.y_edges(metric)
+        xs = (self.x_edges[:-1] + self.x_edges[1:]) / 2
+        ys = (y_edges[:-1] + y_edges[1:]) / 2
+        values = np.where(count > 0, count, np.nan)
+        return hv.Image((xs, ys, values), kdims=[self.xdim, metric], vdims=["count"])
@@ -0,0 +1,260 @@
+"""Caches for data loaded from the kartothek datasets."""
+import hashlib
+import json
+import os
+import shutil
+import threading
+import uuid
+from collections import OrderedDict
+from pathlib import Path
+
+import pyarrow as pa
+
+
+DEFAULT_CACHE_SIZE = 2 * 1024 ** 3
+DEFAULT_DISK_CACHE_SIZE = 50 * 1024 ** 3
+
+
+def nbytes(obj):
+    """Approximate in-memory size of a pandas object in bytes
+    """
+    usage = obj.memory_usage(deep=True)
+    try:
+        return int(usage.sum())
+    except AttributeError:
+        return int(usage)
+
+
+class ColumnCache(object):
+    """Least-recently-used cache of loaded columns with a byte budget.
+
+    Entries are keyed by ``(dataset_uuid, filter, tract, column)`` and hold
+    the `pandas.Series` of that column for a single (filter, tract) partition
+    group, in the order kartothek returns rows.  Once the total size of the
+    cached columns exceeds `max_bytes`, the least recently used columns are
+    evicted.
+
+    Parameters
+    ----------
+    max_bytes : `int`
+        Byte budget of the cache.  Columns larger than the whole budget
+        are never cached; a budget of 0 disables caching.
+    """
+
+    def __init__(self, max_bytes=DEFAULT_CACHE_SIZE):
+        self.max_bytes = max_bytes
+        self.nbytes = 0
+        self._data = OrderedDict()
+        self._sizes = {}
+        self._lock = threading.RLock()
+
+    def __contains__(self, key):
+        return key in self._data
+
+    def __len__(self):
+        return len(self._data)
+
+    def keys(self):
+        return list(self._data.keys())
+
+    def get(self, key, default=None):
+        with self._lock:
+            if key not in self._data:
+                return default
+            self._data.move_to_end(key)
+            return self._data[key]
+
+    def put(self, key, value):
+        size = nbytes(value)
+        with self._lock:
+            self.pop(key)
+            if size > self.max_bytes:
+                return
+            self._data[key] = value
+            self._sizes[key] = size
+            self.nbytes += size
+            self._evict()
+
+    def pop(self, key, default=None):
+        with self._lock:
+            if key not in self._data:
+                return default
+            self.nbytes -= self._sizes.pop(key)
+            return self._data.pop(key)
+
+    def missing(self, keys):
+        """Returns the subset of `keys` that are not cached
+        """
+        return [k for k in keys if k not in self._data]
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+            self._sizes.clear()
+            self.nbytes = 0
+
+    def _evict(self):
+        while self.nbytes > self.max_bytes and self._data:
+            key, _ = self._data.popitem(last=False)
+            self.nbytes -= self._sizes.pop(key)
+
+
+def metadata_fingerprint(dataset_metadata):
+    """Short hash of a kartothek `DatasetMetadata`; changes with any update of the dataset
+    """
+    data = dataset_metadata.to_json()
+    if isinstance(data, str):
+        data = data.encode("utf-8")
+    return hashlib.sha1(data).hexdigest()[:16]
+
+
+def metadata_version(path):
+    """Short hash of the names, sizes and modification times of the kartothek metadata files in `path`
+
+    Changes whenever a dataset of the repository is written or updated, and
+    is cheap enough to check on every request, as the files are not read.
+    """
+    entries = []
+    for metadata in sorted(Path(path).glob("*.by-dataset-metadata.*")):
+        try:
+            stat = metadata.stat()
+        except FileNotFoundError:
+            continue
+        entries.append((metadata.name, stat.st_size, stat.st_mtime_ns))
+    return hashlib.sha1(json.dumps(entries).encode("utf-8")).hexdigest()[:16]
+
+
+class ArrowDiskCache(object):
+    """On-disk cache of loaded tables as Arrow IPC files, read memory-mapped.
+
+    Files are stored as ``{directory}/{dataset}/{fingerprint}/{key}.arrow``,
+    where `dataset` is the `dataset_key` of the repository and dataset uuid,
+    the fingerprint identifies the version of the kartothek dataset metadata
+    (see `metadata_fingerprint`) and the key hashes the partition labels and
+    columns of the load.  Reads memory-map the file, so cached data lives in
+    the page cache rather than on the process heap.
+
+    Least recently used files (by modification time, which `get` updates)
+    are deleted once the total size exceeds `max_bytes`, and `invalidate`
+    removes the files of outdated dataset versions.  Files that cannot be
+    read (e.g. truncated) are deleted and treated as missing.
+
+    Parameters
+    ----------
+    directory : `str`
+        Cache directory, preferably on local disk.
+    max_bytes : `int`
+        Size cap of the cache directory.
+    """
+
+    suffix = ".arrow"
+
+    def __init__(self, directory, max_bytes=DEFAULT_DISK_CACHE_SIZE):
+        self.directory = str(directory)
+        self.max_bytes = max_bytes
+        self._lock = threading.RLock()
+        os.makedirs(self.directory, exist_ok=True)
+
+    @staticmethod
+    def dataset_key(repo, dataset_uuid):
+        """Directory of `dataset_uuid` of the repository at `repo`
+
+        Keyed by a hash of the resolved repository path, so that repositories
+        sharing a cache directory neither read nor invalidate each other's files.
+        """
+        repo = hashlib.sha1(str(Path(repo).resolve()).encode("utf-8")).hexdigest()[:16]
+        return os.path.join(repo, dataset_uuid)
+
+    @staticmethod
+    def key(partitions, columns, filters=None):
+        """Cache key of a load of `columns` from the partitions with labels `partitions`
+        """
+        data = json.dumps([sorted(str(p) for p in partitions), list(columns), repr(filters or [])])
+        return hashlib.sha1(data.encode("utf-8")).hexdigest()
+
+    def _path(self, dataset_uuid, fingerprint, key):
+        return os.path.join(self.directory, dataset_uuid, fingerprint, key + self.suffix)
+
+    def __contains__(self, item):
+        return os.path.exists(self._path(*item))
+
+    def get(self, dataset_uuid, fingerprint, key):
+        """Memory-mapped `pyarrow.Table` stored under `key`, or None
+        """
+        path = self._path(dataset_uuid, fingerprint, key)
+        if not os.path.exists(path):
+            return None
+        try:
+            table = pa.ipc.open_file(pa.memory_map(path, "r")).read_all()
+            table.validate()
+        except (pa.ArrowInvalid, OSError):
+            self._remove(path)
+            return None
+        try:
+            os.utime(path)
+        except OSError:
+            pass
+        return table
+
+    def put(self, dataset_uuid, fingerprint, key, table):
+        """Writes `table` under `key` (as a single record batch) and evicts old files
+        """
+        path = self._path(dataset_uuid, fingerprint, key)
+        if table.nbytes > self.max_bytes:
+            return
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp = f"{path}.{uuid.uuid4().hex}.tmp"
+        table = table.combine_chunks()
+        with pa.OSFile(tmp, "wb") as sink:
+            with pa.ipc.new_file(sink, table.schema) as writer:
+                writer.write_table(table, max_chunksize=max(table.num_rows, 1))
+        os.replace(tmp, path)
+        self._evict()
+
+    def _files(self):
+        files = []
+        for root, _, names in os.walk(self.directory):
+            for name in names:
+                if name.endswith(self.suffix):
+                    path = os.path.join(root, name)
+                    try:
+                        stat = os.stat(path)
+                    except FileNotFoundError:
+                        continue
+                    files.append((stat.st_mtime, stat.st_size, path))
+        return sorted(files)
+
+    @property
+    def nbytes(self):
+        return sum(size for _, size, _ in self._files())
+
+    def _evict(self):
+        with self._lock:
+            files = self._files()
+            total = sum(size for _, size, _ in files)
+            for _, size, path in files:
+                if total <= self.max_bytes:
+                    break
+                self._remove(path)
+                total -= size
+
+    @staticmethod
+    def _remove(path):
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+
+    def invalidate(self, dataset_uuid, fingerprint):
+        """Removes the cached files of `dataset_uuid` for any other metadata version
+        """
+        root = os.path.join(self.directory, dataset_uuid)
+        if not os.path.isdir(root):
+            return
+        for name in os.listdir(root):
+            if name != fingerprint:
+                shutil.rmtree(os.path.join(root, name), ignore_errors=True)
+
+    def clear(self):
+        shutil.rmtree(self.directory, ignore_errors=True)
+        os.makedirs(self.directory, exist_ok=True)
@@ -19,6 +19,9 @@ DASK_ALLOWED_PORTS = (29000, 30000)
 DASK_DASHBOARD_ALLOWED_PORTS = (20000, 20500)
 DASHBOARD_ALLOWED_PORTS = (20500, 21000)
 
+# datasets that can be selected with `repartition --only`
+REPARTITION_DATASETS = ("coadd_forced", "coadd_unforced", "visits")
+
 
 def find_available_ports(n, start, stop):
     count = 0
@@ -98,7 +101,28 @@ def launch_dask_cluster(queue, nodes, localcluster):
     is_flag=True,
     help="Launches a localcluster instead of slurmcluster, default on local machine",
 )
-def start_dashboard(queue, nodes, localcluster):
+@click.option(
+    "--cache_dir",
+    default=None,
+    help="local directory for a memory-mapped cache of loaded data, kept across sessions",
+)
+@click.option("--cache_gb", default=50.0, help="size cap of the --cache_dir cache in GB (default=50)")
+@click.option(
+    "--progressive",
+    is_flag=True,
+    help="draw plots from the coadd sample first and refine them while the full selection loads",
+)
+@click.option(
+    "--distributed",
+    is_flag=True,
+    help="keep the selected data on the dask workers and compute the plots there",
+)
+@click.option(
+    "--data_server",
+    default=None,
+    help="host:port of an lsst_data_server to read coadd data through, instead of reading it here",
+)
+def start_dashboard(queue, nodes, localcluster, cache_dir, cache_gb, progressive, distributed, data_server):
     """
         Launches lsst_data_explorer with a Dask Cluster.
     """
@@ -109,9 +133,20 @@ def start_dashboard(queue, nodes, localcluster):
     client.wait_for_workers(1)
     print(f"### starting lsst data explorer at http://localhost:{lsst_dashboard_port} ###")
 
-    from lsst_dashboard.gui import dashboard
+    import panel as pn
+
+    from lsst_dashboard import gui
+    from lsst_dashboard.gui import create_dashboard
 
-    dashboard.render().show(port=lsst_dashboard_port)
+    if cache_dir is not None:
+        gui.dataset_kwargs.update(cache_dir=cache_dir, disk_cache_size=int(cache_gb * 1024 ** 3))
+    if data_server is not None:
+        gui.dataset_kwargs.update(server=data_server)
+    gui.progressive = progressive
+    gui.distributed = distributed
+
+    # one dashboard per browser session, sharing the loaded data
+    pn.serve(lambda: create_dashboard().render(), port=lsst_dashboard_port)
 
 
 @click.command()
@@ -119,8 +154,41 @@ def start_dashboard(queue, nodes, localcluster):
 @click.argument("destination_path", required=False)
 @click.option("--sample_frac", default=None, type=float, help="sample dataset by fraction [0-1]")
 @click.option("--num_buckets", default=8, help="number of buckets per partition")
+@click.option("--n_threads", default=16, help="number of threads used to resolve Butler filenames")
+@click.option(
+    "--chunk_gb",
+    default=4.0,
+    help="maximum uncompressed input size per repartitioning chunk in GB, except for single larger files "
+    "(default=4)",
+)
 @click.option("--chunk_by_filter", default=False)
 @click.option("--chunk_dfs", default=False)
+@click.option(
+    "--recompute_stats",
+    is_flag=True,
+    help="Recompute summary stats for all dataIds instead of only new or changed partitions",
+)
+@click.option(
+    "--compact",
+    is_flag=True,
+    help="Write float32 metrics, bit-packed flags and integer patch ids (use a new destination)",
+)
+@click.option(
+    "--layout",
+    default=None,
+    help="Parquet layout of the partition files: a preset (e.g. zstd-64mb) or "
+    "'codec=zstd,level=3,row_group_mb=64,page_kb=1024,dictionary=patch+filter'",
+)
+@click.option(
+    "--resume",
+    is_flag=True,
+    help="Skip chunks already committed by a previous (interrupted) run, as recorded in the journal",
+)
+@click.option(
+    "--only",
+    default=None,
+    help="comma separated subset of coadd_forced,coadd_unforced,visits to repartition (default=all)",
+)
 @click.option(
     "--queue", default="debug", help="Slurm Queue to use (default=debug), ignored on local machine"
 )
@@ -137,13 +205,33 @@ def repartition(
     destination_path,
     sample_frac,
     num_buckets,
+    n_threads,
+    chunk_gb,
     chunk_by_filter,
     chunk_dfs,
+    recompute_stats,
+    compact,
+    layout,
+    resume,
+    only,
     queue,
     nodes,
     localcluster,
 ):
     """Repartitions a Butler Dataset for use with LSST Data Explorer using a Dask cluster"""
+    selected = [name.strip() for name in only.split(",")] if only else list(REPARTITION_DATASETS)
+    unknown = set(selected) - set(REPARTITION_DATASETS)
+    if unknown:
+        raise click.BadParameter(f"unknown datasets {sorted(unknown)}, choose from {REPARTITION_DATASETS}")
+
+    if layout is not None:
+        from lsst_dashboard.layout import StorageLayout
+
+        try:
+            layout = StorageLayout.parse(layout)
+        except ValueError as e:
+            raise click.BadParameter(str(e), param_hint="--layout")
+
     cluster, _ = launch_dask_cluster(queue, nodes, localcluster)
     client = Client(cluster)
     print(f"Dask Cluster: {cluster}")
@@ -151,34 +239,72 @@ def repartition(
     client.wait_for_workers(1)
 
     print(f"### repartitioning data from {butler_path}")
+    from lsst_dashboard.journal import RepartitionJournal
     from lsst_dashboard.partition import CoaddForcedPartitioner, CoaddUnforcedPartitioner, VisitPartitioner
 
+    partitioners = {
+        "coadd_forced": (CoaddForcedPartitioner, "coadd forced data"),
+        "coadd_unforced": (CoaddUnforcedPartitioner, "coadd unforced data"),
+        "visits": (VisitPartitioner, "visit data"),
+    }
+
     if destination_path is None:
         destination_path = f"{butler_path}/ktk"
 
+    partitioner_kws = dict(
+        sample_frac=sample_frac,
+        num_buckets=num_buckets,
+        n_threads=n_threads,
+        chunk_bytes=int(chunk_gb * 1024 ** 3),
+        compact=compact,
+        layout=layout,
+    )
     partition_kws = dict(chunk_by_filter=chunk_by_filter, chunk_dfs=chunk_dfs)
+    stats_kws = dict(incremental=not recompute_stats)
 
+    journal = RepartitionJournal(f"{destination_path}/repartition_journal.jsonl")
     print(f"...partitioned data will be written to {destination_path}")
+    if resume:
+        print(f"...resuming from {journal.path}")
 
-    print("...partitioning coadd forced data")
-    coadd_forced = CoaddForcedPartitioner(
-        butler_path, destination_path, sample_frac=sample_frac, num_buckets=num_buckets
-    )
-    coadd_forced.partition(**partition_kws)
-    coadd_forced.write_stats()
+    for name in selected:
+        cls, desc = partitioners[name]
+        partitioner = cls(butler_path, destination_path, **partitioner_kws)
+        if not resume:
+            journal.reset(partitioner.dataset)
+        elif set(partitioner.post_steps) <= journal.steps_done(partitioner.dataset):
+            print(f"...{desc} already complete, skipping")
+            continue
 
-    print("...partitioning coadd unforced data")
-    coadd_unforced = CoaddUnforcedPartitioner(
-        butler_path, destination_path, sample_frac=sample_frac, num_buckets=num_buckets
-    )
-    coadd_unforced.partition(**partition_kws)
-    coadd_unforced.write_stats()
-
-    print("...partitioning visit data")
-    visits = VisitPartitioner(
-        butler_path, destination_path, sample_frac=sample_frac, num_buckets=num_buckets
-    )
-    visits.partition(**partition_kws)
-    visits.write_stats()
+        print(f"...partitioning {desc}")
+        partitioner.partition(journal=journal, **partition_kws)
+        done = journal.steps_done(partitioner.dataset)
+        for step in partitioner.post_steps:
+            if step in done:
+                print(f"...{step} of {desc} already written, skipping")
+                continue
+            getattr(partitioner, f"write_{step}")(**(stats_kws if step == "stats" else {}))
+            journal.record_step(partitioner.dataset, step)
 
     print("...partitioning complete")
+
+
+@click.command()
+@click.option("--host", default="127.0.0.1", help="address to listen on (default=127.0.0.1)")
+@click.option("--port", default=52100, help="port to listen on (default=52100)")
+@click.option(
+    "--cache_dir",
+    default=None,
+    help="local directory for a memory-mapped cache of loaded data, kept across sessions",
+)
+@click.option("--cache_gb", default=50.0, help="size cap of the --cache_dir cache in GB (default=50)")
+def data_server(host, port, cache_dir, cache_gb):
+    """
+        Serves coadd data to dashboards started with --data_server.
+    """
+    from lsst_dashboard.server import DataServer
+
+    dataset_kwargs = {}
+    if cache_dir is not None:
+        dataset_kwargs.update(cache_dir=cache_dir, disk_cache_size=int(cache_gb * 1024 ** 3))
+    DataServer(host=host, port=port, dataset_kwargs=dataset_kwargs).serve_forever()
@@ -0,0 +1,190 @@
+"""Compact storage profile of the partitioned tables.
+
+With ``compact=True`` the partitioners write
+
+- metric columns as float32 where the round trip stays within tolerance,
+- the flag columns packed into a single uint64 ``flags`` bitmask,
+- ``patch`` (``"x,y"``) as the int16 ``100 * x + y``.
+
+The choices are made once, on a sample of the first chunk, and saved as
+``{dataset}_compact.yaml`` next to the dataset so that every chunk (and
+resumed runs) use the same schema.  `CompactSchema` uses the same file to
+translate between the logical columns the dashboard asks for and the
+stored ones.
+"""
+import numpy as np
+import pandas as pd
+import yaml
+
+
+FLAGS_COLUMN = "flags"
+PATCH_COLUMN = "patch"
+PATCH_BASE = 100
+
+
+def encode_patch(patch):
+    """int16 ``100 * x + y`` of ``"x,y"`` patch names (-1 where missing)
+    """
+    codes, names = pd.factorize(pd.Series(patch))
+    values = []
+    for name in names:
+        x, y = str(name).split(",")
+        values.append(int(x) * PATCH_BASE + int(y))
+    values = np.append(np.asarray(values, dtype="int16"), np.int16(-1))
+    return values[codes]
+
+
+def decode_patch(values):
+    """Categorical of ``"x,y"`` patch names from `encode_patch` values
+    """
+    values = np.asarray(values)
+    codes, uniques = pd.factorize(np.where(values < 0, np.nan, values), sort=True)
+    names = [f"{int(v) // PATCH_BASE},{int(v) % PATCH_BASE}" for v in uniques]
+    return pd.Categorical.from_codes(codes, categories=names)
+
+
+def pack_flags(df, flag_bits):
+    """uint64 bitmask of the boolean columns of `df` named in `flag_bits`
+    """
+    bits = np.zeros(len(df), dtype="uint64")
+    for name, bit in flag_bits.items():
+        if name in df.columns:
+            values = df[name].to_numpy(dtype=bool, na_value=False)
+            bits |= values.astype("uint64") << np.uint64(bit)
+    return bits
+
+
+def unpack_flag(bits, bit):
+    return ((np.asarray(bits, dtype="uint64") >> np.uint64(bit)) & np.uint64(1)).astype(bool)
+
+
+def float32_safe(values, rtol=1e-6, atol=0.0):
+    """Whether `values` survive a float32 round trip within ``max(atol, rtol * |value|)``
+
+    Non-finite values are ignored; finite values that overflow fail.
+    """
+    values = np.asarray(values, dtype="float64")
+    values = values[np.isfinite(values)]
+    with np.errstate(over="ignore"):
+        rounded = values.astype("float32").astype("float64")
+    if not np.isfinite(rounded).all():
+        return False
+    return bool((np.abs(rounded - values) <= np.maximum(atol, rtol * np.abs(values))).all())
+
+
+class CompactSchema(object):
+    """Column encodings of a dataset written with the compact profile
+
+    Parameters
+    ----------
+    float32_columns : `list`
+        Columns stored as float32.
+    flag_bits : `dict`
+        Bit of each flag in the ``flags`` column.
+    patch : `bool`
+        Whether ``patch`` is stored with `encode_patch`.
+    """
+
+    def __init__(self, float32_columns=(), flag_bits=None, patch=True):
+        self.float32_columns = list(float32_columns)
+        self.flag_bits = dict(flag_bits or {})
+        self.patch = patch
+
+    @classmethod
+    def from_sample(cls, sample, metrics, flags, rtol=1e-6, tolerances=None):
+        """Chooses the encodings from a sample of the data
+
+        A float64 metric is stored as float32 if `float32_safe` holds for
+        the sample with its absolute tolerance in `tolerances` (default 0).
+        """
+        tolerances = tolerances or {}
+        float32_columns = [
+            c
+            for c in metrics
+            if c in sample.columns
+            and sample[c].dtype == np.float64
+            and float32_safe(sample[c].to_numpy(), rtol=rtol, atol=tolerances.get(c, 0.0))
+        ]
+        flags = [f for f in flags if f in sample.columns]
+        if len(flags) > 64:
+            raise ValueError(f"Cannot pack {len(flags)} flags into a uint64 column.")
+        return cls(
+            float32_columns=float32_columns,
+            flag_bits={f: i for i, f in enumerate(flags)},
+            patch=PATCH_COLUMN in sample.columns,
+        )
+
+    @classmethod
+    def read(cls, path):
+        with open(path) as f:
+            d = yaml.safe_load(f)
+        return cls(float32_columns=d["float32"], flag_bits=d["flag_bits"], patch=d["patch"])
+
+    def write(self, path):
+        with open(path, "w") as f:
+            yaml.safe_dump(dict(float32=self.float32_columns, flag_bits=self.flag_bits, patch=self.patch), f)
+
+    @property
+    def flags(self):
+        return sorted(self.flag_bits, key=self.flag_bits.get)
+
+    def compact(self, df):
+        """Stored form of a (pandas) frame with the logical columns
+        """
+        df = df.assign(**{c: df[c].astype("float32") for c in self.float32_columns if c in df.columns})
+        if self.flag_bits:
+            flags = [f for f in self.flags if f in df.columns]
+            df = df.assign(**{FLAGS_COLUMN: pack_flags(df, self.flag_bits)}).drop(columns=flags)
+        if self.patch and PATCH_COLUMN in df.columns:
+            df = df.assign(**{PATCH_COLUMN: encode_patch(df[PATCH_COLUMN])})
+        return df
+
+    def physical_columns(self, columns):
+        """Stored columns needed to provide the logical `columns`
+        """
+        physical = [FLAGS_COLUMN if c in self.flag_bits else c for c in columns]
+        return list(dict.fromkeys(physical))
+
+    def expand(self, df, columns=None):
+        """Logical form of a frame read from the stored columns
+
+        The ``flags`` column is unpacked into the flags in `columns` (all
+        flags by default) and ``patch`` is decoded to a categorical.
+        """
+        if FLAGS_COLUMN in df.columns:
+            flags = [f for f in self.flags if columns is None or f in columns]
+            bits = df[FLAGS_COLUMN].to_numpy()
+            unpacked = {f: unpack_flag(bits, self.flag_bits[f]) for f in flags}
+            df = df.drop(columns=FLAGS_COLUMN).assign(**unpacked)
+        if self.patch and PATCH_COLUMN in df.columns and df[PATCH_COLUMN].dtype.kind in "iu":
+            df = df.assign(**{PATCH_COLUMN: decode_patch(df[PATCH_COLUMN].to_numpy())})
+        return df
+
+    def dtypes(self, physical_dtypes):
+        """Logical dtypes from the dtypes of the stored columns
+        """
+        dtypes = physical_dtypes.drop(FLAGS_COLUMN, errors="ignore")
+        logical = {f: np.dtype(bool) for f in self.flags}
+        if self.patch and PATCH_COLUMN in dtypes.index:
+            logical[PATCH_COLUMN] = pd.CategoricalDtype()
+        return pd.concat([dtypes.drop(list(logical), errors="ignore"), pd.Series(logical, dtype=object)])
+
+    def split_predicates(self, predicates):
+        """Splits logical predicates into ones on the stored columns and ones to apply after `expand`
+
+        Predicates on flags are applied after unpacking; patch names are
+        encoded so that they can still be pushed down.
+        """
+        pushed, post = [], []
+        for col, op, value in predicates:
+            if col in self.flag_bits:
+                post.append((col, op, value))
+            elif self.patch and col == PATCH_COLUMN and op in ("==", "!=", "in"):
+                values = value if op == "in" else [value]
+                encoded = [int(v) for v in encode_patch([str(v) for v in values])]
+                pushed.append((col, op, encoded if op == "in" else encoded[0]))
+            elif self.patch and col == PATCH_COLUMN:
+                post.append((col, op, value))
+            else:
+                pushed.append((col, op, value))
+        return pushed, post
@@ -1,4 +1,5 @@
 import yaml
+from concurrent.futures import ThreadPoolExecutor
 from functools import partial
 from pathlib import Path
 
@@ -7,9 +8,33 @@ import os
 
 import numpy as np
 import pandas as pd
+import pyarrow as pa
 
 from kartothek.io.dask.dataframe import read_dataset_as_ddf
-from storefact import get_store_from_url
+
+from .aggregates import HistogramCube, SkyPyramid
+from .compact import CompactSchema
+from .cache import (
+    ArrowDiskCache,
+    ColumnCache,
+    DEFAULT_CACHE_SIZE,
+    DEFAULT_DISK_CACHE_SIZE,
+    metadata_fingerprint,
+)
+from .progressive import PersistedLoad, ProgressiveLoad
+from .query import apply_predicates, query_columns, split_query
+from .server import DataClient
+from .stats import SummaryStats
+from .storage import (
+    arrow_to_pandas,
+    get_store,
+    load_dataset_metadata,
+    partition_frame,
+    read_arrow_partitions,
+    read_row_groups,
+    read_schema,
+    schema_dtypes,
+)
 
 
 METADATA_FILENAME = "dashboard_metadata.yaml"
@@ -21,9 +46,52 @@ class Dataset:
         d = Dataset(path)
         d.connect()
         d.init_data()
+
+    Columns loaded by `get_coadd_ddf_by_filter_metric` are kept in a
+    per-(filter, tract, column) LRU cache bounded by `cache_size` bytes,
+    so only columns that were not loaded before are read again.
+
+    `connect` only reads the kartothek dataset metadata to learn the coadd
+    schema and partitions; the full dask graph of the coadd table is built
+    by `fetch_coadd_table` when something actually needs it.
+
+    With `masked` (the default), loaded tables keep NaN values in each
+    column, so a sparse metric does not shrink the sample of the others;
+    only rows without valid ra/dec are dropped.  Plot aggregations and
+    summary statistics then use the valid values of each column.  Set
+    ``masked=False`` to drop every row with a NaN in any loaded column.
+
+    `region_query` reads only the objects inside a sky region (see
+    `lsst_dashboard.spatial`), using the coverage table written by the
+    partitioners to skip partition files and row groups outside of it.
+    The dashboard loads zoomed-in sky views this way (`region_load`).
+
+    With ``load_mode="arrow"``, coadd columns are read directly with
+    pyarrow (multithreaded decode, pre-buffered files) into a single Arrow
+    table that is converted to pandas once, instead of through a kartothek
+    dask graph whose partitions are each converted and then concatenated.
+
+    With a `cache_dir` (on local disk), coadd reads are also written to an
+    `ArrowDiskCache` of at most `disk_cache_size` bytes and memory-mapped on
+    later loads of the same selection, also across sessions.  Entries are
+    dropped when the kartothek dataset metadata changes.
+
+    With a `server` address (see `lsst_dashboard.server`), the coadd
+    columns are read by that data server, which holds the caches shared by
+    all its clients, instead of by this process.
     """
 
-    def __init__(self, path, coadd_version="unforced"):
+    def __init__(
+        self,
+        path,
+        coadd_version="unforced",
+        cache_size=DEFAULT_CACHE_SIZE,
+        masked=True,
+        load_mode="dask",
+        cache_dir=None,
+        disk_cache_size=DEFAULT_DISK_CACHE_SIZE,
+        server=None,
+    ):
         self.path = Path(path)
         self.coadd = {}
         self.visits = None
@@ -34,7 +102,23 @@ class Dataset:
         self.filters = []
         self.tracts = []
         self.stats = {}
+        self.summary_stats = None
+        self.schema = None
+        self.partitions = None
         self.coadd_version = coadd_version
+        self.masked = masked
+        self.cache = ColumnCache(max_bytes=cache_size)
+        self.load_mode = load_mode
+        self.disk_cache = None if cache_dir is None else ArrowDiskCache(cache_dir, max_bytes=disk_cache_size)
+        self.client = None if server is None else DataClient(server)
+        self._fingerprints = {}
+        self._spatial_index = {}
+        self._dtypes = {}
+        self._partitions = {}
+        self._pyramids = {}
+        self._cubes = {}
+        self._compact = {}
+        self._schema_dtypes = {}
 
     def connect(self):
         print("-- read coadd/visits summary stats tables and generate metadata")
@@ -44,8 +128,8 @@ class Dataset:
         self.filters = list(self.stats[f"coadd_{coadd_version}"].index.unique(level=0))
         self.tracts = list(self.stats[f"coadd_{coadd_version}"].index.unique(level=1))
 
-        print(f"-- read {coadd_version} coadd table --")
-        self.fetch_coadd_table(coadd_version=coadd_version)
+        print(f"-- read {coadd_version} coadd table schema --")
+        self.fetch_coadd_schema(coadd_version=coadd_version)
 
         print("-- generate other metadata fields --")
         self.post_process_metadata()
@@ -53,8 +137,16 @@ class Dataset:
         print("-- done with reads --")
 
     def get_coadd_ddf_by_filter_metric(
-        self, filter_name, metrics, tracts, coadd_version="unforced", warnings=[]
+        self, filter_name, metrics, tracts, coadd_version="unforced", warnings=[], query=None
     ):
+        """Coadd table of `filter_name` for `tracts` with the `metrics` columns
+
+        If `query` (a `pandas.DataFrame.query` expression) is given, only
+        the matching rows are returned.  Unless all columns are already
+        cached, its simple conjunctive clauses are applied by kartothek at
+        read time (see `lsst_dashboard.query.split_query`) and only the rest
+        is evaluated in memory.
+        """
 
         for t in tracts:
             if t not in self.tracts:
@@ -71,30 +163,445 @@ class Dataset:
             valid_tracts = self.tracts
             warnings.append(msg)
 
-        predicates = [[("tract", "in", valid_tracts), ("filter", "==", filter_name)]]
-
-        dataset = "analysisCoaddTable_{}".format(coadd_version)
-
         columns = metrics + self.flags + ["ra", "dec", "filter", "psfMag", "patch"]
+        columns = list(dict.fromkeys(columns))
 
-        store = partial(get_store_from_url, "hfs://" + str(self.path))
-
-        karto_kwargs = dict(
-            predicates=predicates, dataset_uuid=dataset, columns=columns, store=store, table="table"
-        )
+        dtypes = self._get_dtypes(coadd_version)
+        read_columns = list(dict.fromkeys(columns + [c for c in query_columns(query) if c in dtypes]))
 
         print(f"...loading dataset ({filter_name}, {metrics})...")
-        coadd_df = (
-            read_dataset_as_ddf(**karto_kwargs).dropna(how="any")
-            # .set_index('filter')
-            .compute()
+        predicates, remainder = split_query(query, dtypes) if query else ([], None)
+        coadd_df = self.read_coadd_columns(
+            filter_name, valid_tracts, read_columns, predicates, coadd_version=coadd_version
         )
+        if remainder:
+            coadd_df = coadd_df.query(remainder)
+        if list(coadd_df.columns) != columns:
+            coadd_df = coadd_df[columns]
+        coadd_df = self._drop_invalid(coadd_df)
         print("loaded.")
 
         # coadd_df = dd.from_pandas(coadd_df, chunksize=100000)
 
         return coadd_df
 
+    def read_coadd_columns(self, filter_name, tracts, columns, predicates=(), coadd_version=None):
+        """`columns` of the coadd rows of `filter_name` in `tracts` matching `predicates`
+
+        If all columns are cached the predicates are applied in memory,
+        otherwise they are pushed down to the read and the cache is
+        bypassed.  In client mode the data server does the read.
+        """
+        coadd_version = coadd_version or self.coadd_version
+        if self.client is not None:
+            return self.client.read(self.path, coadd_version, filter_name, tracts, columns, predicates)
+
+        dataset = "analysisCoaddTable_{}".format(coadd_version)
+        if predicates and not self._is_cached(dataset, filter_name, tracts, columns):
+            print(f"...pushing down predicates {predicates}")
+            return self._read_coadd(dataset, filter_name, tracts, columns, predicates)
+        df = self._load_coadd_columns(dataset, filter_name, tracts, columns)
+        if predicates:
+            df = apply_predicates(df, predicates).reset_index(drop=True)
+        return df
+
+    def get_coadd_sample(self, filter_name, metrics, tracts, coadd_version=None, query=None):
+        """Deterministic sample of `get_coadd_ddf_by_filter_metric`, or None if no sample was written
+
+        The sample (see `lsst_dashboard.progressive`) is a single small file,
+        so this returns in about a second even for many tracts.
+        """
+        coadd_version = coadd_version or self.coadd_version
+        dataset = "analysisCoaddTable_{}".format(coadd_version)
+        path = self.path.joinpath(f"{dataset}_sample.parq")
+        if not path.exists():
+            return None
+
+        columns = list(dict.fromkeys(metrics + self.flags + ["ra", "dec", "filter", "psfMag", "patch"]))
+        dtypes = self._get_dtypes(coadd_version)
+        read_columns = list(dict.fromkeys(columns + [c for c in query_columns(query) if c in dtypes]))
+        predicates, remainder = split_query(query, dtypes) if query else ([], None)
+        predicates = [("filter", "==", filter_name), ("tract", "in", list(tracts)), *predicates]
+
+        compact = self.get_compact_schema(dataset)
+        post = []
+        if compact is not None:
+            predicates, post = compact.split_predicates(predicates)
+            read_columns = list(dict.fromkeys(read_columns + [p[0] for p in post]))
+        stored_columns = read_columns if compact is None else compact.physical_columns(read_columns)
+
+        df = pd.read_parquet(path, columns=stored_columns, filters=predicates)
+        if compact is not None:
+            df = apply_predicates(compact.expand(df, read_columns), post)
+        if remainder:
+            df = df.query(remainder)
+        return self._drop_invalid(df[columns].reset_index(drop=True))
+
+    def empty_coadd_frame(self, metrics, coadd_version=None):
+        """Frame without rows with the columns and dtypes of `get_coadd_ddf_by_filter_metric`
+
+        Used to draw the plots from the precomputed aggregates before any
+        object is loaded.
+        """
+        coadd_version = coadd_version or self.coadd_version
+        columns = list(dict.fromkeys(metrics + self.flags + ["ra", "dec", "filter", "psfMag", "patch"]))
+        dtypes = self._get_dtypes(coadd_version)
+        return pd.DataFrame({c: pd.Series(dtype=dtypes.get(c, "float64")) for c in columns})
+
+    def progressive_load(
+        self, filter_name, metrics, tracts, coadd_version=None, query=None, min_interval=1.0
+    ):
+        """Starts loading `get_coadd_ddf_by_filter_metric` one tract at a time
+
+        Returns the started `lsst_dashboard.progressive.ProgressiveLoad`;
+        its `poll` gives the rows of the tracts loaded so far.
+        """
+        coadd_version = coadd_version or self.coadd_version
+        tracts = [t for t in tracts if t in self.tracts] or self.tracts
+
+        def load(tract):
+            return self.get_coadd_ddf_by_filter_metric(
+                filter_name, metrics, [tract], coadd_version=coadd_version, warnings=[], query=query
+            )
+
+        empty = self.empty_coadd_frame(metrics, coadd_version)
+        return ProgressiveLoad(load, tracts, min_interval=min_interval, empty=empty).start()
+
+    def get_coadd_dask(self, filter_name, metrics, tracts, coadd_version=None, query=None):
+        """Lazy dask dataframe of `get_coadd_ddf_by_filter_metric`
+
+        The simple clauses of `query` are pushed down to kartothek and the
+        rest is applied per partition; nothing is read or cached until the
+        dataframe is computed or persisted.
+        """
+        coadd_version = coadd_version or self.coadd_version
+        dataset = "analysisCoaddTable_{}".format(coadd_version)
+        tracts = [t for t in tracts if t in self.tracts] or self.tracts
+
+        columns = list(dict.fromkeys(metrics + self.flags + ["ra", "dec", "filter", "psfMag", "patch"]))
+        dtypes = self._get_dtypes(coadd_version)
+        read_columns = list(dict.fromkeys(columns + [c for c in query_columns(query) if c in dtypes]))
+        predicates, remainder = split_query(query, dtypes) if query else ([], None)
+        predicates = [("tract", "in", list(tracts)), ("filter", "==", filter_name), *predicates]
+
+        compact = self.get_compact_schema(dataset)
+        post = []
+        if compact is not None:
+            predicates, post = compact.split_predicates(predicates)
+            read_columns = list(dict.fromkeys(read_columns + [p[0] for p in post]))
+        stored_columns = read_columns if compact is None else compact.physical_columns(read_columns)
+
+        store = get_store(self.path)
+        ddf = read_dataset_as_ddf(
+            predicates=[predicates], dataset_uuid=dataset, columns=stored_columns, store=store, table="table",
+        )
+        if compact is not None:
+            ddf = ddf.map_partitions(compact.expand, read_columns)
+        if post:
+            ddf = ddf.map_partitions(apply_predicates, post)
+        if remainder:
+            ddf = ddf.query(remainder)
+        return ddf[columns].map_partitions(self._drop_invalid)
+
+    def persisted_load(self, filter_name, metrics, tracts, coadd_version=None, query=None):
+        """Starts persisting `get_coadd_dask` on the dask workers
+
+        Returns the started `lsst_dashboard.progressive.PersistedLoad`; its
+        `poll` gives the persisted dataframe once all partitions are loaded.
+        """
+        ddf = self.get_coadd_dask(filter_name, metrics, tracts, coadd_version=coadd_version, query=query)
+        return PersistedLoad(ddf).start()
+
+    def region_query(
+        self, region, filter_name, columns=None, tracts=None, coadd_version=None, max_workers=None
+    ):
+        """Coadd objects of `filter_name` inside `region`
+
+        Parameters
+        ----------
+        region : `lsst_dashboard.spatial.Region`
+            e.g. ``Cone(ra, dec, radius)``, ``Box(ra_min, ra_max, dec_min, dec_max)``
+            or ``Polygon(ras, decs)``, in degrees.
+        columns : `list`, optional
+            Columns to load (default: metrics, flags, ra, dec, psfMag and patch).
+        tracts : `list`, optional
+            Restrict the query to these tracts.
+
+        Returns
+        -------
+        df : `pandas.DataFrame`
+        """
+        coadd_version = coadd_version or self.coadd_version
+        dataset = "analysisCoaddTable_{}".format(coadd_version)
+        if columns is None:
+            columns = list(self.metrics) + self.flags + ["ra", "dec", "filter", "psfMag", "patch"]
+        columns = list(dict.fromkeys(list(columns) + ["ra", "dec"]))
+
+        index = self.get_spatial_index(dataset)
+        index = index[index["filter"] == filter_name]
+        if tracts:
+            index = index[index["tract"].isin(tracts)]
+        overlaps = region.overlaps_box(index["ra_min"], index["ra_max"], index["dec_min"], index["dec_max"])
+        index = index[overlaps]
+
+        store = get_store(self.path)
+        reads = [
+            (key, sorted(df["row_group"].unique()), df["filter"].iloc[0], df["tract"].iloc[0])
+            for key, df in index.groupby("file", sort=True)
+        ]
+
+        compact = self.get_compact_schema(dataset)
+        read_columns = columns if compact is None else compact.physical_columns(columns)
+
+        def read(args):
+            key, row_groups, filt, tract = args
+            df = read_row_groups(key, store, row_groups, columns=read_columns)
+            if compact is not None:
+                df = compact.expand(df, columns)
+            df = df[region.contains(df["ra"].to_numpy(), df["dec"].to_numpy())]
+            return df.assign(**{k: v for k, v in [("filter", filt), ("tract", tract)] if k in columns})
+
+        print(f"...reading {sum(len(r[1]) for r in reads)} row group(s) of {len(reads)} partition file(s)...")
+        with ThreadPoolExecutor(max_workers=max_workers) as pool:
+            frames = list(pool.map(read, reads))
+
+        if not frames:
+            return pd.DataFrame(columns=columns)
+        return self._drop_invalid(pd.concat(frames, ignore_index=True)[columns])
+
+    def region_load(self, region, filter_name, metrics, tracts, coadd_version=None):
+        """Starts `region_query` of the columns of `get_coadd_ddf_by_filter_metric` in the background
+
+        Returns the started `lsst_dashboard.progressive.ProgressiveLoad` of
+        the single region; raises `IOError` right away if the dataset has no
+        coverage table.
+        """
+        coadd_version = coadd_version or self.coadd_version
+        self.get_spatial_index("analysisCoaddTable_{}".format(coadd_version))
+        columns = list(dict.fromkeys(metrics + self.flags + ["ra", "dec", "filter", "psfMag", "patch"]))
+        load = partial(
+            self.region_query,
+            filter_name=filter_name,
+            columns=columns,
+            tracts=[t for t in tracts if t in self.tracts],
+            coadd_version=coadd_version,
+        )
+        empty = self.empty_coadd_frame(metrics, coadd_version)
+        return ProgressiveLoad(load, [region], min_interval=float("inf"), empty=empty).start()
+
+    def get_spatial_index(self, dataset):
+        """Coverage table of a dataset joined with the partition keys of its files
+        """
+        if dataset not in self._spatial_index:
+            path = self.path.joinpath(f"{dataset}_coverage.parq")
+            if not path.exists():
+                raise IOError(f"No coverage table for {dataset}; run the partitioner's write_coverage().")
+            coverage = pd.read_parquet(path)
+            partitions = self.get_partitions(dataset)
+            self._spatial_index[dataset] = coverage.merge(partitions, on="file", how="inner")
+        return self._spatial_index[dataset]
+
+    def get_sky_pyramid(self, filter_name, tracts=None, coadd_version=None):
+        """`SkyPyramid` of one filter of the coadd table over `tracts`, or None if it was not written
+        """
+        coadd_version = coadd_version or self.coadd_version
+        dataset = "analysisCoaddTable_{}".format(coadd_version)
+        if dataset not in self._pyramids:
+            path = self.path.joinpath(f"{dataset}_pyramid.parq")
+            self._pyramids[dataset] = SkyPyramid.read(path) if path.exists() else None
+        pyramid = self._pyramids[dataset]
+        return None if pyramid is None else pyramid.select(filter_name, tracts)
+
+    def get_histogram_cube(self, filter_name, tracts=None, coadd_version=None):
+        """`HistogramCube` of one filter of the coadd table over `tracts`, or None if it was not written
+        """
+        coadd_version = coadd_version or self.coadd_version
+        dataset = "analysisCoaddTable_{}".format(coadd_version)
+        path = self.path.joinpath(f"{dataset}_cube.parq")
+        if not path.exists():
+            return None
+        if (dataset, filter_name) not in self._cubes:
+            self._cubes[(dataset, filter_name)] = HistogramCube.read(path, filters=[filter_name])
+        return self._cubes[(dataset, filter_name)].select(filter_name, tracts)
+
+    def get_compact_schema(self, dataset):
+        """`CompactSchema` of a dataset written with the compact profile, or None
+        """
+        if dataset not in self._compact:
+            path = self.path.joinpath(f"{dataset}_compact.yaml")
+            self._compact[dataset] = CompactSchema.read(path) if path.exists() else None
+        return self._compact[dataset]
+
+    def get_partitions(self, dataset):
+        """`partition_frame` of a coadd dataset
+        """
+        if dataset == "analysisCoaddTable_{}".format(self.coadd_version) and self.partitions is not None:
+            return self.partitions
+        if dataset not in self._partitions:
+            store = get_store(self.path)
+            dm = self._load_metadata(dataset)
+            self._partitions[dataset] = partition_frame(
+                dm, schema=read_schema(dataset, store, dataset_metadata=dm)
+            )
+        return self._partitions[dataset]
+
+    def _load_metadata(self, dataset):
+        """Loads the kartothek metadata of `dataset`, dropping outdated disk cache entries
+        """
+        store = get_store(self.path)
+        dm = load_dataset_metadata(dataset, store)
+        self._fingerprints[dataset] = metadata_fingerprint(dm)
+        if self.disk_cache is not None:
+            cached = self.disk_cache.dataset_key(self.path, dataset)
+            self.disk_cache.invalidate(cached, self._fingerprints[dataset])
+        return dm
+
+    def _drop_invalid(self, df, coords=("ra", "dec")):
+        """Drops rows that cannot be plotted
+
+        In masked mode only rows with non-finite (NaN or inf) coordinates are
+        dropped (and the frame is only copied if there are any); otherwise
+        any row with a NaN.
+        """
+        if not self.masked:
+            return df.dropna(how="any")
+
+        valid = np.isfinite(df[list(coords)].to_numpy(dtype="float64", na_value=np.nan)).all(axis=1)
+        if valid.all():
+            return df
+        return df[valid]
+
+    def _get_dtypes(self, coadd_version, stored=False):
+        """dtypes of the coadd columns, as seen by the dashboard or (`stored`) as written
+        """
+        if coadd_version not in self._dtypes:
+            dataset = "analysisCoaddTable_{}".format(coadd_version)
+            if coadd_version == self.coadd_version and self.schema is not None:
+                schema = self.schema
+            else:
+                store = get_store(self.path)
+                schema = read_schema(dataset, store)
+            dtypes = schema_dtypes(schema)
+            compact = self.get_compact_schema(dataset)
+            self._schema_dtypes[coadd_version] = dtypes
+            self._dtypes[coadd_version] = dtypes if compact is None else compact.dtypes(dtypes)
+        return self._schema_dtypes[coadd_version] if stored else self._dtypes[coadd_version]
+
+    def _is_cached(self, dataset, filter_name, tracts, columns):
+        return all((dataset, filter_name, t, c) in self.cache for t in tracts for c in columns)
+
+    def _read_coadd(self, dataset, filter_name, tracts, columns, predicates=()):
+        """Reads `columns` of the rows matching `predicates`, bypassing the column cache
+
+        For datasets written with the compact profile the stored columns are
+        read and expanded; predicates on flags are applied after unpacking.
+        """
+        compact = self.get_compact_schema(dataset)
+        if compact is None:
+            return self._read_coadd_stored(dataset, filter_name, tracts, columns, predicates)
+
+        pushed, post = compact.split_predicates(predicates)
+        read_columns = compact.physical_columns(list(columns) + [p[0] for p in post])
+        df = self._read_coadd_stored(dataset, filter_name, tracts, read_columns, pushed)
+        df = compact.expand(df, list(columns) + [p[0] for p in post])
+        if post:
+            df = apply_predicates(df, post).reset_index(drop=True)
+        return df[list(columns)]
+
+    def _read_coadd_stored(self, dataset, filter_name, tracts, columns, predicates=()):
+        """Reads stored `columns` of the rows matching `predicates`
+
+        If a disk cache is configured, the result is looked up there first
+        (keyed by the selected partitions, columns and predicates), and
+        tables read from the store are written to it.
+        """
+        predicates = [("tract", "in", list(tracts)), ("filter", "==", filter_name), *predicates]
+        partitions = self.get_partitions(dataset)
+        keys = set(partitions.columns) - {"file"}
+        partitions = apply_predicates(partitions, [p for p in predicates if p[0] in keys])
+        filters = [p for p in predicates if p[0] not in keys]
+        if len(partitions) == 0:
+            return self._empty_frame(dataset, columns)
+
+        if self.disk_cache is None:
+            return self._read_coadd_frame(dataset, partitions, columns, predicates, filters)
+
+        cached = self.disk_cache.dataset_key(self.path, dataset)
+        fingerprint = self._fingerprints[dataset]
+        key = self.disk_cache.key(partitions.index, columns, filters=filters)
+        table = self.disk_cache.get(cached, fingerprint, key)
+        if table is None:
+            df = self._read_coadd_frame(dataset, partitions, columns, predicates, filters)
+            self.disk_cache.put(cached, fingerprint, key, pa.Table.from_pandas(df, preserve_index=False))
+            table = self.disk_cache.get(cached, fingerprint, key)
+            if table is None:
+                return df
+        else:
+            print(f"...read {len(partitions)} partition(s) from disk cache")
+        # numeric columns without nulls are zero-copy views of the memory-mapped file
+        return table.to_pandas(split_blocks=True)
+
+    def _read_coadd_frame(self, dataset, partitions, columns, predicates, filters):
+        store = get_store(self.path)
+
+        if self.load_mode == "arrow":
+            table = read_arrow_partitions(partitions, store, columns=columns, filters=filters)
+            if table is None:
+                return self._empty_frame(dataset, columns)
+            return arrow_to_pandas(table)
+
+        df = read_dataset_as_ddf(
+            predicates=[predicates], dataset_uuid=dataset, columns=columns, store=store, table="table",
+        ).compute()
+        return df.reset_index(drop=True)
+
+    def _empty_frame(self, dataset, columns):
+        dtypes = self._get_dtypes(dataset.split("_")[-1], stored=True)
+        return pd.DataFrame({c: pd.Series(dtype=dtypes[c]) for c in columns})
+
+    def _load_coadd_columns(self, dataset, filter_name, tracts, columns):
+        """Loads `columns` for each tract, reading only those that are not cached
+
+        Tracts missing the same set of columns are read together in a single
+        kartothek graph; the result is split by tract and cached per column.
+        """
+        # cached columns are taken up front, so that evictions caused by the
+        # reads below (or by concurrent loads) cannot drop them
+        loaded = {}
+        missing = {}
+        for tract in tracts:
+            cols = []
+            for c in columns:
+                key = (dataset, filter_name, tract, c)
+                value = self.cache.get(key)
+                if value is None:
+                    cols.append(c)
+                else:
+                    loaded[key] = value
+            if cols:
+                missing.setdefault(tuple(cols), []).append(tract)
+
+        for cols, missing_tracts in missing.items():
+            print(f"...reading {len(cols)} column(s) for {len(missing_tracts)} tract(s)...")
+            read_columns = list(dict.fromkeys(cols + ("tract",)))
+            df = self._read_coadd(dataset, filter_name, missing_tracts, read_columns)
+
+            by_tract = dict(iter(df.groupby("tract", sort=False, observed=True)))
+            for tract in missing_tracts:
+                tract_df = by_tract.get(tract, df.iloc[:0])
+                for c in cols:
+                    key = (dataset, filter_name, tract, c)
+                    loaded[key] = tract_df[c].reset_index(drop=True)
+                    self.cache.put(key, loaded[key])
+
+        frames = []
+        for tract in tracts:
+            keys = [(dataset, filter_name, tract, c) for c in columns]
+            data = {key[-1]: loaded[key] for key in keys}
+            frames.append(pd.DataFrame(data))
+
+        return pd.concat(frames, ignore_index=True)
+
     def get_patch_count(self, filters, tracts, coadd_version="unforced"):
 
         return 1
@@ -111,7 +618,7 @@ class Dataset:
 
         columns = ["patch"]
 
-        store = partial(get_store_from_url, "hfs://" + str(self.path))
+        store = get_store(self.path)
 
         if predicates:
 
@@ -124,14 +631,28 @@ class Dataset:
         return coadd_df.drop_duplicates().count().compute()["patch"]
 
     def read_summary_stats(self):
-        for table in ["CoaddTable_unforced", "CoaddTable_forced", "VisitTable"]:
-            name = table.replace("Table", "").lower()
-            path = self.path.joinpath(f"analysis{table}_stats.parq")
-            self.stats[name] = pd.read_parquet(path)
+        self.summary_stats = SummaryStats.read(self.path)
+        self.stats = self.summary_stats.tables
+
+    def get_stats_by_filter(self, filter_name, tracts=None, coadd_version=None):
+        """Coadd summary statistics of `filter_name` for `tracts`, indexed by statistic
+        """
+        coadd_version = coadd_version or self.coadd_version
+        return self.summary_stats.select(f"coadd_{coadd_version}", filter_name, tracts)
+
+    def fetch_coadd_schema(self, coadd_version="unforced"):
+        """Reads schema and partition index of the coadd table from the kartothek metadata
+        """
+        store = get_store(self.path)
+        dataset = "analysisCoaddTable_{}".format(coadd_version)
+
+        dm = self._load_metadata(dataset)
+        self.schema = read_schema(dataset, store, dataset_metadata=dm)
+        self.partitions = partition_frame(dm, schema=self.schema)
 
     def fetch_coadd_table(self, coadd_version="unforced"):
         table = "qaDashboardCoaddTable"
-        store = partial(get_store_from_url, "hfs://" + str(self.path))
+        store = get_store(self.path)
         print(str(self.path))
         predicates = [[("tract", "in", self.tracts)]]
         dataset = "analysisCoaddTable_{}".format(coadd_version)
@@ -143,39 +664,17 @@ class Dataset:
         self.coadd[table] = coadd_df
 
     def post_process_metadata(self):
-        df = self.coadd["qaDashboardCoaddTable"]
-        self.flags = df.columns[df.dtypes == bool].to_list()
+        dtypes = self._get_dtypes(self.coadd_version)
+        self.flags = dtypes.index[dtypes == bool].to_list()
         self.metrics = (
-            set(df.columns.to_list())
+            set(dtypes.index.to_list())
             - set(self.flags)
-            - set(["patch", "dec", "psfMag", "ra", "filter", "dataset", "tract"])
+            - set(["patch", "dec", "psfMag", "ra", "filter", "dataset", "tract", "hpix"])
         )
 
     def get_visits_by_metric_filter(self, filt, metric):
 
-        store = partial(get_store_from_url, "hfs://" + str(self.path))
-
-        columns = [
-            "filter",
-            "tract",
-            "visit",
-            "calib_psf_used",
-            "calib_psf_candidate",
-            "calib_photometry_reserved",
-            "qaBad_flag",
-            "ra",
-            "dec",
-            "psfMag",
-        ] + [metric]
-
-        visits_ddf = read_dataset_as_ddf(
-            dataset_uuid="analysisVisitTable",
-            predicates=[[("filter", "==", filt)]],
-            store=store,
-            columns=columns,
-            table="table",
-        )
-        store = partial(get_store_from_url, "hfs://" + str(self.path))
+        store = get_store(self.path)
 
         columns = [
             "filter",
@@ -190,13 +689,17 @@ class Dataset:
             "psfMag",
         ] + [metric]
 
+        compact = self.get_compact_schema("analysisVisitTable")
         visits_ddf = read_dataset_as_ddf(
             dataset_uuid="analysisVisitTable",
             predicates=[[("filter", "==", filt)]],
             store=store,
-            columns=columns,
+            columns=columns if compact is None else compact.physical_columns(columns),
             table="table",
         )
+        if compact is not None:
+            expand = partial(compact.expand, columns=columns)
+            visits_ddf = visits_ddf.map_partitions(expand, meta=expand(visits_ddf._meta))
 
         return visits_ddf[visits_ddf[metric].notnull()]
 
@@ -22,7 +22,10 @@ from .base import Component
 from .visits_plot import visits_plot
 from .plots import FilterStream, scattersky, skyplot
 
+from .aggregates import HistogramCube
 from .dataset import Dataset
+from .service import service
+from .spatial import Box
 
 from .utils import clear_dynamicmaps, set_timeout
 
@@ -41,13 +44,17 @@ with open(os.path.join(current_directory, "dashboard.html")) as template_file:
 
 pn.extension()
 
-datasets = []
-filtered_datasets = []
-datavisits = []
-filtered_datavisits = []
-
 sample_data_directory = "sample_data/DM-23243-KTK-1Perc"
 
+# extra keyword arguments of the Dataset created by load_data (e.g. cache_dir)
+dataset_kwargs = {}
+
+# draw plots from the coadd sample first and refine them while the selection loads
+progressive = False
+
+# keep the selections persisted on the dask workers and aggregate the plots there
+distributed = False
+
 
 def create_hv_dataset(ddf, stats, percentile=(1, 99)):
 
@@ -64,8 +71,10 @@ def create_hv_dataset(ddf, stats, percentile=(1, 99)):
                 cmin, cmax = stats[c]["min"].min(), stats[c]["max"].max()
                 c = hv.Dimension(c, range=(cmin, cmax))
             elif c in ("filter", "patch"):
-                cvalues = list(ddf[c].unique())
-                c = hv.Dimension(c, values=cvalues)
+                cvalues = ddf[c].unique()
+                if isinstance(cvalues, dd.Series):
+                    cvalues = cvalues.compute()
+                c = hv.Dimension(c, values=list(cvalues))
             elif ddf[c].dtype.kind == "b":
                 c = hv.Dimension(c, values=[True, False])
             kdims.append(c)
@@ -76,8 +85,11 @@ def create_hv_dataset(ddf, stats, percentile=(1, 99)):
                     cmin, cmax = stats[c][f"{p0}%"].min(), stats[c][f"{p1}%"].max()
                 else:
                     print("percentiles not found in stats, computing")
-                    darray = ddf[c].values
-                    cmin, cmax = da.compute(da.percentile(darray, p0)[0], da.percentile(darray, p1)[0])
+                    if isinstance(ddf, dd.DataFrame):
+                        # approximate, computed on the workers
+                        cmin, cmax = ddf[c].dropna().quantile([p0 / 100, p1 / 100]).compute()
+                    else:
+                        cmin, cmax = np.nanpercentile(ddf[c].to_numpy(dtype="float64"), [p0, p1])
             else:
                 cmin, cmax = stats[c]["min"].min(), stats[c]["max"].max()
             c = hv.Dimension(c, range=(cmin, cmax))
@@ -93,27 +105,11 @@ class Store(object):
 
 
 def init_dataset(data_repo_path, datastack="forced", **kwargs):
+    """Connected Dataset of a repository, shared with the other sessions of the process
 
-    global datasets
-    global filtered_datasets
-    # global datavisits
-    # global filtered_datavisits
-
-    d = Dataset(data_repo_path, coadd_version=datastack, **kwargs)
-    d.connect()
-
-    global store
-    store.active_dataset = d
-
-    # flags = d.flags
-
-    datasets = {}
-    filtered_datasets = {}
-
-    datavisits = {}
-    filtered_datavisits = {}
-
-    return d
+    Sessions release it with `service.release_dataset` once they no longer use it.
+    """
+    return service.get_dataset(data_repo_path, coadd_version=datastack, **kwargs)
 
 
 def load_data(data_repo_path=None, datastack="unforced"):
@@ -126,23 +122,11 @@ def load_data(data_repo_path=None, datastack="unforced"):
     if not os.path.exists(data_repo_path):
         raise ValueError("Data Repo Path does not exist.")
 
-    d = init_dataset(data_repo_path, datastack=datastack)
+    d = init_dataset(data_repo_path, datastack=datastack, **dataset_kwargs)
 
     return d
 
 
-store = Store()
-
-
-def get_available_metrics(filt):
-
-    global store
-    if not store.active_dataset:
-        return None
-
-    return store.active_dataset.metrics
-
-
 def get_metric_categories():
     categories = ["Photometry", "Astrometry", "Shape", "Color"]
     return categories
@@ -160,7 +144,7 @@ class QuickLookComponent(Component):
 
     query_filter_active = param.String(label="Active Query Filter", default="")
 
-    active_query_by_filter = param.Dict(default={f: "" for f in store.active_dataset.filters})
+    active_query_by_filter = param.Dict(default={})
 
     new_column_expr = param.String(label="Data Column Expression")
 
@@ -180,7 +164,7 @@ class QuickLookComponent(Component):
 
     selected = param.Tuple(default=(None, None, None, None), length=4)
 
-    selected_metrics_by_filter = param.Dict(default={f: [] for f in store.active_dataset.filters})
+    selected_metrics_by_filter = param.Dict(default={})
 
     selected_flag_filters = param.Dict(default={})
 
@@ -256,26 +240,38 @@ class QuickLookComponent(Component):
         self._filter_streams = {}
         self._skyplot_range_stream = RangeXY()
         self._scatter_range_stream = RangeXY()
+        self._skyplot_range_stream.add_subscriber(self._on_range_changed)
+        self._scatter_range_stream.add_subscriber(self._on_range_changed)
+
+        # filter -> running ProgressiveLoad, and the request and plot panes of its selection
+        self._loads = {}
+        # filter -> function starting the load of a selection drawn from the aggregates so far
+        self._deferred = {}
+        self._views = {}
+        self._load_callback = None
+
+        # filter -> loaded frame of this session, and its key in the shared service
+        self.datasets = {}
+        self._frame_keys = {}
+        if pn.state.curdoc is not None:
+            pn.state.curdoc.on_session_destroyed(lambda session_context: self._release_session())
 
         self._update(None)
 
     def _on_load_data_repository(self, event, load_metrics=True):
 
         # Setup Variables
-        global datasets
-        # global datavisits
-        # global filtered_datavisits
+        for filt in set(self._loads) | set(self._deferred):
+            self._cancel_load(filt)
+        self._views = {}
+        self._release_frames()
 
+        service.release_dataset(self.store.active_dataset)
         self.store.active_dataset = Dataset("")
         self.skyplot_list = []
         self.plots_list = []
         self.plot_top = None
 
-        datasets = {}
-        filtered_datasets = {}
-        # datavisits = {}
-        # filtered_datavisits = {}
-
         # Setup UI
         self._switch_view_mode()
         self.update_display()
@@ -315,8 +311,7 @@ class QuickLookComponent(Component):
         code = """$("input[type='checkbox']").addClass("metric-checkbox");"""
         self.execute_js_script(code)
 
-        global store
-        for filter_type, fails in store.active_dataset.failures.items():
+        for filter_type, fails in self.store.active_dataset.failures.items():
             error_metrics = json.dumps(fails)
             code = (
                 '$(".'
@@ -549,18 +544,12 @@ class QuickLookComponent(Component):
         self.filter_main_dataframe()
 
     def filter_main_dataframe(self):
-        global filtered_datasets
-        global datasets
-        for filt, qa_dataset in datasets.items():
-            try:
-                query_expr = self._assemble_query_expression()
-                if query_expr:
-                    filtered_datasets[filt] = datasets[filt].query(query_expr)
-            except Exception as e:
-                self.add_message_from_error("Filtering Error", "", e)
-                raise
-                return
-        self._update_selected_metrics_by_filter()
+        # the query is applied when the datasets are (re)loaded, mostly at read time
+        try:
+            self._update_selected_metrics_by_filter()
+        except Exception as e:
+            self.add_message_from_error("Filtering Error", "", e)
+            raise
 
     def _assemble_query_expression(self, ignore_query_expr=False):
         query_expr = ""
@@ -574,54 +563,268 @@ class QuickLookComponent(Component):
         if ignore_query_expr:
             return query_expr
 
-        query_filter = self.query_filter.strip()
+        query_filter = self.query_filter_active.strip()
         if query_filter:
             if query_expr:
-                query_expr += " & {!s}".format(query_filter)
+                query_expr += " & ({!s})".format(query_filter)
             else:
                 query_expr = "{!s}".format(query_filter)
 
         return query_expr
 
-    def get_dataset_by_filter(self, filter_type, metrics):
-        global datasets
-        global filtered_datasets
-
-        warnings = []
-        df = self.store.active_dataset.get_coadd_ddf_by_filter_metric(
-            filter_type,
-            metrics=metrics,
-            tracts=self.store.active_tracts,
-            coadd_version=self.store.active_dataset.coadd_version,
-            warnings=warnings,
-        )
-        if warnings:
-            msg = ";".join(warnings)
-            self.add_status_message("Selected Tracts Warning", msg, level="error")
+    def _load_request(self, metrics):
+        return tuple(metrics), tuple(self.store.active_tracts), self._assemble_query_expression() or None
 
-        datasets[filter_type] = df
-        filtered_datasets[filter_type] = df
+    def _start_load(self, filter_type, metrics):
+        """Starts loading the selection of a filter in the background
 
-        if self.query_filter or len(self.selected_flag_filters) > 0:
+        A load already running for the filter is cancelled.  The tracts are
+        loaded concurrently (`Dataset.progressive_load`) and `_poll_loads`
+        draws the plots once they are all in, or, with `progressive`, first
+        from the coadd sample and then as tracts arrive.  Until then the
+        plot panes show the fraction of tracts loaded.
 
-            query_expr = self._assemble_query_expression()
+        With `distributed`, the selection is instead persisted on the dask
+        workers (`Dataset.persisted_load`) and the plots aggregate it there,
+        so that only rasters and summaries reach the dashboard process.
 
-            if query_expr:
-                df = df.query(query_expr)
-                filtered_datasets[filter_type] = df
+        A selection already loaded by another session is taken from the
+        shared `service` instead of being loaded again.  If the sky pyramid
+        and histogram cube cover the metrics, the plots are drawn from them
+        right away and the objects are only loaded once a view is zoomed in
+        (`_on_range_changed`).
+        """
+        self._cancel_load(filter_type)
+        self._release_frame(filter_type)
+        dataset = self.store.active_dataset
+        request = self._load_request(metrics)
+        _, tracts, query = request
+
+        missing = [t for t in tracts if t not in dataset.tracts]
+        if missing:
+            msg = "Selected tracts {} missing in data".format(", ".join(map(str, missing)))
+            self.add_status_message("Selected Tracts Warning", msg, level="error")
 
-        stats = self.store.active_dataset.stats[f"coadd_{self.store.active_dataset.coadd_version}"]
-        if self.store.active_tracts:
-            stats = stats.loc[filter_type, self.store.active_tracts, :].reset_index(
-                ["filter", "tract"], drop=True
+        key = service.frame_key(dataset, filter_type, tracts, metrics, query)
+        shared = service.acquire(key)
+        start = None
+        if shared is None and distributed:
+            start = partial(dataset.persisted_load, filter_type, metrics, tracts, query=query)
+        elif shared is None:
+            start = partial(
+                dataset.progressive_load,
+                filter_type,
+                metrics,
+                tracts,
+                query=query,
+                min_interval=1.0 if progressive else float("inf"),
             )
-        else:
-            stats = stats.loc[filter_type, :, :].reset_index(["filter", "tract"], drop=True)
+        progress = pn.widgets.Progress(value=0, max=1, width=300)
+        view = dict(
+            request=request,
+            key=key,
+            progress=progress,
+            pyramid=self.get_sky_pyramid(filter_type),
+            cube=self.get_histogram_cube(filter_type),
+            sky=[
+                (filter_type + " - " + m, pn.Column(progress, sizing_mode="stretch_width")) for m in metrics
+            ],
+            detail=[(m, pn.Column(progress, sizing_mode="stretch_width")) for m in metrics],
+        )
+        self._views[filter_type] = view
+
+        if shared is not None:
+            self._frame_keys[filter_type] = key
+            self.datasets[filter_type] = shared
+            self._draw(filter_type, view, shared, done=True)
+            return view
+
+        if self._aggregates_cover(view, metrics):
+            self._deferred[filter_type] = start
+            self._draw(filter_type, view, dataset.empty_coadd_frame(metrics), done=True)
+            self._on_range_changed()
+            return view
+
+        self._watch_load(filter_type, start())
+
+        if progressive and not distributed:
+            df = dataset.get_coadd_sample(filter_type, metrics, tracts, query=query)
+            if df is not None:
+                self._draw(filter_type, view, df, done=False)
+        return view
+
+    def _watch_load(self, filter_type, load):
+        """Polls a started load of the view of `filter_type`
+        """
+        self._views[filter_type]["progress"].max = max(1, len(load.parts))
+        self._loads[filter_type] = load
+        if self._load_callback is None:
+            self._load_callback = pn.state.add_periodic_callback(self._poll_loads, period=250)
 
-        return create_hv_dataset(df, stats=stats)
+    def _aggregates_cover(self, view, metrics):
+        """Whether the zoomed-out sky and scatter plots of all `metrics` can be drawn from aggregates
+        """
+        pyramid, cube = view["pyramid"], view["cube"]
+        if pyramid is None or cube is None:
+            return False
+        return all(m in pyramid.metrics and m in cube.metrics for m in metrics)
+
+    @staticmethod
+    def _span(x_range):
+        if x_range and all(np.isfinite(v) for v in x_range):
+            return x_range[1] - x_range[0]
+        return np.inf
+
+    def _sky_zoomed_in(self):
+        """Whether the sky view is small enough to show individual objects
+        """
+        return self._span(self._skyplot_range_stream.x_range) <= skyplot.zoom_threshold
+
+    def _scatter_zoomed_in(self):
+        bin_width = HistogramCube.x_edges[1] - HistogramCube.x_edges[0]
+        return self._span(self._scatter_range_stream.x_range) <= scattersky.cube_min_bins * bin_width
+
+    def _start_deferred(self, filter_type):
+        """Starts loading the whole selection of a view drawn from the aggregates
+        """
+        start = self._deferred.pop(filter_type)
+        self._cancel_load(filter_type)
+        self.add_status_message("Loading Objects", filter_type, level="info", duration=3)
+        self._watch_load(filter_type, start())
+
+    def _start_region_load(self, filter_type):
+        """Loads the objects around the zoomed-in sky view (`Dataset.region_load`)
+
+        The region is the view padded by half its size on each side, so that
+        small pans do not need another load.  Without a coverage table the
+        whole selection is loaded instead.
+        """
+        (x0, x1), (y0, y1) = self._skyplot_range_stream.x_range, self._skyplot_range_stream.y_range
+        dx, dy = (x1 - x0) / 2, (y1 - y0) / 2
+        region = Box(x0 - dx, x1 + dx, max(y0 - dy, -90.0), min(y1 + dy, 90.0))
+        metrics, tracts, _ = self._views[filter_type]["request"]
+        try:
+            load = self.store.active_dataset.region_load(region, filter_type, list(metrics), tracts)
+        except IOError:
+            self._start_deferred(filter_type)
+            return
+        self._cancel_load(filter_type, keep_deferred=True)
+        self._views[filter_type]["region"] = region
+        self._watch_load(filter_type, load)
+
+    def _in_loaded_region(self, filter_type):
+        region = self._views[filter_type].get("region")
+        if region is None:
+            return False
+        (x0, x1), (y0, y1) = self._skyplot_range_stream.x_range, self._skyplot_range_stream.y_range
+        return bool(region.contains([x0, x1, x0, x1], [y0, y0, y1, y1]).all())
+
+    def _on_range_changed(self, **kwargs):
+        """Loads the objects of the views drawn from the aggregates once they are zoomed in
+
+        A zoomed-in sky view only loads the objects around it; the whole
+        selection is loaded once the scatter view is zoomed in.
+        """
+        for filt in list(self._deferred):
+            if self._scatter_zoomed_in():
+                self._start_deferred(filt)
+            elif self._sky_zoomed_in() and not self._in_loaded_region(filt):
+                self._start_region_load(filt)
+
+    def _cancel_load(self, filter_type, keep_deferred=False):
+        if not keep_deferred:
+            self._deferred.pop(filter_type, None)
+        load = self._loads.pop(filter_type, None)
+        if load is not None:
+            load.cancel()
+
+    def _release_frame(self, filter_type):
+        key = self._frame_keys.pop(filter_type, None)
+        if key is not None:
+            service.release(key)
+        self.datasets.pop(filter_type, None)
+
+    def _release_frames(self):
+        for filt in list(self._frame_keys):
+            self._release_frame(filt)
+
+    def _release_session(self):
+        """Releases the frames and the dataset of a closed session
+        """
+        for filt in set(self._loads) | set(self._deferred):
+            self._cancel_load(filt)
+        self._release_frames()
+        service.release_dataset(self.store.active_dataset)
+
+    def _poll_loads(self):
+        """Updates the progress bars and draws the selections that have new rows
+        """
+        for filt, load in list(self._loads.items()):
+            view = self._views[filt]
+            view["progress"].value = min(load.progress[0], view["progress"].max)
+            df = load.poll()
+            if df is None:
+                continue
+            if load.done:
+                del self._loads[filt]
+                if filt not in self._deferred:
+                    # region loads of deferred views are not shared
+                    df = service.share(view["key"], df)
+                    self._frame_keys[filt] = view["key"]
+                for e in load.errors:
+                    self.add_message_from_error("Data Loading Error", filt, e)
+                self.add_status_message("Data Ready", filt, level="success", duration=3)
+            elif not len(df):
+                continue
+
+            self.datasets[filt] = df
+            try:
+                self._draw(filt, view, df, done=load.done)
+            except Exception as e:
+                self.add_message_from_error("Plotting Error", filt, e)
+
+        if not self._loads and self._load_callback is not None:
+            self._load_callback.stop()
+            self._load_callback = None
+
+    def _draw(self, filt, view, df, done):
+        stats = self.store.active_dataset.get_stats_by_filter(filt, self.store.active_tracts)
+        dset = create_hv_dataset(df, stats=stats)
+        head = [] if done else [view["progress"]]
+        for (_, sky_panel), (metric, ss_panel) in zip(view["sky"], view["detail"]):
+            sky_panel[:] = head + [pn.panel(self._skyplot(dset, filt, metric, view["pyramid"]))]
+            ss_panel[:] = head + [pn.panel(self._scattersky(dset, filt, metric, view["cube"]))]
+
+    def get_sky_pyramid(self, filter_type):
+        """Precomputed sky aggregates of a filter over the active tracts
+
+        The pyramid is built over all objects, so it is only used when the
+        query and flag filters are inactive.
+        """
+        if self._assemble_query_expression():
+            return None
+        try:
+            return self.store.active_dataset.get_sky_pyramid(filter_type, self.store.active_tracts)
+        except Exception as e:
+            self.add_message_from_error("Sky Pyramid Warning", "", e, level="warning")
+            return None
+
+    def get_histogram_cube(self, filter_type):
+        """Precomputed psfMag-vs-metric histograms of a filter over the active tracts
+
+        Like the sky pyramid, only used when the query and flag filters are
+        inactive.
+        """
+        if self._assemble_query_expression():
+            return None
+        try:
+            return self.store.active_dataset.get_histogram_cube(filter_type, self.store.active_tracts)
+        except Exception as e:
+            self.add_message_from_error("Histogram Cube Warning", "", e, level="warning")
+            return None
 
     def get_datavisits(self):
-        return store.active_dataset.stats["visit"]
+        return self.store.active_dataset.stats["visit"]
 
     def add_message_from_error(self, title, info, exception_obj, level="error"):
 
@@ -637,12 +840,14 @@ class QuickLookComponent(Component):
     def _update_selected_metrics_by_filter(self):
         skyplot_list = []
         detail_plots = {}
-        existing_skyplots = {}
 
         dvisits = self.get_datavisits()
         for filt, metrics in self.selected_metrics_by_filter.items():
             plots_list = []
             if not metrics:
+                self._cancel_load(filt)
+                self._release_frame(filt)
+                self._views.pop(filt, None)
                 continue
             top_plot = None
             try:
@@ -658,34 +863,13 @@ class QuickLookComponent(Component):
             self.plot_top = top_plot
             detail_plots[filt] = [top_plot]
 
-            if filt in self._filter_streams:
-                filter_stream = self._filter_streams[filt]
-            else:
-                self._filter_streams[filt] = filter_stream = FilterStream()
-            dset = self.get_dataset_by_filter(filt, metrics=metrics)
-            for i, metric in enumerate(metrics):
-                # Sky plots
-                skyplot_name = filt + " - " + metric
-                plot_sky = skyplot(
-                    dset, filter_stream=filter_stream, range_stream=self._skyplot_range_stream, vdim=metric
-                )
-                if skyplot_name in existing_skyplots:
-                    sky_panel = existing_sky_plots[skyplot_name]
-                    sky_panel.object = plot_sky
-                else:
-                    sky_panel = pn.panel(plot_sky)
-                skyplot_list.append((skyplot_name, sky_panel))
-
-                # Detail plots
-                plots_ss = scattersky(
-                    dset,
-                    xdim="psfMag",
-                    ydim=metric,
-                    sky_range_stream=self._skyplot_range_stream,
-                    scatter_range_stream=self._scatter_range_stream,
-                    filter_stream=filter_stream,
-                )
-                plots_list.append((metric, plots_ss))
+            if filt not in self._filter_streams:
+                self._filter_streams[filt] = FilterStream()
+            view = self._views.get(filt)
+            if view is None or view["request"] != self._load_request(metrics):
+                view = self._start_load(filt, metrics)
+            skyplot_list.extend(view["sky"])
+            plots_list = list(view["detail"])
             detail_plots[filt].extend([p for m, p in plots_list])
 
         self.skyplot_list = skyplot_list
@@ -695,6 +879,26 @@ class QuickLookComponent(Component):
         self.update_display()
         self._switch_view_mode()
 
+    def _skyplot(self, dset, filt, metric, pyramid):
+        return skyplot(
+            dset,
+            filter_stream=self._filter_streams[filt],
+            range_stream=self._skyplot_range_stream,
+            vdim=metric,
+            pyramid=pyramid,
+        )
+
+    def _scattersky(self, dset, filt, metric, cube):
+        return scattersky(
+            dset,
+            xdim="psfMag",
+            ydim=metric,
+            sky_range_stream=self._skyplot_range_stream,
+            scatter_range_stream=self._scatter_range_stream,
+            filter_stream=self._filter_streams[filt],
+            cube=cube,
+        )
+
     def _update_detail_plots(self):
         tabs = []
         for filt, plots in self.detail_plots.items():
@@ -857,8 +1061,7 @@ class MetricPanel(param.Parameterized):
 
     def _create_metric_checkbox_group(self, filt):
 
-        global store
-        metrics = store.active_dataset.metrics
+        metrics = self.parent.store.active_dataset.metrics
 
         if not metrics:
             return pn.pane.Markdown("_No metrics available_")
@@ -905,4 +1108,10 @@ _css = """
 """
 
 
-dashboard = Application(body=QuickLookComponent(store))
+def create_dashboard():
+    """Dashboard of one session; the data are shared through `lsst_dashboard.service.service`
+    """
+    return Application(body=QuickLookComponent(Store()))
+
+
+dashboard = create_dashboard()
@@ -0,0 +1,131 @@
+"""Lazy ingest of the Butler Parquet files into dask dataframes."""
+import heapq
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import pandas as pd
+import pyarrow.parquet as pq
+import dask.dataframe as dd
+from dask import delayed
+
+
+def assign_dataId(df, dataId, category_values=None):
+    """Adds the dataId keys as columns of `df`
+
+    Keys listed in `category_values` become categoricals over the given
+    values, so that all partitions share the same known categories.
+    """
+    category_values = category_values or {}
+    columns = {}
+    for k, v in dataId.items():
+        if k in category_values:
+            categories = category_values[k]
+            codes = np.full(len(df), list(categories).index(v), dtype="int32")
+            columns[k] = pd.Categorical.from_codes(codes, categories=categories)
+        else:
+            columns[k] = v
+    return df.assign(**columns)
+
+
+def read_dataId_file(filename, dataId, columns=None, engine="pyarrow", category_values=None):
+    """Reads a Butler Parquet file and attaches its dataId (runs on the workers)
+    """
+    df = pd.read_parquet(filename, columns=columns, engine=engine)
+    return assign_dataId(df, dataId, category_values)
+
+
+def dataId_file_meta(filename, dataId, columns=None, category_values=None):
+    """Empty frame with the schema `read_dataId_file` returns, from the Parquet footer only
+    """
+    df = pq.read_schema(filename).empty_table().to_pandas()
+    if columns is not None:
+        df = df[list(columns)]
+    return assign_dataId(df, dataId, category_values)
+
+
+def ddf_from_files(filenames, dataIds, columns=None, engine="pyarrow", category_values=None):
+    """Dask dataframe with one partition per input file
+
+    Every file is read by its own task on the workers; the client only reads
+    the footer of the first file to build the dataframe metadata.
+    """
+    read = delayed(read_dataId_file, pure=True)
+    parts = [
+        read(filename, dataId, columns=columns, engine=engine, category_values=category_values)
+        for filename, dataId in zip(filenames, dataIds)
+    ]
+    meta = dataId_file_meta(filenames[0], dataIds[0], columns=columns, category_values=category_values)
+    return dd.from_delayed(parts, meta=meta, verify_meta=False)
+
+
+def file_footprint(filename, columns=None):
+    """Row count and uncompressed size in bytes of (`columns` of) a Parquet file
+
+    Only the footer is read.
+    """
+    md = pq.read_metadata(filename)
+    columns = None if columns is None else set(columns)
+    nbytes = 0
+    for i in range(md.num_row_groups):
+        rg = md.row_group(i)
+        for j in range(rg.num_columns):
+            col = rg.column(j)
+            if columns is None or col.path_in_schema.split(".")[0] in columns:
+                nbytes += col.total_uncompressed_size
+    return md.num_rows, nbytes
+
+
+def file_footprints(filenames, columns=None, n_threads=16):
+    """`file_footprint` of many files, reading the footers concurrently
+
+    Returns a `pandas.DataFrame` with ``rows`` and ``bytes`` columns in the
+    order of `filenames`.
+    """
+    with ThreadPoolExecutor(max_workers=n_threads) as pool:
+        footprints = list(pool.map(lambda f: file_footprint(f, columns=columns), filenames))
+    return pd.DataFrame.from_records(footprints, columns=["rows", "bytes"])
+
+
+def plan_chunks(sizes, target_bytes):
+    """Groups items of the given `sizes` into chunks of at most `target_bytes`
+
+    Items are assigned largest first to the currently smallest of
+    ``ceil(sum(sizes) / target_bytes)`` chunks (at least one), and a new
+    chunk is opened whenever an item does not fit in it.  Items larger than
+    `target_bytes` are never split; they get a chunk of their own, the only
+    chunks over the target.
+
+    Returns a list of chunks, each a sorted list of item positions.
+    """
+    sizes = np.asarray(sizes, dtype="float64")
+    if len(sizes) == 0:
+        return []
+    n_chunks = int(min(len(sizes), max(1, np.ceil(sizes.sum() / target_bytes))))
+
+    heap = [(0.0, i) for i in range(n_chunks)]
+    chunks = [[] for _ in range(n_chunks)]
+    for pos in np.argsort(-sizes, kind="mergesort"):
+        total, i = heapq.heappop(heap)
+        if total > 0 and total + sizes[pos] > target_bytes:
+            # no chunk has room: the others are at least as full as this one
+            heapq.heappush(heap, (total, i))
+            total, i = 0.0, len(chunks)
+            chunks.append([])
+        chunks[i].append(int(pos))
+        heapq.heappush(heap, (total + sizes[pos], i))
+
+    return [sorted(chunk) for chunk in chunks if chunk]
+
+
+def describe_chunks(chunks, footprints):
+    """Files, rows and uncompressed MB of each planned chunk
+    """
+    records = [
+        dict(
+            files=len(chunk),
+            rows=int(footprints["rows"].iloc[chunk].sum()),
+            MB=footprints["bytes"].iloc[chunk].sum() / 1024 ** 2,
+        )
+        for chunk in chunks
+    ]
+    return pd.DataFrame.from_records(records, columns=["files", "rows", "MB"])
@@ -0,0 +1,99 @@
+"""Journal of the units of work committed by a repartition run.
+
+Each kartothek update commits its partitions atomically when the graph
+finishes, so a chunk of dataIds is either fully in the dataset or not at
+all.  Recording every committed chunk (and every completed post-partition
+step: stats, coverage, ...) in an append-only file next to the destination
+lets an interrupted run resume without rewriting, or duplicating, data that
+is already there.  A step only counts as done if it completed after the
+last chunk committed, so new data redoes it.
+"""
+import json
+import os
+import time
+
+
+class RepartitionJournal(object):
+    """Append-only JSON-lines journal of committed repartition units
+
+    Parameters
+    ----------
+    path : `str`
+        Journal file, usually ``{destination}/repartition_journal.jsonl``.
+    """
+
+    def __init__(self, path):
+        self.path = path
+
+    def entries(self):
+        if not os.path.exists(self.path):
+            return []
+        entries = []
+        with open(self.path) as f:
+            for line in f:
+                try:
+                    entries.append(json.loads(line))
+                except ValueError:
+                    # truncated last line of an interrupted write
+                    continue
+        return entries
+
+    def _append(self, entry):
+        os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+        entry = dict(entry, time=time.strftime("%Y-%m-%dT%H:%M:%S"))
+        with open(self.path, "a+") as f:
+            # terminate a line left truncated by an interrupted write
+            f.seek(0, os.SEEK_END)
+            if f.tell() > 0:
+                f.seek(f.tell() - 1)
+                if f.read(1) != "\n":
+                    f.write("\n")
+            f.write(json.dumps(entry) + "\n")
+            f.flush()
+            os.fsync(f.fileno())
+
+    def record_chunk(self, dataset, filt, chunk, dataIds):
+        """Records that `dataIds` of `dataset` were committed to the kartothek dataset
+        """
+        values = [[getattr(v, "item", lambda: v)() for v in d.values()] for d in dataIds]
+        self._append(dict(dataset=dataset, unit="chunk", filter=filt, chunk=chunk, dataIds=values))
+
+    def record_step(self, dataset, step):
+        """Records that the post-partition `step` (e.g. ``"stats"``) of `dataset` completed
+        """
+        self._append(dict(dataset=dataset, unit="step", step=step))
+
+    def committed_dataIds(self, dataset):
+        """dataId value tuples of `dataset` that are already committed
+        """
+        return {
+            tuple(values)
+            for entry in self.entries()
+            if entry["dataset"] == dataset and entry["unit"] == "chunk"
+            for values in entry["dataIds"]
+        }
+
+    def steps_done(self, dataset):
+        """Post-partition steps of `dataset` completed after its last committed chunk
+        """
+        done = set()
+        for entry in self.entries():
+            if entry["dataset"] != dataset:
+                continue
+            if entry["unit"] == "chunk":
+                done = set()
+            elif entry["unit"] == "step":
+                done.add(entry["step"])
+        return done
+
+    def reset(self, dataset):
+        """Drops all entries of `dataset`
+        """
+        entries = [entry for entry in self.entries() if entry["dataset"] != dataset]
+        if not entries and not os.path.exists(self.path):
+            return
+        tmp = self.path + ".tmp"
+        with open(tmp, "w") as f:
+            for entry in entries:
+                f.write(json.dumps(entry) + "\n")
+        os.replace(tmp, self.path)
@@ -0,0 +1,135 @@
+"""Parquet layout of the partitioned tables.
+
+The dashboard reads a few columns across many partition files, so the codec,
+row group size, page size and dictionary encoding of those files matter
+more than kartothek's defaults suggest.  A `StorageLayout` collects these
+settings and provides the kartothek serializer that applies them.
+
+    StorageLayout.parse("zstd")
+    StorageLayout.parse("codec=zstd,level=3,row_group_mb=64,page_kb=1024,dictionary=patch+filter")
+"""
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+from kartothek.serialization import ParquetSerializer
+
+
+CODECS = ("snappy", "zstd", "lz4", "gzip", "brotli", "none")
+
+
+class StorageLayout(object):
+    """Parquet write settings of the partition files
+
+    Parameters
+    ----------
+    codec : `str`
+        One of `CODECS`.
+    level : `int`, optional
+        Compression level (zstd, gzip, brotli).
+    row_group_mb : `float`, optional
+        Target uncompressed size of a row group; the number of rows per
+        row group is derived from the average row size of each file.
+        Default: a single row group per file.
+    page_kb : `float`, optional
+        Target data page size.
+    dictionary : `list`, optional
+        Columns to dictionary-encode; default all (pyarrow's default).
+    """
+
+    def __init__(self, codec="snappy", level=None, row_group_mb=None, page_kb=None, dictionary=None):
+        if codec not in CODECS:
+            raise ValueError(f"Unknown codec {codec!r}, choose from {CODECS}.")
+        self.codec = codec
+        self.level = level
+        self.row_group_mb = row_group_mb
+        self.page_kb = page_kb
+        self.dictionary = None if dictionary is None else list(dictionary)
+
+    @classmethod
+    def parse(cls, spec):
+        """Layout from a name in `LAYOUTS` or a ``key=value,...`` spec
+
+        Keys are the constructor arguments; ``dictionary`` takes column
+        names separated by ``+``.
+        """
+        if spec in LAYOUTS:
+            return LAYOUTS[spec]
+        kwargs = {}
+        for item in spec.split(","):
+            key, _, value = item.strip().partition("=")
+            if key == "codec":
+                kwargs[key] = value
+            elif key == "level":
+                kwargs[key] = int(value)
+            elif key in ("row_group_mb", "page_kb"):
+                kwargs[key] = float(value)
+            elif key == "dictionary":
+                kwargs[key] = [c for c in value.split("+") if c]
+            else:
+                raise ValueError(f"Unknown layout setting {key!r} in {spec!r}.")
+        return cls(**kwargs)
+
+    def __repr__(self):
+        settings = ", ".join(f"{k}={v!r}" for k, v in self.__dict__.items() if v is not None)
+        return f"StorageLayout({settings})"
+
+    def __eq__(self, other):
+        return isinstance(other, StorageLayout) and self.__dict__ == other.__dict__
+
+    def write_kwargs(self, table):
+        """Keyword arguments of `pyarrow.parquet.write_table` for `table`
+        """
+        kwargs = dict(compression=self.codec, compression_level=self.level)
+        if self.row_group_mb is not None and table.num_rows:
+            row_bytes = max(table.nbytes / table.num_rows, 1)
+            kwargs["row_group_size"] = max(1, int(self.row_group_mb * 1024 ** 2 / row_bytes))
+        if self.page_kb is not None:
+            kwargs["data_page_size"] = int(self.page_kb * 1024)
+        if self.dictionary is not None:
+            kwargs["use_dictionary"] = [c for c in self.dictionary if c in table.column_names]
+        return kwargs
+
+    def serializer(self):
+        return LayoutSerializer(self)
+
+
+class LayoutSerializer(ParquetSerializer):
+    """kartothek `ParquetSerializer` writing files with a `StorageLayout`
+    """
+
+    def __init__(self, layout):
+        super().__init__(compression=layout.codec.upper())
+        self.layout = layout
+
+    def __eq__(self, other):
+        return isinstance(other, LayoutSerializer) and self.layout == other.layout
+
+    def __repr__(self):
+        return f"LayoutSerializer({self.layout!r})"
+
+    def store(self, store, key_prefix, df):
+        key = "{}.parquet".format(key_prefix)
+        table = df if isinstance(df, pa.Table) else pa.Table.from_pandas(df)
+        buf = pa.BufferOutputStream()
+        pq.write_table(
+            table,
+            buf,
+            version=self._PARQUET_VERSION,
+            coerce_timestamps="us",
+            **self.layout.write_kwargs(table),
+        )
+        store.put(key, buf.getvalue().to_pybytes())
+        return key
+
+
+LAYOUTS = {
+    "default": StorageLayout(),
+    "snappy-64mb": StorageLayout("snappy", row_group_mb=64),
+    "zstd": StorageLayout("zstd", level=3),
+    "zstd-64mb": StorageLayout("zstd", level=3, row_group_mb=64),
+    "zstd-9": StorageLayout("zstd", level=9, row_group_mb=64),
+    "lz4-64mb": StorageLayout("lz4", row_group_mb=64),
+    "zstd-64mb-dict-ids": StorageLayout(
+        "zstd", level=3, row_group_mb=64, dictionary=["filter", "tract", "patch"]
+    ),
+}
@@ -0,0 +1,90 @@
+"""Resolution of Butler dataIds to input file paths.
+
+Checking existence and looking up the path of every dataId one at a time
+dominates partitioner startup for visit tables, so this is done
+concurrently and the result is saved as a manifest next to the kartothek
+destination for re-runs.
+"""
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+import pandas as pd
+from tqdm import tqdm
+
+
+def resolve_dataId(butler, dataset, dataId):
+    """Path of the `dataset` file for `dataId`, or None if it does not exist
+
+    Only the location is looked up; the dataset itself is never loaded.
+    """
+    if not butler.datasetExists(dataset, dataId):
+        return None
+    uri = butler.getUri(dataset, dataId)
+    if uri.startswith("file://"):
+        uri = uri[len("file://") :]
+    return uri
+
+
+def resolve_manifest(butler, dataset, dataIds, n_threads=16, desc=None):
+    """Resolves `dataIds` concurrently into a manifest table
+
+    Returns a `pandas.DataFrame` with one column per dataId key and a
+    ``filename`` column that is null for dataIds without data.
+    """
+    keys = list(dataIds[0].keys()) if dataIds else []
+    if desc is None:
+        desc = f"Resolving {dataset} filenames from Butler"
+
+    def resolve(dataId):
+        return resolve_dataId(butler, dataset, dataId)
+
+    with ThreadPoolExecutor(max_workers=n_threads) as pool:
+        filenames = list(tqdm(pool.map(resolve, dataIds), desc=desc, total=len(dataIds)))
+
+    df = pd.DataFrame.from_records(dataIds, columns=keys)
+    df["filename"] = pd.Series(filenames, index=df.index, dtype="object")
+    return df
+
+
+def read_manifest(path):
+    if not os.path.exists(path):
+        return None
+    return pd.read_parquet(path)
+
+
+def write_manifest(manifest, path):
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    manifest.to_parquet(path, index=False)
+
+
+def update_manifest(butler, dataset, dataIds, path, n_threads=16):
+    """Loads the manifest at `path`, resolving only dataIds it does not cover yet
+
+    dataIds the Butler had no file for are looked up again on every run, as
+    their data may have been produced since.  The updated manifest
+    (restricted to `dataIds`, in their order) is written back to `path`.
+    """
+    if not dataIds:
+        return pd.DataFrame(columns=["filename"])
+
+    keys = list(dataIds[0].keys())
+    manifest = read_manifest(path)
+
+    if manifest is not None and set(keys) <= set(manifest.columns):
+        manifest = manifest[manifest["filename"].notnull()]
+        known = set(manifest[keys].itertuples(index=False, name=None))
+        todo = [d for d in dataIds if tuple(d[k] for k in keys) not in known]
+    else:
+        manifest = None
+        todo = dataIds
+
+    if todo:
+        resolved = resolve_manifest(butler, dataset, todo, n_threads=n_threads)
+        manifest = resolved if manifest is None else pd.concat([manifest, resolved], ignore_index=True)
+
+    requested = pd.MultiIndex.from_tuples([tuple(d[k] for k in keys) for d in dataIds], names=keys)
+    manifest = manifest.set_index(keys).reindex(requested).reset_index()
+
+    if todo:
+        write_manifest(manifest, path)
+    return manifest
@@ -1,10 +1,17 @@
 
+import hashlib
+import json
+import logging
+from pathlib import Path
+
 import scipy.spatial.kdtree
 import numpy
 from scipy import version
 from numpy import arcsin
 import numpy as np
 import dask.array as da
+import dask.dataframe as dd
+import pandas as pd
 
 scipy_version = ('.'.join(version.version.split('.')[0:2])).split('.')[0:2]
 
@@ -57,3 +64,366 @@ def match_lists(ra1, dec1, ra2, dec2, dist, numNei=1):
     dist[finite] = (2*arcsin(dist[finite]/2)) * 180 / np.pi
 
     return dist, ind
+
+
+def _xyz(ra, dec):
+    ra, dec = np.radians(ra), np.radians(dec)
+    return np.column_stack([np.cos(ra) * np.cos(dec), np.sin(ra) * np.cos(dec), np.sin(dec)])
+
+
+def _cell_layout(cell_size):
+    """Number of dec bands, RA cells per band and first cell id of each band
+
+    Bands are `cell_size` degrees high; RA cells are about `cell_size`
+    degrees wide at the edge of the band closest to the pole.
+    """
+    n_bands = int(np.ceil(180. / cell_size))
+    lo = -90. + cell_size * np.arange(n_bands)
+    hi = np.minimum(lo + cell_size, 90.)
+    edge = np.maximum(np.abs(lo), np.abs(hi))
+    n_ra = np.maximum(1, (360. * np.cos(np.radians(edge)) / cell_size).astype(int))
+    offsets = np.concatenate([[0], np.cumsum(n_ra)[:-1]])
+    return n_bands, n_ra, offsets
+
+
+def sky_cells(ra, dec, cell_size=1., margin=0.):
+    """Cells of a dec-band / RA grid containing positions, or within `margin` of them
+
+    Returns ``(cells, index)``: the cell ids and the positions (in `ra`,
+    `dec`) they belong to.  Without a margin every position is in exactly
+    one cell; with one, positions near cell edges are repeated in the
+    neighbouring cells (RA wraps around).  Everything is in degrees.
+    """
+    ra = np.mod(np.asarray(ra, dtype='float64'), 360.)
+    dec = np.asarray(dec, dtype='float64')
+    n_bands, n_ra, offsets = _cell_layout(cell_size)
+    b0 = np.clip(np.floor((dec - margin + 90.) / cell_size), 0, n_bands - 1).astype(int)
+    b1 = np.clip(np.floor((dec + margin + 90.) / cell_size), 0, n_bands - 1).astype(int)
+
+    cells, index = [], []
+    # a margin wider than half a band can span bands between b0 and b1 of an object
+    for b in range(b0.min(), b1.max() + 1) if len(dec) else []:
+        sel = np.flatnonzero((b0 <= b) & (b <= b1))
+        if not len(sel):
+            continue
+        width = 360. / n_ra[b]
+        lo = -90. + b * cell_size
+        edge = min(90., max(abs(lo), abs(lo + cell_size)) + margin)
+        cos_edge = np.cos(np.radians(edge))
+        ra_margin = margin / cos_edge if cos_edge > margin / 180. else 360.
+        c0 = np.floor((ra[sel] - ra_margin) / width).astype(int)
+        c1 = np.floor((ra[sel] + ra_margin) / width).astype(int)
+        counts = np.minimum(c1 - c0 + 1, n_ra[b])
+        k = np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts)
+        cells.append((np.repeat(c0, counts) + k) % n_ra[b] + offsets[b])
+        index.append(np.repeat(sel, counts))
+    if not cells:
+        return np.zeros(0, dtype=int), np.zeros(0, dtype=int)
+    return np.concatenate(cells), np.concatenate(index)
+
+
+def _cell_frame(df, cell_size, margin, offsets=None, keep=(), partition_info=None):
+    """Sky cells, ids and unit vectors of the objects of a partition
+
+    Runs on each partition of a frame with ``ra`` and ``dec`` columns.  The
+    ids are global positions given the `offsets` of the first object of
+    each partition, or the index labels without them.  The `keep` columns
+    are carried along.
+    """
+    ra, dec = df['ra'].to_numpy(dtype='float64'), df['dec'].to_numpy(dtype='float64')
+    cells, index = sky_cells(ra, dec, cell_size, margin)
+    if offsets is None:
+        ids = df.index.to_numpy()[index]
+    else:
+        offset = offsets[partition_info['number']] if partition_info is not None else 0
+        ids = offset + index.astype('int64')
+    xyz = _xyz(ra[index], dec[index])
+    columns = {'cell': cells.astype('int64'), 'id': ids, 'x': xyz[:, 0], 'y': xyz[:, 1], 'z': xyz[:, 2]}
+    columns.update((c, df[c].to_numpy()[index]) for c in keep)
+    return pd.DataFrame(columns)
+
+
+def _match_cells(cells1, cells2, mindist):
+    """Nearest neighbours within chord `mindist` of the objects of the same cells
+
+    `cells1` and `cells2` are `_cell_frame` rows indexed by cell.  Returns
+    the ids (``id1``, ``id2``) and distance in degrees of the matched
+    objects, with the other columns of `cells1`.
+    """
+    cells1 = cells1.sort_index(kind='stable')
+    cells2 = cells2.sort_index(kind='stable')
+    c1, c2 = cells1.index.to_numpy(), cells2.index.to_numpy()
+    xyz1, xyz2 = cells1[['x', 'y', 'z']].to_numpy(), cells2[['x', 'y', 'z']].to_numpy()
+
+    ids, starts1 = np.unique(c1, return_index=True)
+    ends1 = np.append(starts1[1:], len(c1))
+    starts2 = np.searchsorted(c2, ids, 'left')
+    ends2 = np.searchsorted(c2, ids, 'right')
+
+    dist = np.full(len(c1), np.inf)
+    ind = np.zeros(len(c1), dtype=int)
+    for a, b, c, d in zip(starts1, ends1, starts2, ends2):
+        if c == d:
+            continue
+        dist[a:b], j = scipy.spatial.cKDTree(xyz2[c:d]).query(xyz1[a:b], 1, 0, 2, mindist)
+        found = j < d - c
+        ind[a:b][found] = c + j[found]
+    good = np.isfinite(dist)
+    matched = cells1[good].drop(columns=['x', 'y', 'z']).rename(columns={'id': 'id1'})
+    return matched.reset_index(drop=True).assign(
+        id2=cells2['id'].to_numpy()[ind[good]],
+        dist=(2 * arcsin(dist[good] / 2)) * 180 / np.pi,
+    )
+
+
+def _match_frames(df1, df2, dist, cell_size, npartitions, offsets1=None, offsets2=None, keep=()):
+    """Matches (`_match_cells` rows) of the objects of two dask dataframes with ``ra`` and ``dec``
+    """
+    cells1 = df1.map_partitions(_cell_frame, cell_size, 0., offsets1, keep,
+                                meta=_cell_frame(df1._meta, cell_size, 0., offsets1, keep))
+    cells2 = df2.map_partitions(_cell_frame, cell_size, dist, offsets2,
+                                meta=_cell_frame(df2._meta, cell_size, dist, offsets2))
+
+    # the same cell divisions for both lists, balanced on the first one
+    npartitions = npartitions or df1.npartitions
+    if npartitions > 1:
+        cells1 = cells1.set_index('cell', npartitions=npartitions)
+    else:
+        n_cells = int(_cell_layout(cell_size)[1].sum())
+        cells1 = cells1.set_index('cell', divisions=(0, n_cells - 1))
+    cells2 = cells2.set_index('cell', divisions=cells1.divisions)
+    mindist = 2 * np.sin(np.radians(dist) / 2.)
+    meta = _match_cells(cells1._meta, cells2._meta, mindist)
+    return dd.map_partitions(_match_cells, cells1, cells2, mindist, meta=meta).compute()
+
+
+def _dask_frame(df, npartitions=None):
+    if isinstance(df, dd.DataFrame):
+        return df
+    return dd.from_pandas(df, npartitions=npartitions or max(1, len(df) // 1000000), sort=False)
+
+
+def _sky_frame(ra, dec, npartitions):
+    """dask dataframe of ``ra`` and ``dec`` and the number of objects in each of its partitions
+    """
+    if isinstance(ra, dd.Series):
+        df = ra.to_frame('ra').assign(dec=dec)
+    else:
+        df = pd.DataFrame({'ra': np.asarray(ra, dtype='float64'), 'dec': np.asarray(dec, dtype='float64')})
+        df = _dask_frame(df, npartitions)
+    lengths = df.map_partitions(len).compute()
+    return df, np.asarray(lengths, dtype='int64')
+
+
+def match_partitioned(ra1, dec1, ra2, dec2, dist, cell_size=1., npartitions=None):
+    """`match_lists` with ``numNei=1``, partitioned on the sky and run as dask tasks
+
+    Objects of the first list are assigned to one cell of a `sky_cells`
+    grid and objects of the second list to every cell within `dist` of
+    them, so each cell is matched on its own and the result is the same as
+    that of `match_lists`: the distance to the nearest neighbour within
+    `dist` (inf if none) and its position in the second list (``len(ra2)``
+    if none).  Everything is in degrees.
+
+    The coordinates are arrays, or dask series (e.g. columns of the same
+    dask dataframe).  Cells are assigned partition by partition and both
+    lists are shuffled by cell into `npartitions` partitions (default: as
+    many as the first list has), so every task only gets the objects of
+    its own cells and only the matches come back to the client.  The tasks
+    run with the current dask scheduler, i.e. on the cluster if a
+    distributed client is active.
+    """
+    df1, lengths1 = _sky_frame(ra1, dec1, npartitions)
+    df2, lengths2 = _sky_frame(ra2, dec2, npartitions)
+    n1, n2 = int(lengths1.sum()), int(lengths2.sum())
+    dist_out = np.full(n1, np.inf)
+    ind_out = np.full(n1, n2)
+    if n1 == 0 or n2 == 0:
+        return dist_out, ind_out
+
+    offsets1 = np.concatenate([[0], np.cumsum(lengths1)[:-1]])
+    offsets2 = np.concatenate([[0], np.cumsum(lengths2)[:-1]])
+    matches = _match_frames(df1, df2, dist, cell_size, npartitions, offsets1, offsets2)
+    dist_out[matches['id1'].to_numpy()] = matches['dist'].to_numpy()
+    ind_out[matches['id1'].to_numpy()] = matches['id2'].to_numpy()
+    return dist_out, ind_out
+
+
+def match_frames(df1, df2, dist, cell_size=1., npartitions=None, keep=()):
+    """Matches of the objects of `df1` in `df2` within `dist` degrees, by index label
+
+    `df1` and `df2` are pandas or dask dataframes with ``ra`` and ``dec``
+    columns, matched like `match_partitioned` without collecting them on
+    the client.  Returns a `pandas.DataFrame` of the labels ``id1`` and
+    ``id2`` of the matched objects, their distance ``dist`` in degrees and
+    the `keep` columns of `df1`.
+    """
+    df1 = _dask_frame(df1[['ra', 'dec', *keep]], npartitions)
+    df2 = _dask_frame(df2[['ra', 'dec']], npartitions)
+    return _match_frames(df1, df2, dist, cell_size, npartitions, keep=keep)
+
+
+def _hash_summary(keys, hashes):
+    """Count, wrapping sum and xor of the uint64 `hashes` of each key
+
+    These order-independent summaries of the same objects can be combined
+    over partitions (see `_combine_summaries`).
+    """
+    order = np.argsort(keys, kind='stable')
+    keys, hashes = keys[order], hashes[order]
+    uniq, starts = np.unique(keys, return_index=True)
+    return pd.DataFrame({
+        'key': uniq,
+        'n': np.diff(np.append(starts, len(keys))).astype('int64'),
+        'hsum': np.add.reduceat(hashes, starts) if len(keys) else hashes[:0],
+        'hxor': np.bitwise_xor.reduceat(hashes, starts) if len(keys) else hashes[:0],
+    })
+
+
+def _combine_summaries(summaries):
+    summaries = summaries.sort_values('key', kind='stable')
+    keys = summaries['key'].to_numpy()
+    uniq, starts = np.unique(keys, return_index=True)
+    if not len(keys):
+        return summaries.reset_index(drop=True)
+    return pd.DataFrame({
+        'key': uniq,
+        'n': np.add.reduceat(summaries['n'].to_numpy(), starts),
+        'hsum': np.add.reduceat(summaries['hsum'].to_numpy(dtype='uint64'), starts),
+        'hxor': np.bitwise_xor.reduceat(summaries['hxor'].to_numpy(dtype='uint64'), starts),
+    })
+
+
+def _object_hashes(df):
+    return pd.util.hash_pandas_object(df[['ra', 'dec']], index=True).to_numpy()
+
+
+def _tract_cell_summary(df, cell_size, n_cells):
+    """Hash summaries of the objects of a partition by (tract, sky cell), as ``tract * n_cells + cell``
+    """
+    cells, index = sky_cells(df['ra'], df['dec'], cell_size)
+    if 'tract' in df.columns:
+        tracts = df['tract'].to_numpy(dtype='int64')[index]
+    else:
+        tracts = np.zeros(len(index), dtype='int64')
+    return _hash_summary(tracts * n_cells + cells, _object_hashes(df)[index])
+
+
+def _cell_summary(df, cell_size, margin):
+    """Hash summaries of the objects of a partition within `margin` of each sky cell
+    """
+    cells, index = sky_cells(df['ra'], df['dec'], cell_size, margin)
+    return _hash_summary(cells.astype('int64'), _object_hashes(df)[index])
+
+
+def _summarize(df, fn, *args):
+    """`fn` of each partition of a pandas or dask frame, combined
+    """
+    if isinstance(df, dd.DataFrame):
+        meta = fn(df._meta, *args)
+        summaries = df.map_partitions(fn, *args, meta=meta).compute()
+    else:
+        summaries = fn(df, *args)
+    return _combine_summaries(summaries)
+
+
+class MatchRegistry(object):
+    """Directory of Parquet files caching `match_frames` results by tract
+
+    The matches of the objects of each tract of the first catalog are
+    stored under a fingerprint of those objects, of the objects of the
+    second catalog within the match radius of their sky cells (the only
+    possible matches) and of the radius.  A tract is only matched again
+    when one of these changed, and tracts are matched all at once.
+
+    The fingerprints are combined from order-independent hash summaries
+    of each partition by tract and sky cell, so pandas and dask catalogs
+    are fingerprinted without collecting them on the client.
+
+    Parameters
+    ----------
+    path : `str`
+        Directory of the registry; created if needed.
+    cell_size : `float`
+        Size in degrees of the sky cells of `match_frames`.
+    """
+
+    VERSION = 2
+
+    def __init__(self, path, cell_size=1.):
+        self.path = Path(path)
+        self.path.mkdir(parents=True, exist_ok=True)
+        self.cell_size = cell_size
+
+    def _file(self, key):
+        return self.path.joinpath(f"{key}.parquet")
+
+    def fingerprints(self, df1, df2, radius):
+        """Registry key of each tract of `df1`
+
+        `df1` and `df2` are pandas or dask dataframes with ``ra`` and
+        ``dec`` columns; without an integer ``tract`` column in `df1` it is
+        treated as a single tract.
+        """
+        n_cells = int(_cell_layout(self.cell_size)[1].sum())
+        columns1 = [c for c in ['ra', 'dec', 'tract'] if c in df1.columns]
+        summary1 = _summarize(df1[columns1], _tract_cell_summary, self.cell_size, n_cells)
+        summary2 = _summarize(df2[['ra', 'dec']], _cell_summary, self.cell_size, radius / 3600.)
+        summary2 = summary2.set_index('key')
+
+        keys = {}
+        tracts, cells = np.divmod(summary1['key'].to_numpy(), n_cells)
+        for tract in np.unique(tracts):
+            own = summary1[tracts == tract]
+            candidates = summary2.loc[summary2.index.intersection(cells[tracts == tract])].sort_index()
+            key = json.dumps([
+                self.VERSION, radius, str(tract),
+                [int(own['n'].sum()), int(np.add.reduce(own['hsum'].to_numpy(dtype='uint64'))),
+                 int(np.bitwise_xor.reduce(own['hxor'].to_numpy(dtype='uint64')))],
+                candidates.astype('int64').reset_index().to_numpy().tolist(),
+            ])
+            keys[int(tract)] = hashlib.sha1(key.encode()).hexdigest()
+        return keys
+
+    def match(self, df1, df2, radius):
+        """Matches of `df1` objects in `df2` within `radius` arcsec, reusing registered tracts
+
+        `df1` and `df2` are pandas or dask dataframes (see `fingerprints`).
+
+        Returns
+        -------
+        id1, id2 : `pandas.Index`
+            Labels of the matched objects in `df1` and `df2`.
+        distance : `pandas.Series`
+            Match distance in arcsec, indexed by `id1`.
+        """
+        frames, todo = [], {}
+        for tract, key in self.fingerprints(df1, df2, radius).items():
+            if self._file(key).exists():
+                frames.append(pd.read_parquet(self._file(key)))
+            else:
+                todo[tract] = key
+        fmtArgs = len(frames), len(todo)
+        logging.info('{0} tract(s) read from the match registry, {1} to match.'.format(*fmtArgs))
+
+        if todo:
+            if 'tract' in df1.columns:
+                df1 = df1[df1['tract'].isin(list(todo))]
+            else:
+                df1 = df1.assign(tract=0)
+            matched = match_frames(df1, df2, radius / 3600., cell_size=self.cell_size, keep=['tract'])
+            matched = matched.assign(match_distance=matched['dist'] * 3600)
+            for tract, key in todo.items():
+                part = matched[matched['tract'] == tract][['id1', 'id2', 'match_distance']]
+                part = part.reset_index(drop=True)
+                tmp = self._file(key).with_suffix('.tmp')
+                part.to_parquet(tmp, index=False)
+                tmp.replace(self._file(key))
+                frames.append(part)
+
+        if not frames:
+            return pd.Index([]), pd.Index([]), pd.Series([], dtype=float, name='match_distance')
+        df = pd.concat(frames, ignore_index=True)
+        id1 = pd.Index(df['id1'])
+        distance = pd.Series(df['match_distance'].to_numpy(), index=id1, name='match_distance')
+        return id1, pd.Index(df['id2']), distance
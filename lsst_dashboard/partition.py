@@ -1,16 +1,32 @@
+import os
+import pickle
+
 import distributed
-from dask import delayed
 from kartothek.io.dask.dataframe import update_dataset_from_ddf, read_dataset_as_ddf
 from kartothek.io.eager import read_dataset_as_dataframes
-from storefact import get_store_from_url
 from functools import partial
 import pandas as pd
 import numpy as np
-import dask.dataframe as dd
 import dask.array as da
-from tqdm import tqdm
 
-from lsst.daf.persistence import Butler
+from .aggregates import (
+    CUBE_COLUMNS,
+    HistogramCube,
+    SkyPyramid,
+    build_pyramid,
+    combine_aggregates,
+    cube_y_ranges,
+    file_histogram_cells,
+    file_sky_aggregates,
+)
+from .compact import CompactSchema
+from .ingest import ddf_from_files, describe_chunks, file_footprints, plan_chunks
+from .layout import StorageLayout
+from .manifest import update_manifest
+from .progressive import SAMPLE_FRAC, file_sample
+from .sketch import DEFAULT_PERCENTILES, rollup, sketch_parquet_files
+from .spatial import COVERAGE_COLUMNS, add_hpix, file_coverage
+from .storage import get_store, load_dataset_metadata, partition_frame, read_schema
 
 
 def get_metrics():
@@ -64,13 +80,31 @@ class DatasetPartitioner(object):
     categories = ["filter", "tract"]
     bucket_by = "patch"
     _default_dataset = None
-    df_chunk_size = 20
+    # maximum uncompressed input bytes per chunk written by `partition_filt` (unless a single file is larger)
+    chunk_bytes = 4 * 1024 ** 3
+    # summarize each column over its own valid values rather than dropping
+    # every row that has a NaN/inf in any column
+    stats_dropna_rows = False
+    # write_{step} methods run, in order, by `lsst_data_repartition` after `partition`
+    post_steps = ("coverage", "pyramid", "sample", "stats", "cube")
 
     def __init__(
-        self, butlerpath, destination=None, dataset=None, engine="pyarrow", sample_frac=None, num_buckets=8,
+        self,
+        butlerpath,
+        destination=None,
+        dataset=None,
+        engine="pyarrow",
+        sample_frac=None,
+        num_buckets=8,
+        butler=None,
+        n_threads=16,
+        chunk_bytes=None,
+        compact=False,
+        layout=None,
     ):
 
-        self._butler = Butler(butlerpath)
+        self.butlerpath = butlerpath
+        self._butler = butler
         if dataset is None:
             dataset = self._default_dataset
 
@@ -82,14 +116,32 @@ class DatasetPartitioner(object):
         self.num_buckets = num_buckets
 
         self.stats_path = f"{self.destination}/{self.dataset}_stats.parq"
+        self.stats_partitions_path = f"{self.destination}/{self.dataset}_stats_partitions.parq"
+        self.sketches_path = f"{self.destination}/{self.dataset}_sketches.pkl"
+        self.manifest_path = f"{self.destination}/{self.dataset}_manifest.parq"
+        self.coverage_path = f"{self.destination}/{self.dataset}_coverage.parq"
+        self.pyramid_path = f"{self.destination}/{self.dataset}_pyramid.parq"
+        self.cube_path = f"{self.destination}/{self.dataset}_cube.parq"
+        self.compact_path = f"{self.destination}/{self.dataset}_compact.yaml"
+        self.sample_path = f"{self.destination}/{self.dataset}_sample.parq"
+        self.n_threads = n_threads
+        if chunk_bytes is not None:
+            self.chunk_bytes = chunk_bytes
+        self.compact = compact
+        if isinstance(layout, str):
+            layout = StorageLayout.parse(layout)
+        self.layout = layout
+        self._compact_schema = None
 
         self._store = None
         self.engine = engine
         self.metadata = self.butler.get("qaDashboard_info")
 
-        self.dataIds = [
-            dataId for dataId in self.iter_dataId() if self.butler.datasetExists(self.dataset, dataId)
-        ]
+        self.manifest = update_manifest(
+            self.butler, self.dataset, list(self.iter_dataId()), self.manifest_path, n_threads=self.n_threads
+        )
+        self.manifest = self.manifest[self.manifest["filename"].notnull()].reset_index(drop=True)
+        self.dataIds = self.manifest.drop(columns="filename").to_dict("records")
 
         self.filters = [filt for filt in self.metadata["visits"].keys()]
         self.dataIds_by_filter = {
@@ -100,7 +152,7 @@ class DatasetPartitioner(object):
         self._filenames_by_filter = None
 
     def __getstate__(self):
-        d = self.__dict__
+        d = dict(self.__dict__)
         d["_butler"] = None
         d["_store"] = None
         return d
@@ -111,13 +163,15 @@ class DatasetPartitioner(object):
     @property
     def store(self):
         if self._store is None:
-            self._store = partial(get_store_from_url, "hfs://" + self.destination)
+            self._store = get_store(self.destination)
         return self._store
 
     @property
     def butler(self):
         if self._butler is None:
-            self._butler = Butler(butlerpath)
+            from lsst.daf.persistence import Butler
+
+            self._butler = Butler(self.butlerpath)
         return self._butler
 
     def iter_dataId(self):
@@ -128,12 +182,12 @@ class DatasetPartitioner(object):
 
     @property
     def filenames(self):
+        """Input file of each dataId, as resolved in the manifest
+        """
         if self._filenames is None:
-            filenames = []
+            filenames = list(self.manifest["filename"])
             filenames_by_filter = {filt: [] for filt in self.filters}
-            for dataId in tqdm(self.dataIds, desc=f"Getting filenames for {self.dataset} from Butler"):
-                filename = self.butler.get(self.dataset, **dataId).filename
-                filenames.append(filename)
+            for dataId, filename in zip(self.dataIds, filenames):
                 filenames_by_filter[dataId["filter"]].append(filename)
             self._filenames = filenames
             self._filenames_by_filter = filenames_by_filter
@@ -161,12 +215,53 @@ class DatasetPartitioner(object):
             .replace(-np.inf, np.nan)
             .rename(columns={"patchId": "patch", "ccdId": "ccd"})
         )
+        df = df.map_partitions(add_hpix, meta=add_hpix(df._meta))
 
-        if self.categories:
-            df = df.categorize(columns=self.categories)
+        unknown = [c for c in self.categories or [] if not df[c].cat.known]
+        if unknown:
+            df = df.categorize(columns=unknown)
 
         return df
 
+    def get_compact_schema(self, df=None):
+        """`CompactSchema` of the dataset
+
+        Read from `compact_path` if a previous run wrote it; otherwise chosen
+        from the first partition of `df` (the first chunk) and saved there.
+        """
+        if self._compact_schema is None:
+            if os.path.exists(self.compact_path):
+                self._compact_schema = CompactSchema.read(self.compact_path)
+            elif df is not None:
+                sample = df.get_partition(0).compute()
+                self._compact_schema = CompactSchema.from_sample(
+                    sample, metrics=self.get_metric_columns() + ["psfMag"], flags=self.get_flag_columns()
+                )
+                os.makedirs(self.destination, exist_ok=True)
+                self._compact_schema.write(self.compact_path)
+                print(
+                    f"... ...compact profile: {len(self._compact_schema.float32_columns)} float32 columns, "
+                    f"{len(self._compact_schema.flag_bits)} packed flags"
+                )
+        return self._compact_schema
+
+    def compact_df(self, df):
+        """Applies the compact storage profile (see `lsst_dashboard.compact`) to a normalized dataframe
+        """
+        schema = self.get_compact_schema(df)
+        return df.map_partitions(schema.compact, meta=schema.compact(df._meta))
+
+    @property
+    def category_values(self):
+        """Values of each categorical dataId key over all dataIds
+
+        Categoricals are attached with these categories at read time, so
+        that dask never has to compute them with `categorize`.
+        """
+        if not self.categories:
+            return None
+        return {c: sorted(set(d[c] for d in self.dataIds)) for c in self.categories}
+
     def get_metric_columns(self):
         return get_metrics()
 
@@ -179,39 +274,67 @@ class DatasetPartitioner(object):
             set(self.get_metric_columns() + self.get_flag_columns() + ["coord_ra", "coord_dec", "patchId"])
         )
 
-    def df_generator(self, dataIds, filenames, columns, msg=None):
-        if msg is None:
-            desc = f"Building dask dataframe for {self.dataset}"
-        else:
-            desc = f"Building dask dataframe for {self.dataset} ({msg})"
-        for filename, dataId in tqdm(zip(filenames, dataIds), desc=desc, total=len(dataIds),):
-            df = delayed(pd.read_parquet(filename, columns=columns, engine=self.engine))
-            df = delayed(pd.DataFrame.assign)(df, **dataId)
-            yield df
-
     def get_df(self, dataIds, filenames, msg=None):
+        """Lazy dask dataframe of the input files, one partition per file (see `ingest.ddf_from_files`)
+        """
         columns = self.get_columns()
 
         if len(dataIds) > 0:
-            df = dd.from_delayed(self.df_generator(dataIds, filenames, columns, msg=msg))
+            desc = self.dataset if msg is None else f"{self.dataset} ({msg})"
+            print(f"... ...building dask dataframe of {len(filenames)} files for {desc}")
+            df = ddf_from_files(
+                filenames, dataIds, columns=columns, engine=self.engine, category_values=self.category_values
+            )
 
             if self.sample_frac:
                 df = df.sample(frac=self.sample_frac)
 
             df = self.normalize_df(df)
+            if self.compact:
+                df = self.compact_df(df)
 
             return df
         else:
             return None
 
-    def iter_df_chunks(self, filt):
+    def plan_chunks(self, filt, exclude=None):
+        """Splits the input files of a filter into chunks of at most `chunk_bytes`
+
+        Sizes are estimated from the Parquet footers (uncompressed size of
+        the columns read), so tracts or visits with many sources do not
+        produce oversized chunks.  dataIds whose value tuple is in `exclude`
+        are left out.  Returns the list of chunks (positions in
+        ``dataIds_by_filter[filt]``) and the chunk summary table.
+        """
+        exclude = exclude or set()
+        dataIds = self.dataIds_by_filter[filt]
+        positions = [i for i, d in enumerate(dataIds) if tuple(d.values()) not in exclude]
+        filenames = [self.filenames_by_filter[filt][i] for i in positions]
+        footprints = file_footprints(filenames, columns=self.get_columns(), n_threads=self.n_threads)
+        chunks = plan_chunks(footprints["bytes"], self.chunk_bytes)
+        summary = describe_chunks(chunks, footprints)
+        return [[positions[j] for j in chunk] for chunk in chunks], summary
+
+    def iter_df_chunks(self, filt, exclude=None):
+        """Yields (dataIds, dask dataframe) of each planned chunk of a filter
+        """
         dataIds = self.dataIds_by_filter[filt]
         filenames = self.filenames_by_filter[filt]
 
-        n_chunks = len(dataIds) // self.df_chunk_size
-        for i in range(n_chunks):
+        chunks, summary = self.plan_chunks(filt, exclude=exclude)
+        if chunks:
+            print(
+                f"... ...{self.dataset} ({filt}): {summary['files'].sum()} files in {len(chunks)} chunks "
+                f"of {summary['MB'].min():.0f}-{summary['MB'].max():.0f} MB "
+                f"(target {self.chunk_bytes / 1024 ** 2:.0f} MB)"
+            )
+            print(summary.to_string())
+
+        n_chunks = len(chunks)
+        for i, chunk in enumerate(chunks):
             msg = f"{filt}, {i + 1} of {n_chunks}"
-            yield self.get_df(dataIds[i::n_chunks], filenames[i::n_chunks], msg=msg)
+            chunk_dataIds = [dataIds[j] for j in chunk]
+            yield chunk_dataIds, self.get_df(chunk_dataIds, [filenames[j] for j in chunk], msg=msg)
 
     @property
     def ktk_kwargs(self):
@@ -223,34 +346,54 @@ class DatasetPartitioner(object):
             num_buckets=self.num_buckets,
             bucket_by=self.bucket_by,
             partition_on=self.partition_on,
+            sort_partitions_by="hpix",
+            df_serializer=None if self.layout is None else self.layout.serializer(),
         )
 
-    def partition_filt(self, filt, chunk_dfs=True):
+    def _update_dataset(self, df, dataIds, journal=None, filt=None, chunk=None):
+        """Commits `df` to the kartothek dataset and records it in `journal`
+        """
+        if df is None:
+            return
+        graph = update_dataset_from_ddf(df, **self.ktk_kwargs)
+        graph.compute()
+        if journal is not None:
+            journal.record_chunk(self.dataset, filt, chunk, dataIds)
+
+    def partition_filt(self, filt, chunk_dfs=True, journal=None):
         """Write partitioned dataset using kartothek
+
+        dataIds already committed according to `journal` are skipped.
         """
+        exclude = journal.committed_dataIds(self.dataset) if journal is not None else set()
+
         if chunk_dfs:
-            for i, df in enumerate(self.iter_df_chunks(filt)):
-                if df is not None:
-                    print(f"... ...ktk repartitioning {self.dataset} ({filt}, chunk {i + 1})")
-                    graph = update_dataset_from_ddf(df, **self.ktk_kwargs)
-                    graph.compute()
+            for i, (dataIds, df) in enumerate(self.iter_df_chunks(filt, exclude=exclude)):
+                print(f"... ...ktk repartitioning {self.dataset} ({filt}, chunk {i + 1})")
+                self._update_dataset(df, dataIds, journal=journal, filt=filt, chunk=i)
         else:
-            df = get_df(self.dataIds_by_filter[filt], self.filenames_by_filter[filt])
+            dataIds, filenames = self._remaining(
+                self.dataIds_by_filter[filt], self.filenames_by_filter[filt], exclude
+            )
+            print(f"... ...ktk repartitioning {self.dataset} ({filt})")
+            self._update_dataset(self.get_df(dataIds, filenames), dataIds, journal=journal, filt=filt)
 
-            if df is not None:
-                print(f"... ...ktk repartitioning {self.dataset} ({filt}, chunk {i + 1})")
-                graph = update_dataset_from_ddf(df, **self.ktk_kwargs)
-                graph.compute()
+    @staticmethod
+    def _remaining(dataIds, filenames, exclude):
+        keep = [i for i, d in enumerate(dataIds) if tuple(d.values()) not in exclude]
+        return [dataIds[i] for i in keep], [filenames[i] for i in keep]
 
-    def partition(self, chunk_by_filter=True, chunk_dfs=True):
+    def partition(self, chunk_by_filter=True, chunk_dfs=True, journal=None):
+        """Repartitions all dataIds (that are not yet committed according to `journal`)
+        """
         if chunk_by_filter:
             for filt in self.filters:
-                self.partition_filt(filt, chunk_dfs=chunk_dfs)
+                self.partition_filt(filt, chunk_dfs=chunk_dfs, journal=journal)
         else:
-            df = self.get_df(self.dataIds, self.filenames)
+            exclude = journal.committed_dataIds(self.dataset) if journal is not None else set()
+            dataIds, filenames = self._remaining(self.dataIds, self.filenames, exclude)
             print(f"... ...ktk repartitioning {self.dataset}")
-            graph = update_dataset_from_ddf(df, **self.ktk_kwargs)
-            graph.compute()
+            self._update_dataset(self.get_df(dataIds, filenames), dataIds, journal=journal)
 
     def load_from_ktk(self, predicates, columns=None, dask=True):
         ktk_kwargs = dict(
@@ -279,42 +422,271 @@ class DatasetPartitioner(object):
                 print(f"No {self.dataset} data available for {dataId}, columns={columns}")
                 return pd.DataFrame()
 
-    def describe_dataId(self, dataId, dask=False, **kwargs):
-        df = self.load_dataId(dataId, dask=dask)
-        return df.replace(np.inf, np.nan).replace(-np.inf, np.nan).dropna(how="any").describe(**kwargs)
+    def get_sketches(self, dataIds=None):
+        """Streaming stats sketches of each dataId, computed on the dask cluster
 
-    def get_stats_list(self, dataIds=None):
+        Each task reads the partition files of one dataId a row group at a
+        time, so worker memory is bounded by the row group size.
+        """
         if dataIds is None:
             dataIds = self.dataIds
 
-        fn = partial(describe_dataId, store=self.store, dataset=self.dataset)
+        files = self.get_partition_files()
+        fn = partial(sketch_parquet_files, store=self.store, dropna_rows=self.stats_dropna_rows)
 
         client = distributed.client.default_client()
 
-        futures = client.map(fn, dataIds)
+        futures = client.map(fn, [files.get(self._dataId_key(dataId), []) for dataId in dataIds])
         results = client.gather(futures)
         return results
 
+    def get_stats_list(self, dataIds=None, percentiles=DEFAULT_PERCENTILES):
+        return [sketch.describe(percentiles) for sketch in self.get_sketches(dataIds)]
+
+    def stats_from_sketches(self, sketches, keys, percentiles=DEFAULT_PERCENTILES):
+        """Stats table indexed by (*keys, statistic) from sketches by dataId tuple
+
+        Without any sketch of data, the table has no rows and the metric columns.
+        """
+        dfs = []
+        for key, sketch in sketches.items():
+            if not sketch.columns:
+                continue
+            stats = sketch.describe(percentiles)
+            index = pd.MultiIndex.from_tuples([(*key, s) for s in stats.index], names=[*keys, "statistic"])
+            dfs.append(pd.DataFrame(stats.values, index=index, columns=stats.columns))
+
+        if not dfs:
+            index = pd.MultiIndex.from_tuples([], names=[*keys, "statistic"])
+            return pd.DataFrame(index=index, columns=sorted(self.get_metric_columns()), dtype="float64")
+        return pd.concat(dfs, sort=True)
+
+    def compute_sketches(self, dataIds=None):
+        if dataIds is None:
+            dataIds = self.dataIds
+        return dict(zip([tuple(d.values()) for d in dataIds], self.get_sketches(dataIds)))
+
     def compute_stats(self, dataIds=None):
         if dataIds is None:
             dataIds = self.dataIds
+        return self.stats_from_sketches(self.compute_sketches(dataIds), list(dataIds[0].keys()))
 
-        stats_list = self.get_stats_list(dataIds)
+    def load_sketches(self):
+        """Stats sketches by dataId tuple, as saved by `write_stats`
+        """
+        if not os.path.exists(self.sketches_path):
+            return {}
+        with open(self.sketches_path, "rb") as f:
+            return pickle.load(f)
 
-        dfs = []
-        for dataId, stats in zip(dataIds, stats_list):
-            index = pd.MultiIndex.from_tuples(
-                [(*dataId.values(), s) for s in stats.index], names=[*dataId.keys(), "statistic"]
-            )
-            columns = stats.columns
-            df = pd.DataFrame(stats.values, index=index, columns=columns)
-            dfs.append(df)
+    def rollup_stats(self, by=("filter",), percentiles=DEFAULT_PERCENTILES):
+        """Stats rolled up to `by` keys (e.g. per filter) by merging the saved sketches
+        """
+        keys = list(self.dataIds[0].keys())
+        sketches = rollup(self.load_sketches(), keys, list(by))
+        return self.stats_from_sketches(sketches, list(by), percentiles)
+
+    def _partitions_by_dataId(self):
+        dm = load_dataset_metadata(self.dataset, self.store, load_schema=False)
+        partitions = partition_frame(dm)
+        return {
+            tuple(str(k) for k in key): df for key, df in partitions.groupby(list(self.partition_on), sort=False)
+        }
 
-        return pd.concat(dfs, sort=True)
+    def get_partition_files(self):
+        """Partition file keys of each dataId, keyed by ``_dataId_key(dataId)``
+        """
+        return {key: list(df["file"]) for key, df in self._partitions_by_dataId().items()}
 
-    def write_stats(self, dataIds=None):
-        stats = self.compute_stats(dataIds=dataIds)
-        stats.to_parquet(self.stats_path)
+    def _dataId_key(self, dataId):
+        return tuple(str(dataId[k]) for k in self.partition_on)
+
+    def get_partition_labels(self):
+        """Current kartothek partition labels of each dataId
+
+        Returns a dict mapping ``_dataId_key(dataId)`` to a frozenset of labels.
+        Rewriting or appending data for a dataId always creates new labels.
+        """
+        return {key: frozenset(df.index) for key, df in self._partitions_by_dataId().items()}
+
+    def read_stats_partitions(self):
+        """Partition labels of each dataId at the time stats were last written
+        """
+        if not os.path.exists(self.stats_partitions_path):
+            return {}
+        df = pd.read_parquet(self.stats_partitions_path)
+        keys = list(self.partition_on)
+        return {key: frozenset(d["label"]) for key, d in df.groupby(keys, sort=False)}
+
+    def write_stats_partitions(self, partitions):
+        keys = list(self.partition_on)
+        records = [dict(zip(keys, key), label=label) for key, labels in partitions.items() for label in labels]
+        pd.DataFrame.from_records(records, columns=keys + ["label"]).to_parquet(self.stats_partitions_path)
+
+    def get_changed_dataIds(self, dataIds=None, partitions=None):
+        """dataIds whose partitions were added or rewritten since stats were last written
+        """
+        if dataIds is None:
+            dataIds = self.dataIds
+        if partitions is None:
+            partitions = self.get_partition_labels()
+        previous = self.read_stats_partitions()
+
+        return [
+            dataId
+            for dataId in dataIds
+            if self._dataId_key(dataId) not in previous
+            or previous[self._dataId_key(dataId)] != partitions.get(self._dataId_key(dataId), frozenset())
+        ]
+
+    def write_stats(self, dataIds=None, incremental=True):
+        """Computes stats and writes them to `stats_path`
+
+        With `incremental`, only dataIds whose kartothek partitions changed
+        since the last run are recomputed and merged into the existing stats.
+        Only the partitions of the dataIds computed are recorded as done, so
+        dataIds left out of a run with a subset of `dataIds` are still
+        computed by the next one.
+        """
+        if dataIds is None:
+            dataIds = self.dataIds
+        partitions = self.get_partition_labels()
+
+        existing = None
+        recorded = {}
+        if incremental and os.path.exists(self.stats_path):
+            existing = pd.read_parquet(self.stats_path)
+            recorded = self.read_stats_partitions()
+            dataIds = self.get_changed_dataIds(dataIds, partitions=partitions)
+            print(f"... ...{len(dataIds)} {self.dataset} dataIds changed since stats were last written")
+
+        if dataIds:
+            sketches = self.compute_sketches(dataIds)
+            stats = self.stats_from_sketches(sketches, list(dataIds[0].keys()))
+            if existing is not None:
+                changed = pd.MultiIndex.from_tuples(list(sketches.keys()))
+                keep = ~existing.index.droplevel("statistic").isin(changed)
+                stats = pd.concat([existing[keep], stats], sort=True)
+                sketches = {**self.load_sketches(), **sketches}
+            stats.sort_index().to_parquet(self.stats_path)
+
+            with open(self.sketches_path, "wb") as f:
+                pickle.dump(sketches, f)
+
+        for dataId in dataIds:
+            key = self._dataId_key(dataId)
+            recorded[key] = partitions.get(key, frozenset())
+        self.write_stats_partitions(recorded)
+
+    def write_coverage(self):
+        """Writes the sky coverage table of the partition files to `coverage_path`
+
+        Only files that are not yet in the existing table are read, on the
+        dask cluster; rows of files no longer in the dataset are dropped.
+        See `lsst_dashboard.spatial.coverage_table`.
+        """
+        dm = load_dataset_metadata(self.dataset, self.store, load_schema=False)
+        files = list(partition_frame(dm)["file"])
+
+        existing = pd.DataFrame(columns=COVERAGE_COLUMNS)
+        if os.path.exists(self.coverage_path):
+            existing = pd.read_parquet(self.coverage_path)
+            existing = existing[existing["file"].isin(files)]
+        todo = sorted(set(files) - set(existing["file"]))
+
+        print(f"... ...computing sky coverage of {len(todo)} {self.dataset} partition files")
+        frames = [existing] if len(existing) else []
+        if todo:
+            client = distributed.client.default_client()
+            frames += client.gather(client.map(partial(file_coverage, store=self.store), todo))
+        frames = [df for df in frames if len(df)] or [pd.DataFrame(columns=COVERAGE_COLUMNS)]
+
+        coverage = pd.concat(frames, ignore_index=True).sort_values(["file", "row_group", "hpix"])
+        coverage.reset_index(drop=True).to_parquet(self.coverage_path)
+
+    def write_pyramid(self, metrics=None):
+        """Writes the multi-resolution sky aggregates of each filter and tract to `pyramid_path`
+
+        Each partition file is aggregated at the finest level on the dask
+        cluster; the coarser levels are derived from those per (filter,
+        tract), so that the dashboard can sum the selected tracts.  See
+        `lsst_dashboard.aggregates.SkyPyramid`.
+        """
+        if metrics is None:
+            metrics = sorted(set(self.get_metric_columns()) | {"psfMag"})
+        dm = load_dataset_metadata(self.dataset, self.store, load_schema=False)
+        partitions = partition_frame(dm)
+
+        print(f"... ...computing sky aggregates of {len(partitions)} {self.dataset} partition files")
+        client = distributed.client.default_client()
+        fn = partial(file_sky_aggregates, store=self.store, metrics=metrics)
+        aggregates = client.gather(client.map(fn, list(partitions["file"])))
+
+        tiles = []
+        groups = partitions.reset_index().groupby(["filter", "tract"], sort=True).groups
+        for (filt, tract), positions in groups.items():
+            finest = combine_aggregates([aggregates[i] for i in positions])
+            if finest is not None:
+                tiles.append(build_pyramid(finest).assign(filter=filt, tract=tract))
+
+        if tiles:
+            SkyPyramid(pd.concat(tiles, ignore_index=True, sort=False)).write(self.pyramid_path)
+
+    def write_sample(self, frac=SAMPLE_FRAC):
+        """Writes the deterministic sample of the dataset used for progressive loading to `sample_path`
+
+        See `lsst_dashboard.progressive`; rows are sorted by partition keys
+        so that reads of a filter or tract only touch its row groups.
+        """
+        dm = load_dataset_metadata(self.dataset, self.store)
+        partitions = partition_frame(dm, schema=read_schema(self.dataset, self.store, dataset_metadata=dm))
+        keys = [c for c in partitions.columns if c != "file"]
+
+        print(f"... ...sampling {frac:.1%} of {len(partitions)} {self.dataset} partition files")
+        client = distributed.client.default_client()
+        futures = [
+            client.submit(file_sample, row.file, self.store, frac, {k: getattr(row, k) for k in keys})
+            for row in partitions.itertuples()
+        ]
+        frames = [df for df in client.gather(futures) if len(df)]
+        if frames:
+            sample = pd.concat(frames, ignore_index=True).sort_values(keys, kind="mergesort")
+            sample.to_parquet(self.sample_path, index=False, row_group_size=100000)
+
+    def write_cube(self):
+        """Writes the psfMag-vs-metric `HistogramCube` of each (filter, tract) to `cube_path`
+
+        The metric bin ranges come from the per-filter stats, so this runs
+        after `write_stats`.
+        """
+        stats = self.rollup_stats(by=("filter",))
+        metrics = [c for c in self.get_metric_columns() if c in stats.columns]
+        y_ranges = cube_y_ranges(stats[metrics])
+        dm = load_dataset_metadata(self.dataset, self.store)
+        partitions = partition_frame(dm, schema=read_schema(self.dataset, self.store, dataset_metadata=dm))
+        partitions = partitions[partitions["filter"].isin(list(y_ranges))]
+
+        print(f"... ...computing histogram cubes of {len(partitions)} {self.dataset} partition files")
+        client = distributed.client.default_client()
+        futures = [
+            client.submit(file_histogram_cells, key, self.store, y_ranges[filt])
+            for key, filt in zip(partitions["file"], partitions["filter"])
+        ]
+        frames = [
+            cells.assign(filter=filt, tract=tract)
+            for cells, filt, tract in zip(client.gather(futures), partitions["filter"], partitions["tract"])
+            if len(cells)
+        ]
+        if not frames:
+            return
+
+        cells = pd.concat(frames, ignore_index=True)
+        cells = cells.groupby(["filter", "tract", "metric", "ix", "iy"], sort=True).sum().reset_index()
+        ranges = pd.DataFrame.from_records(
+            [(filt, metric, lo, hi) for filt, r in y_ranges.items() for metric, (lo, hi) in r.items()],
+            columns=["filter", "metric", "y_min", "y_max"],
+        )
+        HistogramCube(cells.merge(ranges, on=["filter", "metric"])[CUBE_COLUMNS]).write(self.cube_path)
 
     def load_stats(self, columns=None):
         if not os.path.exists(self.stats_path):
@@ -346,7 +718,8 @@ class VisitPartitioner(DatasetPartitioner):
     categories = None  # ["filter", "tract"] Some visit datasets are erroring on categorization
     bucket_by = "ccd"
     _default_dataset = "analysisVisitTable"
-    df_chunk_size = 80
+    # the coverage, pyramid, sample and cube sidecars are only read for coadd tables
+    post_steps = ("stats",)
 
     def get_metric_columns(self):
         return list(
@@ -370,25 +743,3 @@ class VisitPartitioner(DatasetPartitioner):
                 for visit in d["visits"][filt][tract]:
                     yield {"filter": filt, "tract": tract, "visit": visit}
 
-
-def describe_dataId(
-    dataId, store, dataset, columns=None, percentiles=[0.01, 0.05, 0.25, 0.5, 0.75, 0.95, 0.99]
-):
-    """This wasn't working as a method with client.map because of deserialization problem
-    """
-    predicates = [[(k, "==", v) for k, v in dataId.items()]]
-    ktk_kwargs = dict(
-        dataset_uuid=dataset,
-        predicates=predicates,
-        store=store,
-        tables=["table"],
-        columns={"table": columns},
-    )
-
-    df = read_dataset_as_dataframes(**ktk_kwargs)[0]["table"]
-    return (
-        df.replace(np.inf, np.nan)
-        .replace(-np.inf, np.nan)
-        .dropna(how="any")
-        .describe(percentiles=percentiles)
-    )
@@ -1,6 +1,8 @@
 # from profilehooks import profile
 from functools import partial
 
+import dask
+import dask.dataframe as dd
 import param
 import panel as pn
 import numpy as np
@@ -44,6 +46,23 @@ logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
 
+def empty(element):
+    """`element` without its rows; dask-backed data is not computed
+    """
+    if isinstance(element.data, dd.DataFrame):
+        return element.clone(element.data._meta)
+    return element.iloc[:0]
+
+
+def describe(df):
+    """count, mean and std of the columns of `df`, aggregated on the workers for dask frames
+    """
+    count, mean, std = df.count(), df.mean(), df.std()
+    if isinstance(df, dd.DataFrame):
+        count, mean, std = dask.compute(count, mean, std)
+    return pd.DataFrame({'count': count, 'mean': mean, 'std': std}).T
+
+
 # Define Stream class that stores filters for various Dimensions
 class FilterStream(Stream):
     """
@@ -140,10 +159,10 @@ class filterpoints(Operation):
         vdims = [dim for dim in dset.dimensions() if dim.name not in kdims]
         pts = hv.Points(dset, kdims=kdims, vdims=vdims)
         if self.p.set_title:
-            ydata = dset.data[self.p.ydim]
-            title = 'mean = {:.3f}, std = {:.3f} ({:.0f})'.format(ydata.mean(),
-                                                                  ydata.std(),
-                                                                  len(ydata))
+            summary = describe(dset.data[[self.p.ydim]])[self.p.ydim]
+            title = 'mean = {:.3f}, std = {:.3f} ({:.0f})'.format(summary['mean'],
+                                                                  summary['std'],
+                                                                  summary['count'])
             pts = pts.relabel(title)
         return pts
 
@@ -165,8 +184,7 @@ class summary_table(Operation):
             cols = [dim.name for dim in dset.vdims]
         else:
             cols = [self.p.ydim]
-        df = ds.data[cols]
-        return hv.Table(df.describe().loc[['count', 'mean', 'std']])
+        return hv.Table(describe(ds.data[cols]))
 
 
 def notify_stream(bounds, filter_stream, xdim, ydim):
@@ -270,6 +288,14 @@ class scattersky(ParameterizedFunction):
 
     scatter_range_stream = param.ClassSelector(default=None, class_=RangeXY)
 
+    cube = param.Parameter(default=None, doc="""
+        Precomputed HistogramCube of the plotted filter and tracts; scatter
+        views spanning more than cube_min_bins of its xdim bins are drawn
+        from it instead of from the points.""")
+
+    cube_min_bins = param.Integer(default=50, doc="""
+        Number of histogram bins along x below which the raw points are shown.""")
+
     # @profile(immediate=True)
     def __call__(self, dset, **params):
         self.p = ParamOverrides(self, params)
@@ -293,13 +319,21 @@ class scattersky(ParameterizedFunction):
         else:
             dec_sampling = None
 
-        x_range = (x0, x1) = dset.range(self.p.xdim)
+        cube = self.p.cube
+        if cube is not None and (cube.xdim != self.p.xdim or self.p.ydim not in cube.metrics):
+            cube = None
+
+        if cube is not None:
+            (x0, x1), (y0, y1) = x_range, y_range = cube.range(self.p.ydim)
+        else:
+            x_range = (x0, x1) = dset.range(self.p.xdim)
+            y_range = (y0, y1) = dset.range(self.p.ydim)
+
         if self.p.x_sampling:
             x_sampling = (x1-x0)/self.p.x_sampling
         else:
             x_sampling = None
 
-        y_range = (y0, y1) = dset.range(self.p.ydim)
         if self.p.y_sampling:
             y_sampling = (y1-y0)/self.p.y_sampling
         else:
@@ -323,6 +357,8 @@ class scattersky(ParameterizedFunction):
             filterpoints, streams=[self.p.filter_stream],
             xdim=self.p.xdim, ydim=self.p.ydim
         )
+        if cube is not None:
+            scatter_pts, cube_image = self._cube_view(scatter_pts, cube, x_range)
         scatter_streams = [scatter_range, PlotSize()]
         scatter_rasterize = rasterize.instance(
             streams=scatter_streams, x_sampling=x_sampling,
@@ -390,12 +426,15 @@ class scattersky(ParameterizedFunction):
                                      [self.p.sky_range_stream,
                                       self.p.scatter_range_stream]))
 
-        raw_scatterpts = filterpoints(dset, xdim=self.p.xdim, ydim=self.p.ydim)
-        raw_scatter = datashade(
-            raw_scatterpts, cmap=list(Greys9[::-1][:5]), streams=scatter_streams,
-            x_sampling=x_sampling, y_sampling=y_sampling
-        )
-        scatter_p = (raw_scatter*scatter_rasterized)
+        if cube is not None:
+            scatter_p = (cube_image*scatter_rasterized)
+        else:
+            raw_scatterpts = filterpoints(dset, xdim=self.p.xdim, ydim=self.p.ydim)
+            raw_scatter = datashade(
+                raw_scatterpts, cmap=list(Greys9[::-1][:5]), streams=scatter_streams,
+                x_sampling=x_sampling, y_sampling=y_sampling
+            )
+            scatter_p = (raw_scatter*scatter_rasterized)
 
         if self.p.show_rawsky:
             raw_skypts = filterpoints(dset, xdim=self.p.xdim, ydim=self.p.ydim)
@@ -423,6 +462,31 @@ class scattersky(ParameterizedFunction):
             opts.Table(width=200)
         )
 
+    def _cube_view(self, scatter_pts, cube, cube_range):
+        """Histogram images for zoomed-out scatter views and points emptied in those views
+        """
+        ydim = self.p.ydim
+        max_span = self.p.cube_min_bins * (cube.x_edges[1] - cube.x_edges[0])
+        zoom_range = RangeXY()
+        if self.p.scatter_range_stream:
+            link_streams(self.p.scatter_range_stream, zoom_range)
+        image = cube.image(ydim).opts(cmap=self.p.scatter_cmap, clone=True)
+        hidden = image.opts(alpha=0, clone=True)
+
+        def zoomed_out(x_range):
+            if not (x_range and all(isfinite(v) for v in x_range)):
+                x_range = cube_range
+            return x_range[1] - x_range[0] > max_span
+
+        def histogram(x_range, y_range):
+            return image if zoomed_out(x_range) else hidden
+
+        def points(pts, x_range, y_range):
+            return empty(pts) if zoomed_out(x_range) else pts
+
+        cube_image = hv.DynamicMap(histogram, streams=[zoom_range])
+        return scatter_pts.apply(points, streams=[zoom_range]), cube_image
+
 
 class multi_scattersky(ParameterizedFunction):
     """Layout of multiple scattersky plots, one for each vdim in dset
@@ -501,6 +565,13 @@ class skyplot(ParameterizedFunction):
 
     bad_flags = param.List(default=[], doc="Flags to ignore")
 
+    pyramid = param.Parameter(default=None, doc="""
+        Precomputed SkyPyramid of the plotted filter; views wider than
+        zoom_threshold are drawn from it instead of from the points.""")
+
+    zoom_threshold = param.Number(default=2.0, doc="""
+        RA span in degrees below which the raw points are shown.""")
+
     def __call__(self, dset, **params):
         self.p = ParamOverrides(self, params)
 
@@ -509,13 +580,21 @@ class skyplot(ParameterizedFunction):
         else:
             vdim = self.p.vdim
 
-        ra_range = (ra0, ra1) = dset.range('ra')
+        pyramid = self.p.pyramid
+        if pyramid is not None and not (len(pyramid.tiles) and vdim in pyramid.metrics):
+            pyramid = None
+
+        ra_range, dec_range = dset.range('ra'), dset.range('dec')
+        if pyramid is not None and not all(isfinite(v) for v in ra_range + dec_range):
+            # no objects loaded (yet): default to the sky covered by the pyramid
+            ra_range, dec_range = pyramid.extent()
+        (ra0, ra1), (dec0, dec1) = ra_range, dec_range
+
         if self.p.ra_sampling:
             xsampling = (ra1-ra0)/self.p.ra_sampling
         else:
             xsampling = None
 
-        dec_range = (dec0, dec1) = dset.range('dec')
         if self.p.dec_sampling:
             ysampling = (dec1-dec0)/self.p.dec_sampling
         else:
@@ -550,10 +629,17 @@ class skyplot(ParameterizedFunction):
             aggregator=aggregator, streams=streams,
             x_sampling=xsampling, y_sampling=ysampling
         )
+        if pyramid is not None:
+            pts, tiles = self._pyramid_view(pts, pyramid, vdim, ra_range, dec_range)
+        else:
+            tiles = None
+
         raster_pts = apply_when(
             pts, operation=rasterize_inst,
             predicate=lambda pts: len(pts) > self.p.max_points
         )
+        if tiles is not None:
+            raster_pts = tiles * raster_pts
         return raster_pts.opts(
             opts.Image(bgcolor='black', colorbar=True, cmap=self.p.cmap,
                        min_height=100, responsive=True, tools=['hover'],
@@ -567,6 +653,39 @@ class skyplot(ParameterizedFunction):
                                         y_range=dec_range)])
         )
 
+    def _pyramid_view(self, pts, pyramid, vdim, ra_range, dec_range):
+        """Pyramid images for zoomed-out views and points emptied in those views
+        """
+        threshold = self.p.zoom_threshold
+        aggregator = self.p.aggregator
+        zoom_range = RangeXY()
+        if self.p.range_stream:
+            link_streams(self.p.range_stream, zoom_range)
+
+        def view(x_range, y_range):
+            if not (x_range and all(isfinite(v) for v in x_range)):
+                x_range = ra_range
+            if not (y_range and all(isfinite(v) for v in y_range)):
+                y_range = dec_range
+            return x_range, y_range
+
+        def zoomed_out(x_range):
+            return x_range[1] - x_range[0] > threshold
+
+        def tiles(x_range, y_range, width, height, scale):
+            x_range, y_range = view(x_range, y_range)
+            if zoomed_out(x_range):
+                return pyramid.image(vdim, x_range, y_range, width or 400, aggregator)
+            xs, ys, values = pyramid.grid(vdim, x_range, y_range, 0, aggregator)
+            return hv.Image((xs, ys, np.full_like(values, np.nan)), kdims=['ra', 'dec'], vdims=[vdim])
+
+        def points(pts, x_range, y_range):
+            x_range, _ = view(x_range, y_range)
+            return empty(pts) if zoomed_out(x_range) else pts
+
+        tiles_dmap = hv.DynamicMap(tiles, streams=[zoom_range, PlotSize()])
+        return pts.apply(points, streams=[zoom_range]), tiles_dmap
+
 
 class skyplot_layout(ParameterizedFunction):
     """Layout of skyplots with linked crosshair
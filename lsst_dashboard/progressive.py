@@ -0,0 +1,217 @@
+"""Progressive loading of coadd selections.
+
+The partitioners write a deterministic sample of the coadd tables (about
+`SAMPLE_FRAC` of the objects, selected by a hash of their position) to
+``{dataset}_sample.parq``.  The dashboard draws its plots from that sample
+first and then refines them while the full selection is loaded one tract at
+a time (`ProgressiveLoad`).  In distributed mode the selection is instead
+persisted on the dask workers (`PersistedLoad`), with the same interface.
+
+The coadd tables carry no object id after repartitioning, so objects are
+identified by their ra/dec; the same objects are in the sample whatever
+the chunking or bucketing of a run.
+"""
+import threading
+import time
+from concurrent.futures import CancelledError, ThreadPoolExecutor, as_completed
+
+import distributed
+import numpy as np
+import pandas as pd
+import pyarrow.parquet as pq
+
+
+SAMPLE_FRAC = 0.01
+
+
+def sample_hash(ra, dec):
+    """Well-mixed uint64 hash of object positions
+    """
+    ra = np.ascontiguousarray(ra, dtype="float64").view("uint64")
+    dec = np.ascontiguousarray(dec, dtype="float64").view("uint64")
+    h = ra * np.uint64(0x9E3779B97F4A7C15) ^ dec * np.uint64(0xC2B2AE3D27D4EB4F)
+    # splitmix64 finalizer
+    h ^= h >> np.uint64(30)
+    h *= np.uint64(0xBF58476D1CE4E5B9)
+    h ^= h >> np.uint64(27)
+    h *= np.uint64(0x94D049BB133111EB)
+    h ^= h >> np.uint64(31)
+    return h
+
+
+def sample_mask(df, frac=SAMPLE_FRAC):
+    """Rows of `df` in the deterministic sample of fraction `frac`
+    """
+    h = sample_hash(df["ra"].to_numpy(), df["dec"].to_numpy())
+    return h < np.uint64(min(int(frac * 2 ** 64), 2 ** 64 - 1))
+
+
+def file_sample(key, store, frac=SAMPLE_FRAC, partition_values=None):
+    """Sampled rows of a partition file, read one row group at a time
+    """
+    if callable(store):
+        store = store()
+    frames = []
+    with store.open(key) as f:
+        parquet_file = pq.ParquetFile(f)
+        for i in range(parquet_file.num_row_groups):
+            df = parquet_file.read_row_group(i).to_pandas()
+            frames.append(df[sample_mask(df, frac)])
+    df = pd.concat(frames, ignore_index=True) if frames else pd.DataFrame()
+    return df.assign(**(partition_values or {}))
+
+
+class ProgressiveLoad(object):
+    """Loads `parts` (e.g. tracts) concurrently and hands out the results at a bounded rate
+
+    The parts are loaded by a thread pool of the dashboard process rather
+    than as dask futures, so that they go through the column caches of the
+    `Dataset`; `PersistedLoad` is the distributed counterpart.  A load
+    without parts is done right away, with `empty` as its result.
+
+    Parameters
+    ----------
+    load : callable
+        ``load(part)`` returns the `pandas.DataFrame` of one part.
+    parts : `list`
+        Parts to load.
+    min_interval : `float`
+        Minimum number of seconds between two frames returned by `poll`.
+    max_workers : `int`
+        Number of parts loaded at the same time.
+    empty : `pandas.DataFrame`, optional
+        Returned by `poll` when no part has any rows; default: a frame without columns.
+    """
+
+    def __init__(self, load, parts, min_interval=1.0, max_workers=4, empty=None):
+        self.load = load
+        self.parts = list(parts)
+        self.min_interval = min_interval
+        self.max_workers = max_workers
+        self.empty = pd.DataFrame() if empty is None else empty
+        self.errors = []
+        self._frames = []
+        self._n_done = 0
+        # with nothing to load, the (empty) result is ready for the first poll
+        self._new = not self.parts
+        self._last_poll = 0.0
+        self._lock = threading.Lock()
+        self._executor = None
+        self._futures = []
+        self._thread = None
+
+    def start(self):
+        self._executor = ThreadPoolExecutor(max_workers=self.max_workers)
+        self._futures = [self._executor.submit(self.load, part) for part in self.parts]
+        self._thread = threading.Thread(target=self._collect, daemon=True)
+        self._thread.start()
+        return self
+
+    def _collect(self):
+        for future in as_completed(self._futures):
+            try:
+                df = future.result()
+            except CancelledError:
+                df = None
+            except Exception as e:
+                self.errors.append(e)
+                df = None
+            with self._lock:
+                if df is not None and len(df):
+                    self._frames.append(df)
+                self._n_done += 1
+                self._new = True
+        self._executor.shutdown(wait=False)
+
+    @property
+    def progress(self):
+        """(parts done, parts total)
+        """
+        return self._n_done, len(self.parts)
+
+    @property
+    def done(self):
+        return self._n_done == len(self.parts)
+
+    def poll(self):
+        """All rows loaded so far, if new parts arrived and `min_interval` has passed, else None
+
+        Once every part is done, the complete frame is returned regardless
+        of `min_interval`.
+        """
+        with self._lock:
+            if not self._new:
+                return None
+            if not self.done and time.monotonic() - self._last_poll < self.min_interval:
+                return None
+            self._new = False
+            self._last_poll = time.monotonic()
+            frames = list(self._frames)
+        if len(frames) > 1:
+            # keep the concatenated frame so the next poll only appends to it
+            df = pd.concat(frames, ignore_index=True)
+            with self._lock:
+                self._frames[: len(frames)] = [df]
+            return df
+        return frames[0] if frames else self.empty
+
+    def cancel(self):
+        """Cancels the parts that have not started loading
+        """
+        for future in self._futures:
+            future.cancel()
+
+
+class PersistedLoad(object):
+    """Persists a dask dataframe on the workers, with the interface of `ProgressiveLoad`
+
+    The parts are the partitions of the dataframe; `poll` returns the
+    persisted (not computed) dataframe once all of them are in worker
+    memory.
+
+    Parameters
+    ----------
+    ddf : `dask.dataframe.DataFrame`
+        Lazy dataframe to persist.
+    client : `distributed.Client`, optional
+        Default: the default client.
+    """
+
+    def __init__(self, ddf, client=None):
+        self.ddf = ddf
+        self.client = client
+        self.parts = list(range(ddf.npartitions))
+        self.errors = []
+        self._futures = []
+        self._polled = False
+
+    def start(self):
+        self.client = self.client or distributed.client.default_client()
+        self.ddf = self.client.persist(self.ddf)
+        self._futures = distributed.futures_of(self.ddf)
+        return self
+
+    @property
+    def progress(self):
+        """(partitions done, partitions total)
+        """
+        return sum(f.done() for f in self._futures), len(self.parts)
+
+    @property
+    def done(self):
+        return all(f.done() for f in self._futures)
+
+    def poll(self):
+        """The persisted dataframe, the first time it is polled once done, else None
+        """
+        if self._polled or not self.done:
+            return None
+        self._polled = True
+        self.errors = [f.exception() for f in self._futures if f.status == "error"]
+        return self.ddf
+
+    def cancel(self):
+        """Cancels the partitions still computing and releases the persisted ones
+        """
+        if self._futures:
+            self.client.cancel(self._futures)
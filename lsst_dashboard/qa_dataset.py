@@ -6,8 +6,8 @@ import numpy as np
 import pandas as pd
 import holoviews as hv
 
-# from lsst.qa.explorer.match import match_lists
 # from lsst.qa.explorer.plots import filter_dset, FilterStream
+from .match import MatchRegistry, match_frames
 from .plots import filter_dset, FilterStream
 
 
@@ -223,10 +223,12 @@ class MatchedQADataset(QADataset):
     `QADataset`, and the value of the 'vdims' is computed as the
     difference of the values between the datasets (`data2 - data1`).
 
-    Matching is done using `lsst.qa.explorer.match.match_lists`, which
-    uses a KDTree.
+    Matching is done using `lsst_dashboard.match.match_frames`, which
+    splits the sky into cells of `match_cell_size` degrees and matches each
+    cell with a KDTree, as dask tasks; the `df` of the datasets can be
+    pandas or dask dataframes.
 
-    TODO: Results should be cached in `match_registry`, if provided.
+    Results are cached by tract in `match_registry`, if provided.
 
     Parameters
     ----------
@@ -237,19 +239,23 @@ class MatchedQADataset(QADataset):
         Max match distance in arcsec.  Default is 0.5.
 
     match_registry : `str` (optional)
-        Path to an .h5 file containing cached match results.
-        (Not implemented yet; implementation should parallel
-        that of `lsst.qa.explorer.catalog.MatchedCatalog`).
+        Directory of a `lsst_dashboard.match.MatchRegistry` of cached match
+        results; tracts whose objects (or the objects of `data2` around
+        them) did not change are read from it instead of being matched.
+
+    match_cell_size : `float`
+        Size in degrees of the sky cells matched independently.  Default is 1.
 
     """
 
     def __init__(self, data1, data2,
-                 match_radius=0.5, match_registry=None,
+                 match_radius=0.5, match_registry=None, match_cell_size=1.,
                  **kwargs):
         self.data1 = data1
         self.data2 = data2
         self.match_radius = match_radius
         self.match_registry = match_registry
+        self.match_cell_size = match_cell_size
 
         self._matched = False
         self._match_inds1 = None
@@ -264,25 +270,21 @@ class MatchedQADataset(QADataset):
                                                          'detect_isPrimary']]):
             raise ValueError('Dataframes must have `detect_isPrimary` flag, ' +
                              'as well as ra/dec.')
-        isPrimary1 = self.data1.df['detect_isPrimary']
-        isPrimary2 = self.data2.df['detect_isPrimary']
-
-        ra1, dec1 = self.data1.df.ra[isPrimary1], self.data1.df.dec[isPrimary1]
-        ra2, dec2 = self.data2.df.ra[isPrimary2], self.data2.df.dec[isPrimary2]
-        id1 = ra1.index
-        id2 = ra2.index
-
-        dist, inds = match_lists(ra1, dec1, ra2, dec2, self.match_radius/3600)
-
-        good = np.isfinite(dist)
-
-        fmtArgs = good.sum(), self.match_radius, (~good).sum()
-        logging.info('{0} matched within {1} arcsec, {2} did not.'.format(*fmtArgs))
-
-        # Save indices as labels, not positions, as required by dask
-        i1 = id1[good]
-        i2 = id2[inds[good]]
-        d = pd.Series(dist[good] * 3600, index=id1[good], name='match_distance')
+        # boolean selection works the same for pandas and dask dataframes
+        df1 = self.data1.df[self.data1.df['detect_isPrimary']]
+        df2 = self.data2.df[self.data2.df['detect_isPrimary']]
+
+        if self.match_registry is not None:
+            columns1 = [c for c in ['ra', 'dec', 'tract'] if c in df1.columns]
+            registry = MatchRegistry(self.match_registry, cell_size=self.match_cell_size)
+            i1, i2, d = registry.match(df1[columns1], df2[['ra', 'dec']], self.match_radius)
+        else:
+            matched = match_frames(df1, df2, self.match_radius/3600, cell_size=self.match_cell_size)
+            # Save indices as labels, not positions, as required by dask
+            i1 = pd.Index(matched['id1'])
+            i2 = pd.Index(matched['id2'])
+            d = pd.Series(matched['dist'].to_numpy() * 3600, index=i1, name='match_distance')
+        logging.info('{0} matched within {1} arcsec.'.format(len(i1), self.match_radius))
 
         self._match_inds1 = i1
         self._match_inds2 = i2
@@ -0,0 +1,212 @@
+"""Translation of dashboard query expressions into read-time predicates.
+
+The GUI filters are `pandas.DataFrame.query` expressions such as
+``qaBad_flag==False & psfMag < 23``.  `split_query` parses such an
+expression and moves every top-level conjunctive clause that is a simple
+comparison of a column with literal values (or a bare/negated flag) into
+kartothek predicates.  kartothek applies those predicates to the partition
+keys and to the Parquet row-group statistics, and filters the rows it
+reads, so the rows they exclude are never loaded.  Whatever cannot be
+translated is returned as a remainder expression to run in memory.
+"""
+import ast
+import io
+import tokenize
+
+import numpy as np
+
+
+_OPS = {
+    ast.Eq: "==",
+    ast.NotEq: "!=",
+    ast.Lt: "<",
+    ast.LtE: "<=",
+    ast.Gt: ">",
+    ast.GtE: ">=",
+    ast.In: "in",
+}
+
+# op with its operands swapped, for ``23 > psfMag``
+_REVERSED = {"==": "==", "!=": "!=", "<": ">", "<=": ">=", ">": "<", ">=": "<="}
+
+
+class _Untranslatable(Exception):
+    pass
+
+
+def _literal(node):
+    try:
+        value = ast.literal_eval(node)
+    except ValueError:
+        raise _Untranslatable()
+    if isinstance(value, (list, tuple, set)):
+        return list(value)
+    return value
+
+
+def _coerce(value, dtype):
+    """`value` converted to the type kartothek expects for a column of `dtype`
+    """
+    if isinstance(value, list):
+        return [_coerce(v, dtype) for v in value]
+    if dtype is None:
+        return value
+    if dtype.kind == "b":
+        if not isinstance(value, (bool, np.bool_)) and value not in (0, 1):
+            raise _Untranslatable()
+        return bool(value)
+    if dtype.kind in "iu":
+        if isinstance(value, bool) or not float(value).is_integer():
+            raise _Untranslatable()
+        return int(value)
+    if dtype.kind == "f":
+        if isinstance(value, bool) or not isinstance(value, (int, float)):
+            raise _Untranslatable()
+        return float(value)
+    if dtype.kind == "O" or dtype.name in ("category", "string"):
+        if not isinstance(value, str):
+            raise _Untranslatable()
+        return value
+    raise _Untranslatable()
+
+
+def _column(node, dtypes):
+    if not isinstance(node, ast.Name):
+        raise _Untranslatable()
+    if dtypes is not None and node.id not in dtypes:
+        raise _Untranslatable()
+    return node.id
+
+
+def _clause_predicates(node, dtypes):
+    """kartothek predicate tuples equivalent to the clause `node`
+    """
+    dtype = lambda col: None if dtypes is None else dtypes[col]
+
+    if isinstance(node, ast.Name):
+        col = _column(node, dtypes)
+        return [(col, "==", _coerce(True, dtype(col)))]
+
+    if isinstance(node, ast.UnaryOp) and isinstance(node.op, (ast.Invert, ast.Not)):
+        col = _column(node.operand, dtypes)
+        if dtypes is not None and dtype(col).kind != "b":
+            raise _Untranslatable()
+        return [(col, "==", False)]
+
+    if isinstance(node, ast.Compare):
+        predicates = []
+        operands = [node.left] + node.comparators
+        for left, op, right in zip(operands[:-1], node.ops, operands[1:]):
+            if type(op) not in _OPS:
+                raise _Untranslatable()
+            op = _OPS[type(op)]
+            if isinstance(left, ast.Name):
+                col, value = _column(left, dtypes), _literal(right)
+            elif op != "in":
+                col, value, op = _column(right, dtypes), _literal(left), _REVERSED[op]
+            else:
+                raise _Untranslatable()
+            if (op == "in") != isinstance(value, list):
+                raise _Untranslatable()
+            if op != "in" and isinstance(value, float) and np.isnan(value):
+                raise _Untranslatable()
+            predicates.append((col, op, _coerce(value, dtype(col))))
+        return predicates
+
+    raise _Untranslatable()
+
+
+_PREDICATE_FUNCS = {
+    "==": lambda a, b: a == b,
+    "!=": lambda a, b: a != b,
+    "<": lambda a, b: a < b,
+    "<=": lambda a, b: a <= b,
+    ">": lambda a, b: a > b,
+    ">=": lambda a, b: a >= b,
+    "in": lambda a, b: a.isin(b),
+}
+
+
+def apply_predicates(df, predicates):
+    """Rows of `df` matching the conjunction of ``(column, op, value)`` `predicates`
+    """
+    mask = np.ones(len(df), dtype=bool)
+    for col, op, value in predicates:
+        mask &= np.asarray(_PREDICATE_FUNCS[op](df[col], value))
+    return df[mask]
+
+
+def _conjuncts(node):
+    """Top-level clauses of ``a and b and c``
+    """
+    if isinstance(node, ast.BoolOp) and isinstance(node.op, ast.And):
+        return [c for value in node.values for c in _conjuncts(value)]
+    return [node]
+
+
+def _parse(expr):
+    """Parses `expr` with the operator precedence of `pandas.DataFrame.query`
+
+    Like pandas, ``&`` and ``|`` are rewritten to ``and`` and ``or`` so that
+    they bind less tightly than comparisons.  Returns the rewritten
+    expression and its AST.
+    """
+    tokens = []
+    for tok in tokenize.generate_tokens(io.StringIO(expr).readline):
+        if tok.type == tokenize.OP and tok.string in ("&", "|"):
+            tok = tok._replace(type=tokenize.NAME, string="and" if tok.string == "&" else "or")
+        tokens.append((tok.type, tok.string))
+    expr = tokenize.untokenize(tokens).strip()
+    return expr, ast.parse(expr, mode="eval")
+
+
+def split_query(expr, dtypes=None):
+    """Splits a query expression into kartothek predicates and a remainder
+
+    Parameters
+    ----------
+    expr : `str`
+        `pandas.DataFrame.query` expression.
+    dtypes : `pandas.Series`, optional
+        dtypes of the dataset columns.  If given, only clauses on these
+        columns are translated, and literal values are converted to the
+        type of their column.
+
+    Returns
+    -------
+    predicates : `list`
+        Conjunction of ``(column, op, value)`` tuples.
+    remainder : `str` or None
+        Expression for the clauses that were not translated.
+    """
+    expr = (expr or "").strip()
+    if not expr:
+        return [], None
+    try:
+        expr, tree = _parse(expr)
+    except (SyntaxError, tokenize.TokenError):
+        # e.g. backtick quoted names or @ references; left to pandas
+        return [], expr
+
+    predicates = []
+    remainder = []
+    for clause in _conjuncts(tree.body):
+        try:
+            predicates.extend(_clause_predicates(clause, dtypes))
+        except _Untranslatable:
+            remainder.append(f"({ast.get_source_segment(expr, clause)})")
+
+    return predicates, " and ".join(remainder) or None
+
+
+def query_columns(expr):
+    """Names of the columns referenced by a query expression
+    """
+    expr = (expr or "").strip()
+    if not expr:
+        return []
+    try:
+        _, tree = _parse(expr)
+    except (SyntaxError, tokenize.TokenError):
+        return []
+    return list(dict.fromkeys(node.id for node in ast.walk(tree) if isinstance(node, ast.Name)))
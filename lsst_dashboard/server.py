@@ -0,0 +1,161 @@
+"""Local data server sharing the coadd read path between dashboard processes.
+
+A `DataServer` owns the `Dataset` instances (and with them the column and
+disk caches) of the repositories it is asked for, and serves reads of
+(repository, coadd version, filter, tracts, columns, predicates) over a
+TCP socket on localhost.  A `Dataset` created with ``server="host:port"``
+sends its coadd reads there through a `DataClient` instead of reading the
+files itself, so that several ``panel serve --num-procs`` workers and
+notebooks share one copy of the data and of the I/O.
+
+Each request is a single line of JSON; the reply is a line of JSON status
+followed, on success, by the result as an Arrow IPC stream of record
+batches.
+
+    lsst_data_server --port 52100
+"""
+import json
+import socket
+import socketserver
+import threading
+
+import numpy as np
+import pyarrow as pa
+
+
+DEFAULT_PORT = 52100
+BATCH_ROWS = 1 << 20
+
+
+def _json_default(obj):
+    if isinstance(obj, np.generic):
+        return obj.item()
+    if isinstance(obj, (set, tuple, np.ndarray)):
+        return list(obj)
+    raise TypeError(f"{obj!r} is not JSON serializable")
+
+
+def parse_address(address):
+    """(host, port) of a ``"host:port"``, ``":port"`` or ``"host"`` address
+    """
+    host, _, port = str(address).rpartition(":") if ":" in str(address) else (address, "", "")
+    return host or "127.0.0.1", int(port) if port else DEFAULT_PORT
+
+
+class _RequestHandler(socketserver.StreamRequestHandler):
+    def handle(self):
+        line = self.rfile.readline()
+        if not line:
+            return
+        try:
+            request = json.loads(line)
+            table = self.server.data_server.read(**request)
+        except Exception as e:
+            self._reply(status="error", error=f"{type(e).__name__}: {e}")
+            return
+        self._reply(status="ok", rows=table.num_rows)
+        with pa.ipc.new_stream(self.wfile, table.schema) as writer:
+            for batch in table.to_batches(max_chunksize=BATCH_ROWS):
+                writer.write_batch(batch)
+
+    def _reply(self, **status):
+        self.wfile.write(json.dumps(status).encode() + b"\n")
+        self.wfile.flush()
+
+
+class _ThreadingServer(socketserver.ThreadingTCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+
+class DataServer(object):
+    """Serves coadd reads of shared `Dataset` instances over a local socket
+
+    Parameters
+    ----------
+    host, port : `str`, `int`
+        Address to listen on; port 0 picks a free port (see `address`).
+    service : `lsst_dashboard.service.DataService`, optional
+        Provides the datasets; default: the process-wide service.
+    dataset_kwargs : `dict`, optional
+        Arguments of the `Dataset` instances created (e.g. ``cache_dir``).
+    """
+
+    def __init__(self, host="127.0.0.1", port=DEFAULT_PORT, service=None, dataset_kwargs=None):
+        if service is None:
+            from .service import service
+        self.service = service
+        self.dataset_kwargs = dataset_kwargs or {}
+        # (path, coadd version) -> dataset the server keeps a service reference to
+        self._held = {}
+        self._held_lock = threading.Lock()
+        self._server = _ThreadingServer((host, port), _RequestHandler)
+        self._server.data_server = self
+
+    @property
+    def address(self):
+        host, port = self._server.server_address[:2]
+        return f"{host}:{port}"
+
+    def read(self, path, coadd_version, filter_name, tracts, columns, predicates=()):
+        """Arrow table of `Dataset.read_coadd_columns` of the repository at `path`
+
+        The server stays a user of the latest dataset of each repository it
+        served, so the service keeps it connected between requests.
+        """
+        d = self.service.get_dataset(path, coadd_version=coadd_version, **self.dataset_kwargs)
+        with self._held_lock:
+            held = self._held.get((path, coadd_version))
+            self._held[(path, coadd_version)] = d
+        if held is not None:
+            self.service.release_dataset(held)
+        predicates = [tuple(p) for p in predicates]
+        df = d.read_coadd_columns(filter_name, tracts, columns, predicates, coadd_version=coadd_version)
+        return pa.Table.from_pandas(df, preserve_index=False)
+
+    def serve_forever(self):
+        print(f"### lsst data server listening on {self.address} ###")
+        self._server.serve_forever()
+
+    def shutdown(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+
+class DataClient(object):
+    """Reads coadd columns through a `DataServer`
+
+    Parameters
+    ----------
+    address : `str`
+        ``"host:port"`` of the server.
+    timeout : `float`, optional
+        Socket timeout in seconds.
+    """
+
+    def __init__(self, address, timeout=None):
+        self.address = parse_address(address)
+        self.timeout = timeout
+
+    def read_table(self, path, coadd_version, filter_name, tracts, columns, predicates=()):
+        request = dict(
+            path=str(path),
+            coadd_version=coadd_version,
+            filter_name=filter_name,
+            tracts=list(tracts),
+            columns=list(columns),
+            predicates=[list(p) for p in predicates],
+        )
+        with socket.create_connection(self.address, timeout=self.timeout) as sock:
+            sock.sendall(json.dumps(request, default=_json_default).encode() + b"\n")
+            with sock.makefile("rb") as f:
+                status = json.loads(f.readline() or b"{}")
+                if status.get("status") != "ok":
+                    raise RuntimeError(f"Data server read failed: {status.get('error', 'no reply')}")
+                return pa.ipc.open_stream(f).read_all()
+
+    def read(self, path, coadd_version, filter_name, tracts, columns, predicates=()):
+        """`pandas.DataFrame` of `DataServer.read`
+        """
+        table = self.read_table(path, coadd_version, filter_name, tracts, columns, predicates)
+        return table.to_pandas(split_blocks=True, self_destruct=True)
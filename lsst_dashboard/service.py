@@ -0,0 +1,154 @@
+"""Process-wide data service shared by the dashboard sessions.
+
+Every browser session gets its own `QuickLookComponent`, but they all load
+data through the `DataService` of the process (`service`):
+
+- there is one connected `Dataset` per repository path and coadd version,
+  shared read-only by the sessions (and with it its column caches); it is
+  reconnected when the repository is updated and evicted once no session
+  uses it;
+- loaded selections are shared with reference counting, keyed by
+  (path, coadd version, metadata version, filter, tracts, metrics, query),
+  so that sessions looking at the same selection hold a single copy of it.
+
+Sessions only keep their own views of these frames.
+"""
+import threading
+from pathlib import Path
+
+from .cache import metadata_version
+
+
+class DataService(object):
+    """Shared `Dataset` instances and reference-counted loaded frames
+
+    Parameters
+    ----------
+    dataset_cls : `type`, optional
+        Class of the datasets created; default: `lsst_dashboard.dataset.Dataset`.
+    """
+
+    def __init__(self, dataset_cls=None):
+        self.dataset_cls = dataset_cls
+        # (path, coadd version) -> [dataset, metadata version, number of users]
+        self._datasets = {}
+        self._dataset_locks = {}
+        self._frames = {}
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def dataset_key(path, coadd_version):
+        return str(Path(path).resolve()), coadd_version
+
+    def _create_dataset(self, path, coadd_version, **kwargs):
+        dataset_cls = self.dataset_cls
+        if dataset_cls is None:
+            from .dataset import Dataset as dataset_cls
+        d = dataset_cls(path, coadd_version=coadd_version, **kwargs)
+        d.connect()
+        return d
+
+    def get_dataset(self, path, coadd_version="unforced", **kwargs):
+        """Connected `Dataset` of a repository, shared by the sessions using it
+
+        The dataset is created by the first session asking for it, and again
+        once the kartothek metadata of the repository changed (see
+        `lsst_dashboard.cache.metadata_version`).  `kwargs` are passed to
+        `Dataset` when it is created.  Sessions asking for another repository
+        are not blocked while it connects.
+
+        Every call counts as a user of the dataset until `release_dataset`.
+        """
+        key = self.dataset_key(path, coadd_version)
+        version = metadata_version(key[0])
+        with self._lock:
+            lock = self._dataset_locks.setdefault(key, threading.Lock())
+        with lock:
+            entry = self._datasets.get(key)
+            if entry is None or entry[1] != version:
+                if entry is not None:
+                    print(f"-- {key[0]} was updated, reconnecting --")
+                d = self._create_dataset(path, coadd_version, **kwargs)
+                with self._lock:
+                    # users of the outdated dataset keep their copy until they release it
+                    entry = self._datasets[key] = [d, version, 0]
+            with self._lock:
+                entry[2] += 1
+            return entry[0]
+
+    def release_dataset(self, dataset):
+        """Drops a user of `dataset`; the last one evicts it from the service
+        """
+        key = self.dataset_key(dataset.path, dataset.coadd_version)
+        with self._lock:
+            entry = self._datasets.get(key)
+            if entry is None or entry[0] is not dataset:
+                return
+            entry[2] -= 1
+            if entry[2] <= 0:
+                del self._datasets[key]
+
+    def frame_key(self, dataset, filter_name, tracts, metrics, query=None):
+        """Key of a selection of `dataset`, as loaded by `Dataset.get_coadd_ddf_by_filter_metric`
+        """
+        path, coadd_version = key = self.dataset_key(dataset.path, dataset.coadd_version)
+        with self._lock:
+            entry = self._datasets.get(key)
+        version = entry[1] if entry is not None and entry[0] is dataset else None
+        return (
+            path,
+            coadd_version,
+            version,
+            filter_name,
+            tuple(sorted(tracts)),
+            tuple(metrics),
+            query or None,
+        )
+
+    def acquire(self, key):
+        """Shared frame of `key`, or None if no session holds it
+
+        The caller must `release` the key once it no longer uses the frame.
+        """
+        with self._lock:
+            entry = self._frames.get(key)
+            if entry is None:
+                return None
+            entry[1] += 1
+            return entry[0]
+
+    def share(self, key, df):
+        """Shares a frame loaded for `key` and acquires it
+
+        If another session shared the same selection meanwhile, its frame is
+        returned instead and `df` can be dropped.
+        """
+        with self._lock:
+            entry = self._frames.setdefault(key, [df, 0])
+            entry[1] += 1
+            return entry[0]
+
+    def release(self, key):
+        """Drops a reference to the frame of `key`; the last one frees it
+        """
+        with self._lock:
+            entry = self._frames.get(key)
+            if entry is None:
+                return
+            entry[1] -= 1
+            if entry[1] <= 0:
+                del self._frames[key]
+
+    def refcount(self, key):
+        with self._lock:
+            entry = self._frames.get(key)
+            return 0 if entry is None else entry[1]
+
+    def clear(self):
+        with self._lock:
+            self._datasets.clear()
+            self._dataset_locks.clear()
+            self._frames.clear()
+
+
+service = DataService()
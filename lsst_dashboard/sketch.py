@@ -0,0 +1,219 @@
+"""Mergeable streaming summary statistics.
+
+The partitioners use these instead of `pandas.DataFrame.describe` so that
+statistics can be accumulated one Parquet row group at a time, and so that
+per-dataId results can later be combined into per-tract or per-filter
+rollups without reading the data again.
+"""
+import numpy as np
+import pandas as pd
+import pyarrow.parquet as pq
+
+
+DEFAULT_PERCENTILES = [0.01, 0.05, 0.25, 0.5, 0.75, 0.95, 0.99]
+
+
+def percentile_label(p):
+    """Index label used by `pandas.DataFrame.describe` for a percentile
+    """
+    return f"{100 * p:g}%"
+
+
+class TDigest(object):
+    """Merging t-digest quantile sketch.
+
+    Values are summarized by weighted centroids whose size is bounded by
+    the arcsine scale function, so that the tails are represented with
+    more resolution than the bulk of the distribution.  Memory use grows
+    with `compression`, not with the number of values.
+
+    Parameters
+    ----------
+    compression : `float`
+        Resolution of the sketch; about ``compression / 2`` centroids are
+        kept after each compression.
+    """
+
+    def __init__(self, compression=200):
+        self.compression = compression
+        self.means = np.empty(0)
+        self.weights = np.empty(0)
+
+    @property
+    def count(self):
+        return self.weights.sum()
+
+    def update(self, values):
+        values = np.asarray(values, dtype="float64")
+        if len(values) == 0:
+            return
+        self._add(values, np.ones(len(values)))
+
+    def merge(self, other):
+        if len(other.means) == 0:
+            return
+        self._add(other.means, other.weights)
+
+    def _add(self, means, weights):
+        means = np.concatenate([self.means, means])
+        weights = np.concatenate([self.weights, weights])
+        order = np.argsort(means, kind="mergesort")
+        self.means, self.weights = self._compress(means[order], weights[order])
+
+    def _compress(self, means, weights):
+        total = weights.sum()
+        q = (np.cumsum(weights) - weights / 2) / total
+        k = self.compression / (2 * np.pi) * np.arcsin(2 * q - 1)
+        _, groups = np.unique(np.floor(k), return_inverse=True)
+        w = np.bincount(groups, weights=weights)
+        m = np.bincount(groups, weights=means * weights) / w
+        return m, w
+
+    def quantile(self, q, vmin=None, vmax=None):
+        """Estimated quantile(s) `q` in [0, 1]
+        """
+        if len(self.means) == 0:
+            return np.full(np.shape(q), np.nan)
+        vmin = self.means[0] if vmin is None else vmin
+        vmax = self.means[-1] if vmax is None else vmax
+        total = self.weights.sum()
+        positions = np.concatenate([[0], np.cumsum(self.weights) - self.weights / 2, [total]])
+        values = np.concatenate([[vmin], self.means, [vmax]])
+        return np.interp(np.asarray(q) * total, positions, values)
+
+
+class ColumnSketch(object):
+    """Streaming count/mean/variance/min/max and quantiles of one column
+
+    Non-finite values are ignored.  Moments are accumulated with the
+    parallel (Chan et al.) update so sketches can be merged exactly.
+    """
+
+    def __init__(self, compression=200):
+        self.count = 0
+        self.mean = 0.0
+        self.m2 = 0.0
+        self.min = np.inf
+        self.max = -np.inf
+        self.digest = TDigest(compression=compression)
+
+    def update(self, values):
+        values = np.asarray(values, dtype="float64")
+        values = values[np.isfinite(values)]
+        n = len(values)
+        if n == 0:
+            return
+        mean = values.mean()
+        self._combine(n, mean, ((values - mean) ** 2).sum(), values.min(), values.max())
+        self.digest.update(values)
+
+    def merge(self, other):
+        if other.count == 0:
+            return
+        self._combine(other.count, other.mean, other.m2, other.min, other.max)
+        self.digest.merge(other.digest)
+
+    def _combine(self, n, mean, m2, vmin, vmax):
+        total = self.count + n
+        delta = mean - self.mean
+        self.mean += delta * n / total
+        self.m2 += m2 + delta ** 2 * self.count * n / total
+        self.count = total
+        self.min = min(self.min, vmin)
+        self.max = max(self.max, vmax)
+
+    @property
+    def std(self):
+        return np.sqrt(self.m2 / (self.count - 1)) if self.count > 1 else np.nan
+
+    def describe(self, percentiles=DEFAULT_PERCENTILES):
+        if self.count == 0:
+            quantiles = [np.nan] * len(percentiles)
+            vmin = vmax = mean = np.nan
+        else:
+            quantiles = self.digest.quantile(percentiles, vmin=self.min, vmax=self.max)
+            vmin, vmax, mean = self.min, self.max, self.mean
+        return pd.Series(
+            [self.count, mean, self.std, vmin, *quantiles, vmax],
+            index=["count", "mean", "std", "min"] + [percentile_label(p) for p in percentiles] + ["max"],
+        )
+
+
+class TableSketch(object):
+    """Collection of `ColumnSketch` objects for the numeric columns of a table
+
+    Parameters
+    ----------
+    dropna_rows : `bool`
+        If True, a row is only counted if every column is finite/non-null,
+        like ``df.dropna(how="any").describe()``.  Otherwise each column is
+        summarized over its own valid values.
+    """
+
+    def __init__(self, dropna_rows=True, compression=200):
+        self.dropna_rows = dropna_rows
+        self.compression = compression
+        self.columns = {}
+
+    def update(self, df):
+        numeric = [c for c in df.columns if df[c].dtype.kind in "iuf"]
+        if self.dropna_rows:
+            valid = df.notna().all(axis=1).to_numpy().copy()
+            for c in numeric:
+                valid &= np.isfinite(df[c].to_numpy(dtype="float64", na_value=np.nan))
+        for c in numeric:
+            values = df[c].to_numpy(dtype="float64", na_value=np.nan)
+            if self.dropna_rows:
+                values = values[valid]
+            if c not in self.columns:
+                self.columns[c] = ColumnSketch(compression=self.compression)
+            self.columns[c].update(values)
+
+    def merge(self, other):
+        for c, sketch in other.columns.items():
+            if c not in self.columns:
+                self.columns[c] = ColumnSketch(compression=self.compression)
+            self.columns[c].merge(sketch)
+
+    def describe(self, percentiles=DEFAULT_PERCENTILES):
+        """Summary table shaped like `pandas.DataFrame.describe`
+        """
+        return pd.DataFrame({c: s.describe(percentiles) for c, s in sorted(self.columns.items())})
+
+
+def sketch_parquet_files(files, store, columns=None, dropna_rows=True):
+    """Builds a `TableSketch` from Parquet files, one row group at a time
+
+    Peak memory is bounded by the size of a single row group.
+    """
+    if callable(store):
+        store = store()
+    sketch = TableSketch(dropna_rows=dropna_rows)
+    for key in files:
+        with store.open(key) as f:
+            parquet_file = pq.ParquetFile(f)
+            for i in range(parquet_file.num_row_groups):
+                sketch.update(parquet_file.read_row_group(i, columns=columns).to_pandas())
+    return sketch
+
+
+def rollup(sketches, keys, by):
+    """Merges sketches of dataIds into sketches per combination of `by` keys
+
+    Parameters
+    ----------
+    sketches : `dict`
+        `TableSketch` by dataId tuple, with tuple items named by `keys`.
+    keys : `list`
+        Names of the dataId tuple items, e.g. ``["filter", "tract"]``.
+    by : `list`
+        Keys to roll up to, e.g. ``["filter"]``.
+    """
+    positions = [list(keys).index(k) for k in by]
+    rolled = {}
+    for dataId, sketch in sketches.items():
+        key = tuple(dataId[i] for i in positions)
+        if key not in rolled:
+            rolled[key] = TableSketch(dropna_rows=sketch.dropna_rows, compression=sketch.compression)
+        rolled[key].merge(sketch)
+    return rolled
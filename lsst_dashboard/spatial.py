@@ -0,0 +1,255 @@
+"""HEALPix pixel index and sky regions for spatially pruned reads.
+
+The partitioners store the nested HEALPix pixel of every object (at
+`HPIX_ORDER`) in an ``hpix`` column and sort each partition file by it, so
+Parquet row groups cover compact patches of sky.  `coverage_table` then
+records, per file and row group, the coarse pixels (at `COVERAGE_ORDER`)
+that are covered together with the ra/dec bounding box of the objects in
+each of them.  A region query only reads the row groups whose boxes
+overlap the region.
+"""
+import numpy as np
+import pandas as pd
+import pyarrow.parquet as pq
+
+
+# nside=4096, ~0.86 arcmin pixels
+HPIX_ORDER = 12
+# nside=256, ~14 arcmin pixels
+COVERAGE_ORDER = 8
+
+COVERAGE_COLUMNS = ["file", "row_group", "hpix", "count", "ra_min", "ra_max", "dec_min", "dec_max"]
+
+
+def _spread_bits(v):
+    """Interleaves zeros between the (up to 32) low bits of `v`
+    """
+    v = v.astype("uint64") & np.uint64(0xFFFFFFFF)
+    for shift, mask in [
+        (16, 0x0000FFFF0000FFFF),
+        (8, 0x00FF00FF00FF00FF),
+        (4, 0x0F0F0F0F0F0F0F0F),
+        (2, 0x3333333333333333),
+        (1, 0x5555555555555555),
+    ]:
+        v = (v | (v << np.uint64(shift))) & np.uint64(mask)
+    return v
+
+
+def ang2pix_nest(order, ra, dec):
+    """Nested HEALPix pixel index of positions `ra`, `dec` (degrees)
+
+    Same result as ``healpy.ang2pix(2**order, ra, dec, nest=True, lonlat=True)``;
+    positions with non-finite coordinates get pixel -1.
+    """
+    nside = 1 << order
+    ra = np.asarray(ra, dtype="float64")
+    dec = np.asarray(dec, dtype="float64")
+    valid = np.isfinite(ra) & np.isfinite(dec)
+    ra = np.where(valid, ra, 0.0)
+    dec = np.where(valid, dec, 0.0)
+
+    z = np.sin(np.deg2rad(dec))
+    za = np.abs(z)
+    tt = np.mod(np.deg2rad(ra), 2 * np.pi) / (np.pi / 2)  # in [0, 4)
+
+    # equatorial region
+    temp1 = nside * (0.5 + tt)
+    temp2 = nside * z * 0.75
+    jp = (temp1 - temp2).astype("int64")
+    jm = (temp1 + temp2).astype("int64")
+    ifp = jp >> order
+    ifm = jm >> order
+    face_eq = np.where(ifp == ifm, ifp | 4, np.where(ifp < ifm, ifp, ifm + 8))
+    ix_eq = jm & (nside - 1)
+    iy_eq = nside - (jp & (nside - 1)) - 1
+
+    # polar caps
+    ntt = np.minimum(tt.astype("int64"), 3)
+    tp = tt - ntt
+    tmp = nside * np.sqrt(3 * (1 - za))
+    jp = np.minimum((tp * tmp).astype("int64"), nside - 1)
+    jm = np.minimum(((1 - tp) * tmp).astype("int64"), nside - 1)
+    north = z >= 0
+    face_pol = np.where(north, ntt, ntt + 8)
+    ix_pol = np.where(north, nside - jm - 1, jp)
+    iy_pol = np.where(north, nside - jp - 1, jm)
+
+    equatorial = za <= 2.0 / 3
+    face = np.where(equatorial, face_eq, face_pol)
+    ix = np.where(equatorial, ix_eq, ix_pol)
+    iy = np.where(equatorial, iy_eq, iy_pol)
+
+    pix = face.astype("uint64") << np.uint64(2 * order)
+    pix += _spread_bits(ix) + (_spread_bits(iy) << np.uint64(1))
+    return np.where(valid, pix.astype("int64"), -1)
+
+
+def add_hpix(df, order=HPIX_ORDER):
+    """Adds the ``hpix`` column computed from the ``ra``/``dec`` columns of `df`
+    """
+    return df.assign(hpix=ang2pix_nest(order, df["ra"].to_numpy(), df["dec"].to_numpy()))
+
+
+def degrade(hpix, order, to_order):
+    """Parent pixels at `to_order` of nested pixels at `order`
+    """
+    return np.asarray(hpix) >> (2 * (order - to_order))
+
+
+def _ra_overlaps(ra_ranges, ra_min, ra_max):
+    overlap = np.zeros(np.shape(ra_min), dtype=bool)
+    for lo, hi in ra_ranges:
+        overlap |= (ra_min <= hi) & (ra_max >= lo)
+    return overlap
+
+
+class Region(object):
+    """Sky region in ra/dec degrees
+
+    Subclasses implement `contains` and `bounds`, which returns a list of
+    non-wrapping ra ranges in [0, 360] and the dec range.
+    """
+
+    def contains(self, ra, dec):
+        raise NotImplementedError
+
+    def bounds(self):
+        raise NotImplementedError
+
+    def overlaps_box(self, ra_min, ra_max, dec_min, dec_max):
+        """True where the box [ra_min, ra_max] x [dec_min, dec_max] may overlap the region
+        """
+        ra_ranges, (dec_lo, dec_hi) = self.bounds()
+        ra_min, ra_max = np.asarray(ra_min), np.asarray(ra_max)
+        dec_min, dec_max = np.asarray(dec_min), np.asarray(dec_max)
+        return _ra_overlaps(ra_ranges, ra_min, ra_max) & (dec_min <= dec_hi) & (dec_max >= dec_lo)
+
+
+class Box(Region):
+    """ra/dec box; ``ra_min > ra_max`` wraps through ra = 0
+    """
+
+    def __init__(self, ra_min, ra_max, dec_min, dec_max):
+        self.ra_min = ra_min % 360 if ra_min != 360 else 360.0
+        self.ra_max = ra_max % 360 if ra_max != 360 else 360.0
+        self.dec_min = dec_min
+        self.dec_max = dec_max
+
+    def bounds(self):
+        if self.ra_min <= self.ra_max:
+            ra_ranges = [(self.ra_min, self.ra_max)]
+        else:
+            ra_ranges = [(self.ra_min, 360.0), (0.0, self.ra_max)]
+        return ra_ranges, (self.dec_min, self.dec_max)
+
+    def contains(self, ra, dec):
+        ra = np.mod(np.asarray(ra, dtype="float64"), 360)
+        dec = np.asarray(dec, dtype="float64")
+        ra_ranges, _ = self.bounds()
+        in_ra = np.zeros(np.shape(ra), dtype=bool)
+        for lo, hi in ra_ranges:
+            in_ra |= (ra >= lo) & (ra <= hi)
+        return in_ra & (dec >= self.dec_min) & (dec <= self.dec_max)
+
+
+class Cone(Region):
+    """Circle of `radius` degrees around (`ra`, `dec`)
+    """
+
+    def __init__(self, ra, dec, radius):
+        self.ra = ra % 360
+        self.dec = dec
+        self.radius = radius
+
+    def bounds(self):
+        dec_lo = max(self.dec - self.radius, -90.0)
+        dec_hi = min(self.dec + self.radius, 90.0)
+        if dec_lo <= -90 or dec_hi >= 90:
+            return [(0.0, 360.0)], (dec_lo, dec_hi)
+        # half width in ra of the circle, from its tangent meridians
+        ratio = np.sin(np.deg2rad(self.radius)) / np.cos(np.deg2rad(self.dec))
+        half = np.rad2deg(np.arcsin(min(1.0, ratio)))
+        return Box(self.ra - half, self.ra + half, dec_lo, dec_hi).bounds()
+
+    def contains(self, ra, dec):
+        ra1, dec1 = np.deg2rad(self.ra), np.deg2rad(self.dec)
+        ra2, dec2 = np.deg2rad(np.asarray(ra, dtype="float64")), np.deg2rad(np.asarray(dec, dtype="float64"))
+        # haversine
+        a = np.sin((dec2 - dec1) / 2) ** 2 + np.cos(dec1) * np.cos(dec2) * np.sin((ra2 - ra1) / 2) ** 2
+        return 2 * np.arcsin(np.sqrt(np.clip(a, 0, 1))) <= np.deg2rad(self.radius)
+
+
+class Polygon(Region):
+    """Polygon with vertices `ra`, `dec`, with straight edges in ra/dec
+
+    This matches lasso selections drawn on the ra/dec sky plots.  ra is
+    unwrapped around the first vertex, so polygons may cross ra = 0.
+    """
+
+    def __init__(self, ra, dec):
+        ra = np.asarray(ra, dtype="float64")
+        self.ra0 = ra[0] % 360
+        self.ra = self._unwrap(ra)
+        self.dec = np.asarray(dec, dtype="float64")
+
+    def _unwrap(self, ra):
+        return self.ra0 + (np.asarray(ra) - self.ra0 + 180) % 360 - 180
+
+    def bounds(self):
+        return Box(self.ra.min(), self.ra.max(), self.dec.min(), self.dec.max()).bounds()
+
+    def contains(self, ra, dec):
+        x = self._unwrap(np.asarray(ra, dtype="float64"))
+        y = np.asarray(dec, dtype="float64")
+        inside = np.zeros(np.shape(x), dtype=bool)
+        xs, ys = self.ra, self.dec
+        for i in range(len(xs)):
+            x1, y1, x2, y2 = xs[i - 1], ys[i - 1], xs[i], ys[i]
+            crosses = (y1 > y) != (y2 > y)
+            with np.errstate(divide="ignore", invalid="ignore"):
+                x_cross = x1 + (y - y1) * (x2 - x1) / (y2 - y1)
+            inside ^= crosses & (x < x_cross)
+        return inside
+
+
+def coverage_table(parquet_file, key, order=HPIX_ORDER, coverage_order=COVERAGE_ORDER):
+    """Coverage rows of one partition file
+
+    One row per (row group, coarse pixel) with the object count and the
+    ra/dec bounding box of those objects.
+    """
+    has_hpix = "hpix" in parquet_file.schema_arrow.names
+    columns = ["ra", "dec", "hpix"] if has_hpix else ["ra", "dec"]
+
+    frames = []
+    for i in range(parquet_file.num_row_groups):
+        df = parquet_file.read_row_group(i, columns=columns).to_pandas()
+        if not has_hpix:
+            # files written before the hpix column was added
+            df = add_hpix(df, order)
+        df = df[df["hpix"] >= 0]
+        if len(df) == 0:
+            continue
+        df = df.assign(hpix=degrade(df["hpix"].to_numpy(), order, coverage_order))
+        agg = df.groupby("hpix").agg(
+            count=("ra", "size"),
+            ra_min=("ra", "min"),
+            ra_max=("ra", "max"),
+            dec_min=("dec", "min"),
+            dec_max=("dec", "max"),
+        )
+        frames.append(agg.reset_index().assign(file=key, row_group=i))
+
+    if not frames:
+        return pd.DataFrame(columns=COVERAGE_COLUMNS)
+    return pd.concat(frames, ignore_index=True)[COVERAGE_COLUMNS]
+
+
+def file_coverage(key, store, order=HPIX_ORDER, coverage_order=COVERAGE_ORDER):
+    """`coverage_table` of the partition file `key` in `store`
+    """
+    if callable(store):
+        store = store()
+    with store.open(key) as f:
+        return coverage_table(pq.ParquetFile(f), key, order=order, coverage_order=coverage_order)
@@ -0,0 +1,77 @@
+"""Access layer for the summary statistics tables written by the partitioners."""
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+import pandas as pd
+
+
+# statistic rows used by the dashboard (plot ranges and visit plots)
+STATISTICS = ["mean", "min", "max", "1%", "99%"]
+
+STATS_TABLES = {
+    "coadd_unforced": "analysisCoaddTable_unforced",
+    "coadd_forced": "analysisCoaddTable_forced",
+    "visit": "analysisVisitTable",
+}
+
+
+def read_stats_table(path, statistics=STATISTICS, columns=None):
+    """Reads the requested statistic rows of a *_stats.parq file
+
+    The rows are filtered by pyarrow at read time and the result is
+    sorted on its (filter, tract[, visit], statistic) index so that
+    `.loc` lookups are binary searches.
+    """
+    filters = None if statistics is None else [("statistic", "in", list(statistics))]
+    df = pd.read_parquet(path, columns=columns, filters=filters)
+    return df.sort_index()
+
+
+class SummaryStats(object):
+    """Summary statistics tables of a repartitioned repository.
+
+    Parameters
+    ----------
+    tables : `dict`
+        Sorted statistics `pandas.DataFrame` by name (see `STATS_TABLES`).
+    """
+
+    def __init__(self, tables):
+        self.tables = tables
+        self._tracts = {name: set(df.index.unique(level="tract")) for name, df in tables.items()}
+
+    @classmethod
+    def read(cls, path, statistics=STATISTICS, max_workers=None):
+        """Reads all statistics tables found under `path` concurrently
+        """
+        path = Path(path)
+        paths = {name: path.joinpath(f"{dataset}_stats.parq") for name, dataset in STATS_TABLES.items()}
+
+        with ThreadPoolExecutor(max_workers=max_workers or len(paths)) as pool:
+            futures = {
+                name: pool.submit(read_stats_table, p, statistics=statistics) for name, p in paths.items()
+            }
+            tables = {name: future.result() for name, future in futures.items()}
+
+        return cls(tables)
+
+    def __getitem__(self, name):
+        return self.tables[name]
+
+    def __contains__(self, name):
+        return name in self.tables
+
+    def select(self, name, filt, tracts=None):
+        """Statistics of one filter, indexed by statistic only
+
+        Rows for all requested `tracts` (all tracts if empty) are kept,
+        so e.g. ``stats[col]["min"].min()`` is the minimum over tracts.
+        Tracts missing from the table are ignored.
+        """
+        df = self.tables[name]
+        if tracts:
+            tracts = sorted(t for t in tracts if t in self._tracts[name])
+            locs = df.index.get_locs([filt, tracts])
+        else:
+            locs = df.index.get_locs([filt])
+        return df.iloc[locs].droplevel([lvl for lvl in df.index.names if lvl != "statistic"])
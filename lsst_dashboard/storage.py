@@ -0,0 +1,183 @@
+"""Helpers for inspecting kartothek datasets without building dask graphs.
+
+kartothek and storefact are only imported by the helpers that need them, so
+the pyarrow readers can be used (and tested) on their own.
+"""
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from urllib.parse import unquote
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+
+def get_store(path):
+    """Store factory for a kartothek dataset directory
+    """
+    from storefact import get_store_from_url
+
+    return partial(get_store_from_url, "hfs://" + str(path))
+
+
+def load_dataset_metadata(dataset_uuid, store, load_schema=True):
+    """Loads the kartothek metadata of a dataset (a single small json read)
+    """
+    from kartothek.core.dataset import DatasetMetadata
+
+    if callable(store):
+        store = store()
+    return DatasetMetadata.load_from_store(dataset_uuid, store, load_schema=load_schema)
+
+
+def partition_values(key):
+    """Parses the ``column=value`` segments of a kartothek partition file key
+    """
+    values = {}
+    for segment in key.split("/"):
+        if "=" in segment:
+            col, value = segment.split("=", 1)
+            values[unquote(col)] = unquote(value)
+    return values
+
+
+def read_schema(dataset_uuid, store, table="table", dataset_metadata=None):
+    """Returns the `pyarrow.Schema` of a kartothek dataset table
+
+    The schema is taken from the dataset metadata if available, otherwise
+    from the Parquet footer of a single partition.
+    """
+    dm = dataset_metadata
+    if dm is None:
+        dm = load_dataset_metadata(dataset_uuid, store, load_schema=True)
+
+    if table in dm.table_meta:
+        return dm.table_meta[table].internal()
+
+    if callable(store):
+        store = store()
+    for partition in dm.partitions.values():
+        if table in partition.files:
+            with store.open(partition.files[table]) as f:
+                return pq.read_schema(f)
+
+    raise IOError(f"No schema found for {dataset_uuid} ({table}).")
+
+
+def schema_dtypes(schema):
+    """pandas dtypes of the columns described by a `pyarrow.Schema`
+    """
+    return schema.empty_table().to_pandas().dtypes
+
+
+def partition_frame(dm, table="table", schema=None):
+    """Table of the partitions of a dataset
+
+    Returns a `pandas.DataFrame` indexed by partition label with one column
+    per partition key (e.g. filter, tract) and the file key of `table`.
+    """
+    records = []
+    for label, partition in dm.partitions.items():
+        if table not in partition.files:
+            continue
+        key = partition.files[table]
+        records.append(dict(partition_values(key), label=label, file=key))
+
+    df = pd.DataFrame.from_records(records, columns=["label", *dm.partition_keys, "file"])
+
+    if schema is not None:
+        for col in dm.partition_keys:
+            if col in schema.names:
+                dtype = schema.field(col).type
+                if pa.types.is_dictionary(dtype):
+                    dtype = dtype.value_type
+                df[col] = df[col].astype(dtype.to_pandas_dtype())
+
+    return df.set_index("label")
+
+
+def read_row_groups(key, store, row_groups, columns=None):
+    """Reads the given row groups of a partition file into a `pandas.DataFrame`
+    """
+    if callable(store):
+        store = store()
+    with store.open(key) as f:
+        parquet_file = pq.ParquetFile(f)
+        if columns is not None:
+            columns = [c for c in columns if c in parquet_file.schema_arrow.names]
+        return parquet_file.read_row_groups(list(row_groups), columns=columns).to_pandas()
+
+
+def _constant_column(value, n):
+    """Arrow column repeating a partition key value `n` times
+    """
+    if isinstance(value, str):
+        # dictionary encoded, becomes a pandas categorical
+        return pa.DictionaryArray.from_arrays(pa.array(np.zeros(n, dtype="int32")), pa.array([value]))
+    return pa.array(np.full(n, value))
+
+
+def read_arrow_file(key, store, columns=None, filters=None, partition_values=None):
+    """Reads a partition file into a `pyarrow.Table`
+
+    Columns are decoded by multiple threads with the file pre-buffered,
+    `filters` (pyarrow/kartothek style predicates on non-partition columns)
+    skip row groups by their statistics and filter rows, and the
+    `partition_values` (e.g. filter, tract) are added as constant columns.
+    """
+    if callable(store):
+        store = store()
+    partition_values = partition_values or {}
+    file_columns = None if columns is None else [c for c in columns if c not in partition_values]
+
+    with store.open(key) as f:
+        table = pq.read_table(
+            f, columns=file_columns, filters=filters or None, use_threads=True, pre_buffer=True
+        )
+
+    for col, value in partition_values.items():
+        if columns is None or col in columns:
+            table = table.append_column(col, _constant_column(value, table.num_rows))
+    if columns is not None:
+        table = table.select([c for c in columns if c in table.column_names])
+    return table
+
+
+def read_arrow_partitions(partitions, store, columns=None, filters=None, max_workers=None):
+    """Reads partition files into a single `pyarrow.Table`
+
+    Parameters
+    ----------
+    partitions : `pandas.DataFrame`
+        Rows of `partition_frame` to read; the partition key columns are
+        added to the table.
+
+    The files are read concurrently and their tables concatenated without
+    any intermediate pandas conversion.
+    """
+    if callable(store):
+        store = store()
+    keys = [c for c in partitions.columns if c != "file"]
+
+    def read(row):
+        values = {k: getattr(row, k) for k in keys}
+        values = {k: v.item() if hasattr(v, "item") else v for k, v in values.items()}
+        return read_arrow_file(row.file, store, columns=columns, filters=filters, partition_values=values)
+
+    with ThreadPoolExecutor(max_workers=max_workers) as pool:
+        tables = list(pool.map(read, partitions.itertuples(index=False)))
+
+    if not tables:
+        return None
+    return pa.concat_tables(tables)
+
+
+def arrow_to_pandas(table):
+    """Converts a `pyarrow.Table` to pandas, releasing Arrow memory as it goes
+
+    Columns are converted to separate blocks (no consolidation copy) and
+    each Arrow buffer is freed once converted.  `table` cannot be used
+    afterwards.
+    """
+    return table.to_pandas(split_blocks=True, self_destruct=True)
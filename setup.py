@@ -18,6 +18,7 @@ __name__ == "__main__" and setuptools.setup(
             "console_scripts": [
                 "lsst_data_explorer = lsst_dashboard.cli:start_dashboard",
                 "lsst_data_repartition = lsst_dashboard.cli:repartition",
+                "lsst_data_server = lsst_dashboard.cli:data_server",
             ]
         },
     )
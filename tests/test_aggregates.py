@@ -0,0 +1,144 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from lsst_dashboard.aggregates import (
+    CUBE_COLUMNS,
+    CUBE_NY,
+    CUBE_X_EDGES,
+    HistogramCube,
+    SkyPyramid,
+    build_pyramid,
+    cell_index,
+    combine_aggregates,
+    histogram_cells,
+    sky_aggregates,
+)
+
+
+def _objects(n=20000, seed=0):
+    rng = np.random.default_rng(seed)
+    df = pd.DataFrame(
+        {"ra": rng.uniform(10, 20, n), "dec": rng.uniform(-5, 5, n), "metric": rng.normal(0, 2, n)}
+    )
+    df.loc[df.index[::10], "metric"] = np.nan
+    return df
+
+
+def test_pyramid_matches_direct_aggregation():
+    df = _objects()
+    halves = [sky_aggregates(df.iloc[::2], ["metric"]), sky_aggregates(df.iloc[1::2], ["metric"])]
+    pyramid = SkyPyramid(build_pyramid(combine_aggregates(halves)).assign(filter="HSC-R"))
+
+    level = 3
+    xs, ys, mean = pyramid.grid("metric", (10, 20), (-5, 5), level, "mean")
+    _, _, std = pyramid.grid("metric", (10, 20), (-5, 5), level, "std")
+
+    ix, iy = cell_index(df["ra"], df["dec"], level)
+    ix0, iy0 = cell_index(10, -5, level)
+    cell = df[(ix == ix0 + 1) & (iy == iy0 + 1)]["metric"]
+    assert np.isclose(mean[1, 1], np.nanmean(cell))
+    assert np.isclose(std[1, 1], np.nanstd(cell, ddof=1))
+
+
+def test_pyramid_levels_conserve_counts():
+    df = _objects()
+    tiles = build_pyramid(sky_aggregates(df, ["metric"]))
+    totals = tiles.groupby("level")[["n", "metric__count"]].sum()
+    assert (totals["n"] == len(df)).all()
+    assert (totals["metric__count"] == df["metric"].notnull().sum()).all()
+
+
+def test_pyramid_selects_tracts():
+    # two tracts sharing the cells around ra = 15
+    tracts = {1: _objects(seed=1), 2: _objects(seed=2).assign(ra=lambda df: df["ra"] + 5)}
+    both = pd.concat(tracts.values())
+    tiles = [
+        build_pyramid(sky_aggregates(df, ["metric"])).assign(filter="HSC-R", tract=t)
+        for t, df in tracts.items()
+    ]
+    pyramid = SkyPyramid(pd.concat(tiles, ignore_index=True))
+
+    level = 0
+    for selection, df in [([1], tracts[1]), ([], both), (None, both)]:
+        selected = pyramid.select("HSC-R", selection)
+        assert not selected.tiles.duplicated(["level", "ix", "iy"]).any()
+        _, _, count = selected.grid("metric", (10, 25), (-5, 5), level, "count")
+        assert np.nansum(count) == df["metric"].notnull().sum()
+
+    _, _, mean = pyramid.select("HSC-R").grid("metric", (10, 25), (-5, 5), level, "mean")
+    ix, iy = cell_index(both["ra"], both["dec"], level)
+    ix0, iy0 = cell_index(10, -5, level)
+    shared = both[(ix == ix0 + 1) & (iy == iy0)]["metric"]
+    assert np.isclose(mean[0, 1], np.nanmean(shared))
+
+
+def test_histogram_cube_sums_over_tracts():
+    rng = np.random.default_rng(1)
+    n = 5000
+    # within the metric bin range, where the cube counts every object
+    tracts = {
+        t: pd.DataFrame({"psfMag": rng.uniform(16, 26, n), "metric": rng.normal(0, 1, n).clip(-2.9, 2.9)})
+        for t in [1, 2]
+    }
+    frames = [
+        histogram_cells(df["psfMag"], df["metric"], (-3, 3)).assign(
+            filter="HSC-R", tract=t, metric="metric", y_min=-3.0, y_max=3.0
+        )[CUBE_COLUMNS]
+        for t, df in tracts.items()
+    ]
+    cube = HistogramCube(pd.concat(frames, ignore_index=True))
+
+    both = pd.concat(tracts.values(), ignore_index=True)
+    count, total, _ = cube.select("HSC-R").histogram("metric")
+    assert count.sum() == len(both)
+    assert np.isclose(total.sum(), both["metric"].sum())
+
+    # no tract selection means all tracts
+    for selection in [None, [], ()]:
+        assert cube.select("HSC-R", tracts=selection).histogram("metric")[0].sum() == len(both)
+    assert cube.select("HSC-R", tracts=[1]).histogram("metric")[0].sum() == n
+    assert cube.select("HSC-G").histogram("metric")[0].sum() == 0
+
+    profile = cube.select("HSC-R", tracts=[2]).profile("metric")
+    in_bin = tracts[2][(tracts[2]["psfMag"] >= 20) & (tracts[2]["psfMag"] < 20.05)]["metric"]
+    row = profile.iloc[np.searchsorted(cube.x_edges, 20.0)]
+    assert row["count"] == len(in_bin)
+    assert np.isclose(row["mean"], in_bin.mean())
+    assert np.isclose(row["std"], in_bin.std())
+
+
+def test_pyramid_rejects_non_finite_ranges():
+    pyramid = SkyPyramid(build_pyramid(sky_aggregates(_objects(), ["metric"])).assign(filter="HSC-R"))
+    (ra0, ra1), (dec0, dec1) = pyramid.extent()
+    assert ra0 <= 10 and ra1 >= 20 and dec0 <= -5 and dec1 >= 5
+
+    xs, ys, values = pyramid.grid("metric", (ra0, ra1), (dec0, dec1), 0, "count")
+    assert np.nansum(values) == _objects()["metric"].notnull().sum()
+    with pytest.raises(ValueError):
+        pyramid.grid("metric", (np.nan, np.nan), (np.nan, np.nan), 0)
+    with pytest.raises(ValueError):
+        cell_index([1.0, np.nan], [1.0, 2.0], 0)
+    assert SkyPyramid(pyramid.tiles.iloc[:0], n_levels=pyramid.n_levels).extent() is None
+
+
+def test_histogram_cells_exclude_outliers():
+    rng = np.random.default_rng(2)
+    n = 5000
+    x = np.concatenate([rng.uniform(16, 26, n), [10.0, 30.0, 20.0, 20.0, np.nan, 28.0]])
+    y = np.concatenate([rng.normal(0, 1, n).clip(-2.9, 2.9), [0.0, 0.0, -10.0, 10.0, 0.0, 3.0]])
+    cells = histogram_cells(x, y, (-3, 3))
+
+    # of the outliers, only the value on the upper edges is counted, in the last bin
+    assert cells["count"].sum() == n + 1
+    assert np.isclose(cells["sum"].sum(), y[:n].sum() + 3.0)
+    last = cells[(cells["ix"] == len(CUBE_X_EDGES) - 2) & (cells["iy"] == CUBE_NY - 1)]
+    assert last["count"].sum() == 1
+
+    count = np.zeros((len(CUBE_X_EDGES) - 1, CUBE_NY))
+    count[cells["ix"], cells["iy"]] = cells["count"]
+    finite = np.isfinite(x)
+    expected, _, _ = np.histogram2d(
+        x[finite], y[finite], bins=[CUBE_X_EDGES, np.linspace(-3, 3, CUBE_NY + 1)]
+    )
+    assert (count == expected).all()
@@ -0,0 +1,112 @@
+import os
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+
+from lsst_dashboard.cache import ArrowDiskCache, ColumnCache, nbytes
+
+
+def _column(n):
+    return pd.Series(range(n), dtype="float64")
+
+
+def test_column_cache_lru_eviction():
+    size = nbytes(_column(100))
+    cache = ColumnCache(max_bytes=2 * size)
+
+    cache.put(("ds", "HSC-G", 9813, "a"), _column(100))
+    cache.put(("ds", "HSC-G", 9813, "b"), _column(100))
+    # touch "a" so that "b" is the least recently used column
+    cache.get(("ds", "HSC-G", 9813, "a"))
+    cache.put(("ds", "HSC-G", 9813, "c"), _column(100))
+
+    assert ("ds", "HSC-G", 9813, "a") in cache
+    assert ("ds", "HSC-G", 9813, "b") not in cache
+    assert ("ds", "HSC-G", 9813, "c") in cache
+    assert cache.nbytes <= cache.max_bytes
+
+
+def test_column_cache_skips_oversized_columns():
+    cache = ColumnCache(max_bytes=nbytes(_column(10)))
+    cache.put("big", _column(1000))
+    assert len(cache) == 0
+    assert cache.missing(["big"]) == ["big"]
+
+
+def _table(n, seed=0):
+    rng = np.random.default_rng(seed)
+    return pa.table({"psfMag": rng.uniform(16, 26, n), "tract": np.full(n, 9813)})
+
+
+def test_arrow_disk_cache(tmp_path):
+    table = _table(1000)
+    cache = ArrowDiskCache(tmp_path / "cache", max_bytes=3 * table.nbytes)
+
+    key = cache.key(["label-1", "label-0"], ["psfMag", "tract"])
+    assert key == cache.key(["label-0", "label-1"], ["psfMag", "tract"])
+    assert key != cache.key(["label-0", "label-1"], ["psfMag"])
+    assert cache.get("ds", "v1", key) is None
+
+    cache.put("ds", "v1", key, table)
+    cached = cache.get("ds", "v1", key)
+    assert cached.equals(table)
+    # single chunk, so numeric columns convert to pandas without copies
+    assert cached.column("psfMag").num_chunks == 1
+
+    # a new metadata version drops the entries of the old one
+    cache.invalidate("ds", "v2")
+    assert cache.get("ds", "v1", key) is None
+
+
+def test_arrow_disk_cache_lru_eviction(tmp_path):
+    table = _table(1000)
+    cache = ArrowDiskCache(tmp_path / "cache", max_bytes=int(2.5 * table.nbytes))
+
+    cache.put("ds", "v1", "a", table)
+    cache.put("ds", "v1", "b", table)
+    os.utime(cache._path("ds", "v1", "a"), (1, 1))
+    os.utime(cache._path("ds", "v1", "b"), (2, 2))
+    # touch "a" so that "b" is the least recently used file
+    cache.get("ds", "v1", "a")
+    cache.put("ds", "v1", "c", table)
+
+    assert ("ds", "v1", "a") in cache
+    assert ("ds", "v1", "b") not in cache
+    assert ("ds", "v1", "c") in cache
+    assert cache.nbytes <= cache.max_bytes
+
+
+def test_arrow_disk_cache_repositories(tmp_path):
+    table = _table(1000)
+    cache = ArrowDiskCache(tmp_path / "cache")
+    repo_a = cache.dataset_key(tmp_path / "repo_a", "ds")
+    repo_b = cache.dataset_key(tmp_path / "repo_b", "ds")
+    assert repo_a != repo_b
+    assert repo_a == cache.dataset_key(tmp_path / "repo_a" / ".." / "repo_a", "ds")
+
+    cache.put(repo_a, "v1", "k", table)
+    cache.put(repo_b, "v2", "k", table)
+    # another repository of a different version does not invalidate the files
+    cache.invalidate(repo_b, "v2")
+    assert cache.get(repo_a, "v1", "k").equals(table)
+    assert cache.get(repo_b, "v2", "k").equals(table)
+
+
+def test_arrow_disk_cache_corrupt_files(tmp_path):
+    table = _table(1000)
+    cache = ArrowDiskCache(tmp_path / "cache")
+    cache.put("ds", "v1", "truncated", table)
+    cache.put("ds", "v1", "garbage", table)
+
+    path = cache._path("ds", "v1", "truncated")
+    with open(path, "rb") as f:
+        data = f.read()
+    with open(path, "wb") as f:
+        f.write(data[: len(data) // 2])
+    with open(cache._path("ds", "v1", "garbage"), "wb") as f:
+        f.write(b"not an arrow file")
+
+    for key in ["truncated", "garbage"]:
+        assert cache.get("ds", "v1", key) is None
+        assert ("ds", "v1", key) not in cache
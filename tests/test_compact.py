@@ -0,0 +1,100 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from lsst_dashboard.compact import CompactSchema, decode_patch, encode_patch
+from lsst_dashboard.query import apply_predicates, split_query
+
+
+def make_df(n=1000, seed=0):
+    rng = np.random.default_rng(seed)
+    return pd.DataFrame(
+        {
+            "ra": rng.uniform(0, 360, n),
+            "small": rng.normal(0, 10, n),
+            "huge": rng.normal(0, 1e300, n),
+            "calib_psf_used": rng.uniform(size=n) < 0.3,
+            "qaBad_flag": rng.uniform(size=n) < 0.1,
+            "patch": [f"{x},{y}" for x, y in rng.integers(0, 9, (n, 2))],
+        }
+    )
+
+
+def test_compact_roundtrip(tmp_path):
+    df = make_df()
+    schema = CompactSchema.from_sample(df, metrics=["small", "huge"], flags=["calib_psf_used", "qaBad_flag"])
+    assert schema.float32_columns == ["small"]
+
+    schema.write(tmp_path / "compact.yaml")
+    schema = CompactSchema.read(tmp_path / "compact.yaml")
+
+    stored = schema.compact(df)
+    assert set(stored.columns) == {"ra", "small", "huge", "flags", "patch"}
+    assert stored["flags"].dtype == np.uint64 and stored["patch"].dtype == np.int16
+    assert stored["small"].dtype == np.float32 and stored["ra"].dtype == np.float64
+
+    expanded = schema.expand(stored)
+    for flag in ["calib_psf_used", "qaBad_flag"]:
+        assert (expanded[flag] == df[flag]).all()
+    assert (expanded["patch"].astype(str) == df["patch"]).all()
+    assert np.allclose(expanded["small"], df["small"], rtol=1e-6)
+
+    assert (decode_patch(encode_patch(["3,4", "10,0"])).astype(str) == ["3,4", "10,0"]).all()
+
+
+def test_compact_predicates():
+    df = make_df()
+    schema = CompactSchema.from_sample(df, metrics=["small"], flags=["calib_psf_used", "qaBad_flag"])
+    dtypes = schema.dtypes(schema.compact(df).dtypes)
+    assert dtypes["qaBad_flag"] == bool and "flags" not in dtypes
+
+    predicates, remainder = split_query("qaBad_flag==False & patch == '3,4' & small > 0", dtypes)
+    assert remainder is None
+    pushed, post = schema.split_predicates(predicates)
+    assert ("patch", "==", 304) in pushed and post == [("qaBad_flag", "==", False)]
+
+    stored = apply_predicates(schema.compact(df), pushed)
+    result = apply_predicates(schema.expand(stored), post)
+    expected = df.query("qaBad_flag==False & patch == '3,4' & small > 0")
+    assert len(result) == len(expected) > 0
+
+
+def test_compact_visit_table(tmp_path):
+    pytest.importorskip("kartothek")
+    from functools import partial
+
+    from kartothek.io.eager import store_dataframes_as_dataset
+    from storefact import get_store_from_url
+
+    from lsst_dashboard.dataset import Dataset
+
+    rng = np.random.default_rng(0)
+    n = 500
+    flags = ["calib_psf_used", "calib_psf_candidate", "calib_photometry_reserved", "qaBad_flag"]
+    df = pd.DataFrame(
+        {
+            "filter": np.where(rng.uniform(size=n) < 0.5, "HSC-G", "HSC-R"),
+            "tract": 9813,
+            "visit": rng.integers(1000, 1010, n),
+            "ra": rng.uniform(0, 1, n),
+            "dec": rng.uniform(0, 1, n),
+            "psfMag": rng.uniform(16, 26, n),
+            "metric": np.where(rng.uniform(size=n) < 0.1, np.nan, rng.normal(0, 10, n)),
+            **{f: rng.uniform(size=n) < 0.3 for f in flags},
+        }
+    )
+    schema = CompactSchema.from_sample(df, metrics=["metric"], flags=flags)
+    schema.write(tmp_path / "analysisVisitTable_compact.yaml")
+    store_dataframes_as_dataset(
+        store=partial(get_store_from_url, "hfs://" + str(tmp_path)),
+        dataset_uuid="analysisVisitTable",
+        dfs=[schema.compact(df)],
+        partition_on=["filter"],
+    )
+
+    visits = Dataset(tmp_path).get_visits_by_metric_filter("HSC-G", "metric").compute()
+    expected = df[(df["filter"] == "HSC-G") & df["metric"].notnull()]
+    assert len(visits) == len(expected)
+    for f in flags:
+        assert visits[f].dtype == bool
+        assert visits[f].sum() == expected[f].sum()
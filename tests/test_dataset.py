@@ -1,7 +1,13 @@
 import pytest
 import os
 from pathlib import Path
-from lsst_dashboard.dataset import Dataset
+
+import numpy as np
+import pandas as pd
+
+pytest.importorskip("kartothek")
+
+from lsst_dashboard.dataset import Dataset  # noqa: E402
 
 
 @pytest.fixture()
@@ -18,3 +24,28 @@ def test_dataset_object():
     path = os.path.join(os.path.dirname(__file__), 'data', 'RC2_v18')
     d = Dataset(path=path)
     assert isinstance(d, Dataset)
+
+
+def test_drop_invalid():
+    inf, nan = np.inf, np.nan
+    df = pd.DataFrame(
+        {
+            "ra": [1.0, 2.0, nan, 4.0, inf, 6.0],
+            "dec": [1.0, 2.0, 3.0, -inf, 5.0, 6.0],
+            "metric_a": [nan, 1.0, 1.0, 1.0, 1.0, inf],
+            "metric_b": [1.0, -inf, 1.0, 1.0, 1.0, nan],
+        }
+    )
+
+    # masked: only rows without finite coordinates go, metrics keep their own invalid values
+    masked = Dataset(path="", masked=True)._drop_invalid(df)
+    assert list(masked.index) == [0, 1, 5]
+    assert masked["metric_a"].isnull().sum() == 1 and np.isinf(masked["metric_b"]).sum() == 1
+
+    # nothing to drop: the frame is not copied
+    valid = df.loc[[0, 1, 5]]
+    assert Dataset(path="")._drop_invalid(valid) is valid
+
+    # unmasked: any row with a NaN goes
+    unmasked = Dataset(path="", masked=False)._drop_invalid(df)
+    assert list(unmasked.index) == [1, 3, 4]
@@ -0,0 +1,50 @@
+import numpy as np
+import pandas as pd
+
+from lsst_dashboard.ingest import file_footprint, plan_chunks
+
+
+def test_plan_chunks_balanced():
+    rng = np.random.RandomState(0)
+    sizes = rng.lognormal(3, 1.5, size=300)
+    target = sizes.sum() / 10
+    chunks = plan_chunks(sizes, target_bytes=target)
+
+    # the last items that do not fit any of the 10 chunks open an extra one
+    assert 10 <= len(chunks) <= 11
+    assert sorted(i for chunk in chunks for i in chunk) == list(range(len(sizes)))
+    totals = [sizes[chunk].sum() for chunk in chunks]
+    assert max(totals) <= target
+
+
+def test_plan_chunks_skewed():
+    # a few files much larger than the others, two of them over the target
+    sizes = np.array([500.0, 150.0, 90.0, 80.0] + [1.0] * 100)
+    target = 100
+    chunks = plan_chunks(sizes, target_bytes=target)
+
+    assert sorted(i for chunk in chunks for i in chunk) == list(range(len(sizes)))
+    for chunk in chunks:
+        assert sizes[chunk].sum() <= target or len(chunk) == 1
+    assert [0] in chunks and [1] in chunks
+
+    # two chunks by total size, but no two of these files fit together
+    assert plan_chunks([60, 60, 60], target_bytes=100) == [[0], [1], [2]]
+
+
+def test_plan_chunks_few_files():
+    # fewer files than the old fixed chunk size still give one chunk
+    assert plan_chunks([10, 20, 30], target_bytes=1000) == [[0, 1, 2]]
+    assert plan_chunks([10, 20, 30], target_bytes=1) == [[2], [1], [0]]
+    assert plan_chunks([], target_bytes=1000) == []
+
+
+def test_file_footprint(tmp_path):
+    df = pd.DataFrame({"a": np.arange(1000, dtype="float64"), "b": np.arange(1000, dtype="int64")})
+    filename = str(tmp_path / "test.parq")
+    df.to_parquet(filename, row_group_size=300)
+
+    rows, nbytes = file_footprint(filename, columns=["a"])
+    _, nbytes_all = file_footprint(filename)
+    assert rows == 1000
+    assert 0 < nbytes < nbytes_all
@@ -0,0 +1,32 @@
+from lsst_dashboard.journal import RepartitionJournal
+
+
+def test_journal_resume(tmp_path):
+    journal = RepartitionJournal(str(tmp_path / "ktk" / "repartition_journal.jsonl"))
+    dataIds = [{"filter": "HSC-G", "tract": 9615}, {"filter": "HSC-G", "tract": 9697}]
+
+    assert journal.committed_dataIds("analysisCoaddTable_forced") == set()
+    journal.record_chunk("analysisCoaddTable_forced", "HSC-G", 0, dataIds[:1])
+    journal.record_chunk("analysisVisitTable", "HSC-G", 0, [{"filter": "HSC-G", "tract": 9615, "visit": 1}])
+
+    # a write interrupted mid-line is ignored
+    with open(journal.path, "a") as f:
+        f.write('{"dataset": "analysisCoaddTable_forced", "unit": "ch')
+
+    assert journal.committed_dataIds("analysisCoaddTable_forced") == {("HSC-G", 9615)}
+    assert journal.steps_done("analysisCoaddTable_forced") == set()
+
+    journal.record_step("analysisCoaddTable_forced", "coverage")
+    journal.record_step("analysisCoaddTable_forced", "stats")
+    assert journal.steps_done("analysisCoaddTable_forced") == {"coverage", "stats"}
+    assert journal.steps_done("analysisVisitTable") == set()
+
+    # a chunk committed later invalidates the steps written before it
+    journal.record_chunk("analysisCoaddTable_forced", "HSC-G", 1, dataIds[1:])
+    journal.record_step("analysisCoaddTable_forced", "coverage")
+    assert journal.steps_done("analysisCoaddTable_forced") == {"coverage"}
+
+    assert len(journal.committed_dataIds("analysisCoaddTable_forced")) == 2
+    journal.reset("analysisCoaddTable_forced")
+    assert journal.committed_dataIds("analysisCoaddTable_forced") == set()
+    assert journal.committed_dataIds("analysisVisitTable") == {("HSC-G", 9615, 1)}
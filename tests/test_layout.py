@@ -0,0 +1,32 @@
+import io
+
+import numpy as np
+import pandas as pd
+import pyarrow.parquet as pq
+import pytest
+
+pytest.importorskip("kartothek")
+
+from lsst_dashboard.layout import StorageLayout  # noqa: E402
+
+
+class DictStore(dict):
+    def put(self, key, value):
+        self[key] = value
+
+
+def test_layout_serializer():
+    layout = StorageLayout.parse("codec=zstd,level=3,row_group_mb=0.25,dictionary=patch")
+    assert layout == StorageLayout("zstd", level=3, row_group_mb=0.25, dictionary=["patch"])
+
+    df = pd.DataFrame({"x": np.random.rand(100000), "patch": ["3,4"] * 100000})
+    store = DictStore()
+    key = layout.serializer().store(store, "part", df)
+
+    parquet_file = pq.ParquetFile(io.BytesIO(store[key]))
+    assert parquet_file.metadata.num_row_groups > 1
+    assert parquet_file.metadata.row_group(0).column(0).compression == "ZSTD"
+    assert parquet_file.read().to_pandas().equals(df)
+
+    with pytest.raises(ValueError):
+        StorageLayout.parse("codec=zip")
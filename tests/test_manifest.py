@@ -0,0 +1,84 @@
+import os
+
+import pytest
+
+from lsst_dashboard.manifest import resolve_manifest, update_manifest
+
+
+class DirectoryButler(object):
+    """Stand-in Butler resolving dataIds to files in a directory tree
+    """
+
+    def __init__(self, root):
+        self.root = root
+        self.calls = 0
+
+    def _path(self, dataset, dataId):
+        parts = [str(dataId[k]) for k in sorted(dataId)]
+        return os.path.join(self.root, dataset, *parts) + ".parq"
+
+    def datasetExists(self, dataset, dataId):
+        self.calls += 1
+        return os.path.exists(self._path(dataset, dataId))
+
+    def getUri(self, dataset, dataId):
+        return "file://" + self._path(dataset, dataId)
+
+    def get(self, dataset, **dataId):
+        raise AssertionError("datasets must not be materialized")
+
+
+@pytest.fixture()
+def butler(tmp_path):
+    for filt in ["HSC-G", "HSC-R"]:
+        for tract in [9697, 9813]:
+            if (filt, tract) == ("HSC-R", 9697):
+                continue
+            path = tmp_path.joinpath("analysisCoaddTable_forced", filt, str(tract) + ".parq")
+            path.parent.mkdir(parents=True, exist_ok=True)
+            path.write_bytes(b"")
+    return DirectoryButler(str(tmp_path))
+
+
+def _dataIds():
+    return [{"filter": f, "tract": t} for f in ["HSC-G", "HSC-R"] for t in [9697, 9813]]
+
+
+def test_resolve_manifest(butler):
+    manifest = resolve_manifest(butler, "analysisCoaddTable_forced", _dataIds(), n_threads=4)
+
+    assert list(manifest.columns) == ["filter", "tract", "filename"]
+    assert manifest["filename"].isnull().sum() == 1
+    assert manifest.loc[0, "filename"] == butler._path("analysisCoaddTable_forced", _dataIds()[0])
+
+
+def test_update_manifest_reuses_saved_manifest(butler, tmp_path):
+    path = str(tmp_path.joinpath("ktk", "manifest.parq"))
+    first = update_manifest(butler, "analysisCoaddTable_forced", _dataIds()[:2], path)
+    assert butler.calls == 2
+
+    second = update_manifest(butler, "analysisCoaddTable_forced", _dataIds(), path)
+    assert butler.calls == 4
+    assert list(second["tract"]) == [9697, 9813, 9697, 9813]
+
+    # only the dataId without a file is looked up again
+    third = update_manifest(butler, "analysisCoaddTable_forced", _dataIds(), path)
+    assert butler.calls == 5
+    assert list(third["filename"].fillna("")) == list(second["filename"].fillna(""))
+    assert list(first["filename"]) == list(second["filename"].iloc[:2])
+
+
+def test_update_manifest_retries_missing_dataIds(butler, tmp_path):
+    path = str(tmp_path.joinpath("ktk", "manifest.parq"))
+    first = update_manifest(butler, "analysisCoaddTable_forced", _dataIds(), path)
+    assert first["filename"].isnull().sum() == 1
+
+    # the missing dataId is produced after the first run
+    missing = butler._path("analysisCoaddTable_forced", {"filter": "HSC-R", "tract": 9697})
+    os.makedirs(os.path.dirname(missing), exist_ok=True)
+    open(missing, "wb").close()
+
+    second = update_manifest(butler, "analysisCoaddTable_forced", _dataIds(), path)
+    assert second["filename"].notnull().all()
+    assert list(second["filename"]).count(missing) == 1
+    assert butler.calls == 5
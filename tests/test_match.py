@@ -0,0 +1,105 @@
+import dask.dataframe as dd
+import numpy as np
+import pandas as pd
+
+from lsst_dashboard.match import MatchRegistry, match_lists, match_partitioned, sky_cells
+
+
+def make_catalogs(n=20000, seed=0):
+    rng = np.random.default_rng(seed)
+    ra1 = np.concatenate([rng.uniform(0, 360, n), rng.uniform(359.99, 360, 500), rng.uniform(0, 0.01, 500)])
+    dec1 = np.concatenate([np.degrees(np.arcsin(rng.uniform(-1, 1, n))), rng.uniform(-2, 2, 1000)])
+    dec1[:20] = rng.uniform(89.99, 90, 20)
+    ra2 = ra1 + rng.normal(0, 1e-4, len(ra1))
+    dec2 = dec1 + rng.normal(0, 1e-4, len(ra1))
+    keep = rng.uniform(size=len(ra1)) < 0.8
+    return ra1, dec1, ra2[keep], dec2[keep]
+
+
+def test_sky_cells():
+    ra1, dec1, _, _ = make_catalogs()
+    cells, index = sky_cells(ra1, dec1, cell_size=2.0)
+    np.testing.assert_array_equal(np.sort(index), np.arange(len(ra1)))
+
+    cells_margin, index_margin = sky_cells(ra1, dec1, cell_size=2.0, margin=0.1)
+    assert len(index_margin) > len(index)
+    # every position keeps its own cell
+    own = set(zip(cells, index))
+    assert own <= set(zip(cells_margin, index_margin))
+
+    # a margin can reach past the neighbouring band, whatever the other positions are
+    alone, _ = sky_cells([10.0], [0.25], cell_size=0.5, margin=0.3)
+    together, index = sky_cells([10.0, 50.0], [0.25, 40.0], cell_size=0.5, margin=0.3)
+    assert sorted(alone) == sorted(together[index == 0])
+    assert len(alone) == 6  # 2 RA cells in each of 3 bands
+
+
+def test_match_partitioned():
+    ra1, dec1, ra2, dec2 = make_catalogs()
+    for radius, cell_size in [(1.0 / 3600, 1.0), (0.3, 0.5)]:
+        dist, ind = match_lists(ra1, dec1, ra2, dec2, radius)
+        for npartitions in [None, 4]:
+            dist_p, ind_p = match_partitioned(
+                ra1, dec1, ra2, dec2, radius, cell_size=cell_size, npartitions=npartitions
+            )
+            np.testing.assert_array_equal(ind_p, ind)
+            np.testing.assert_allclose(dist_p, dist)
+
+    # columns of dask dataframes are assigned to cells partition by partition
+    ddf1 = dd.from_pandas(pd.DataFrame({"ra": ra1, "dec": dec1}), npartitions=5)
+    ddf2 = dd.from_pandas(pd.DataFrame({"ra": ra2, "dec": dec2}), npartitions=3)
+    dist_p, ind_p = match_partitioned(ddf1["ra"], ddf1["dec"], ddf2["ra"], ddf2["dec"], radius)
+    np.testing.assert_array_equal(ind_p, ind)
+    np.testing.assert_allclose(dist_p, dist)
+
+
+def test_match_registry(tmp_path):
+    ra1, dec1, ra2, dec2 = make_catalogs()
+    tract = (ra1 // 30).astype(int)
+    df1 = pd.DataFrame({"ra": ra1, "dec": dec1, "tract": tract}, index=np.arange(len(ra1)) * 2)
+    df2 = pd.DataFrame({"ra": ra2, "dec": dec2}, index=np.arange(len(ra2)) + 7)
+    radius = 1.0
+
+    registry = MatchRegistry(tmp_path, cell_size=2.0)
+    id1, id2, distance = registry.match(df1, df2, radius)
+    n_files = len(list(tmp_path.glob("*.parquet")))
+    assert n_files == df1["tract"].nunique()
+
+    dist, ind = match_lists(ra1, dec1, ra2, dec2, radius / 3600)
+    good = np.isfinite(dist)
+    expected = pd.Series(df2.index[ind[good]], index=df1.index[good])
+    pd.testing.assert_series_equal(pd.Series(id2, index=id1).sort_index(), expected, check_names=False)
+    np.testing.assert_allclose(distance.sort_index().to_numpy(), dist[good] * 3600)
+
+    # moving objects of one tract only rematches that tract
+    df1.loc[df1["tract"] == 3, "ra"] += 1e-5
+    id1, id2, _ = registry.match(df1, df2, radius)
+    assert len(list(tmp_path.glob("*.parquet"))) == n_files + 1
+    fresh_id1, fresh_id2, _ = MatchRegistry(tmp_path / "fresh", cell_size=2.0).match(df1, df2, radius)
+    pd.testing.assert_series_equal(
+        pd.Series(id2, index=id1).sort_index(), pd.Series(fresh_id2, index=fresh_id1).sort_index()
+    )
+
+
+def test_match_registry_dask(tmp_path):
+    ra1, dec1, ra2, dec2 = make_catalogs()
+    tract = (ra1 // 30).astype(int)
+    df1 = pd.DataFrame({"ra": ra1, "dec": dec1, "tract": tract}, index=np.arange(len(ra1)) * 2)
+    df2 = pd.DataFrame({"ra": ra2, "dec": dec2}, index=np.arange(len(ra2)) + 7)
+    ddf1, ddf2 = dd.from_pandas(df1, npartitions=4), dd.from_pandas(df2, npartitions=3)
+    registry = MatchRegistry(tmp_path, cell_size=2.0)
+
+    # the fingerprints of a catalog do not depend on its partitioning
+    assert registry.fingerprints(ddf1, ddf2, 1.0) == registry.fingerprints(df1, df2, 1.0)
+
+    id1, id2, distance = registry.match(ddf1, ddf2, 1.0)
+    n_files = len(list(tmp_path.glob("*.parquet")))
+    assert n_files == df1["tract"].nunique()
+    expected_id1, expected_id2, _ = MatchRegistry(tmp_path / "pandas", cell_size=2.0).match(df1, df2, 1.0)
+    pd.testing.assert_series_equal(
+        pd.Series(id2, index=id1).sort_index(), pd.Series(expected_id2, index=expected_id1).sort_index()
+    )
+
+    # the pandas catalogs reuse the tracts matched from the dask ones
+    registry.match(df1, df2, 1.0)
+    assert len(list(tmp_path.glob("*.parquet"))) == n_files
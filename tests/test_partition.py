@@ -0,0 +1,106 @@
+import numpy as np
+import pandas as pd
+import pytest
+from distributed import Client
+
+pytest.importorskip("kartothek")
+
+from kartothek.io.eager import store_dataframes_as_dataset, update_dataset_from_dataframes  # noqa: E402
+
+from lsst_dashboard.partition import CoaddForcedPartitioner  # noqa: E402
+
+
+VISITS = {"HSC-G": {9697: [1], 9813: [2]}, "HSC-R": {9697: [3], 9813: [4]}}
+
+
+class MetadataButler(object):
+    """Stand-in Butler providing the dashboard metadata; every dataId exists
+    """
+
+    def get(self, dataset, **dataId):
+        assert dataset == "qaDashboard_info"
+        return {"visits": VISITS}
+
+    def datasetExists(self, dataset, dataId):
+        return True
+
+    def getUri(self, dataset, dataId):
+        return "file:///{}/{filter}/{tract}.parq".format(dataset, **dataId)
+
+
+def _frame(filt, tract, seed, n=1000):
+    rng = np.random.default_rng(seed)
+    return pd.DataFrame(
+        {
+            "filter": filt,
+            "tract": tract,
+            "psfMag": rng.uniform(16, 26, n),
+            "metric": rng.normal(seed, 1, n),
+        }
+    )
+
+
+@pytest.fixture()
+def partitioner(tmp_path):
+    partitioner = CoaddForcedPartitioner(str(tmp_path), butler=MetadataButler(), n_threads=1)
+    dfs = [_frame(f, t, seed) for seed, (f, t) in enumerate((f, t) for f in VISITS for t in VISITS[f])]
+    store_dataframes_as_dataset(
+        store=partitioner.store, dataset_uuid=partitioner.dataset, dfs=dfs, partition_on=["filter", "tract"]
+    )
+    with Client(processes=False, n_workers=1, dashboard_address=None):
+        yield partitioner
+
+
+def _assert_stats_equal(partitioner):
+    stats = pd.read_parquet(partitioner.stats_path).sort_index()
+    expected = partitioner.compute_stats().sort_index()
+    pd.testing.assert_frame_equal(stats[expected.columns], expected, check_dtype=False)
+
+
+def test_write_stats_subset(partitioner):
+    dataIds = partitioner.dataIds
+    assert partitioner.get_changed_dataIds() == dataIds
+
+    # only the dataIds computed are recorded, so the next run computes the others
+    partitioner.write_stats(dataIds=dataIds[:2])
+    assert partitioner.get_changed_dataIds() == dataIds[2:]
+    assert set(partitioner.read_stats_partitions()) == {("HSC-G", "9697"), ("HSC-G", "9813")}
+
+    partitioner.write_stats()
+    assert partitioner.get_changed_dataIds() == []
+    _assert_stats_equal(partitioner)
+
+
+def test_write_stats_merges_changed_dataIds(partitioner):
+    partitioner.write_stats()
+    assert partitioner.get_changed_dataIds() == []
+
+    # rewriting a dataId gives it new partition labels
+    update_dataset_from_dataframes(
+        [_frame("HSC-R", 9813, seed=10)],
+        store=partitioner.store,
+        dataset_uuid=partitioner.dataset,
+        partition_on=["filter", "tract"],
+        delete_scope=[{"filter": "HSC-R", "tract": 9813}],
+    )
+    assert partitioner.get_changed_dataIds() == [{"filter": "HSC-R", "tract": 9813}]
+
+    partitioner.write_stats()
+    assert partitioner.get_changed_dataIds() == []
+    stats = pd.read_parquet(partitioner.stats_path)
+    assert stats.loc[("HSC-R", 9813, "mean"), "metric"] > 9
+    _assert_stats_equal(partitioner)
+
+
+def test_stats_without_data(partitioner):
+    keys = ["filter", "tract"]
+    for stats in [
+        partitioner.stats_from_sketches({}, keys),
+        partitioner.compute_stats([{"filter": "HSC-I", "tract": 9697}]),
+    ]:
+        assert len(stats) == 0
+        assert list(stats.index.names) == keys + ["statistic"]
+        assert list(stats.columns) == sorted(partitioner.get_metric_columns())
+
+    partitioner.write_stats(dataIds=[{"filter": "HSC-I", "tract": 9697}])
+    assert len(pd.read_parquet(partitioner.stats_path)) == 0
@@ -0,0 +1,44 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+hv = pytest.importorskip("holoviews")
+pytest.importorskip("datashader")
+pytest.importorskip("kartothek")
+
+from holoviews.streams import RangeXY  # noqa: E402
+
+from lsst_dashboard.aggregates import SkyPyramid, build_pyramid, sky_aggregates  # noqa: E402
+from lsst_dashboard.dataset import Dataset  # noqa: E402
+from lsst_dashboard.plots import FilterStream, skyplot  # noqa: E402
+
+
+def _pyramid(n=20000, seed=0):
+    rng = np.random.default_rng(seed)
+    df = pd.DataFrame(
+        {"ra": rng.uniform(10, 20, n), "dec": rng.uniform(-5, 5, n), "metric": rng.normal(0, 2, n)}
+    )
+    tiles = build_pyramid(sky_aggregates(df, ["metric"])).assign(filter="HSC-R", tract=9813)
+    return SkyPyramid(tiles).select("HSC-R")
+
+
+def test_skyplot_of_empty_frame_draws_pyramid():
+    d = Dataset(path="")
+    d._dtypes[d.coadd_version] = {"metric": "float64", "ra": "float64", "dec": "float64", "psfMag": "float64"}
+    frame = d.empty_coadd_frame(["metric"])
+    assert len(frame) == 0
+    dset = hv.Dataset(frame, kdims=["ra", "dec"], vdims=["metric", "psfMag"])
+
+    pyramid = _pyramid()
+    (ra0, ra1), (dec0, dec1) = pyramid.extent()
+    assert ra0 <= 10 and ra1 >= 20 and dec0 <= -5 and dec1 >= 5
+
+    plot = skyplot(dset, vdim="metric", pyramid=pyramid, filter_stream=FilterStream(), range_stream=RangeXY())
+    images = plot[()].traverse(lambda el: el, [hv.Image])
+    assert images
+    image = images[0]
+    assert np.isfinite(image.bounds.lbrt()).all()
+    left, bottom, right, top = image.bounds.lbrt()
+    assert left <= 10 and right >= 20 and bottom <= -5 and top >= 5
+    values = image.dimension_values("metric", flat=False)
+    assert values.size > 1 and np.isfinite(values).any()
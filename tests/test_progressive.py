@@ -0,0 +1,124 @@
+import threading
+import time
+
+import dask.dataframe as dd
+import numpy as np
+import pandas as pd
+from distributed import Client
+
+from lsst_dashboard.progressive import PersistedLoad, ProgressiveLoad, sample_mask
+
+
+def test_sample_mask():
+    rng = np.random.default_rng(0)
+    df = pd.DataFrame({"ra": rng.uniform(0, 360, 100000), "dec": rng.uniform(-90, 90, 100000)})
+
+    mask = sample_mask(df, 0.01)
+    assert 800 < mask.sum() < 1200
+
+    # the sample does not depend on row order or on the rest of the frame
+    shuffled = df.sample(frac=1, random_state=1)
+    assert (sample_mask(shuffled, 0.01) == mask[shuffled.index]).all()
+    assert (sample_mask(df[:500], 0.01) == mask[:500]).all()
+
+    assert sample_mask(df, 1.0).all()
+    assert not sample_mask(df, 0.0).any()
+
+
+def test_progressive_load():
+    def load(part):
+        if part == 3:
+            raise ValueError(part)
+        return pd.DataFrame({"part": [part] * 10})
+
+    loader = ProgressiveLoad(load, range(5), min_interval=0).start()
+    while not loader.done:
+        time.sleep(0.01)
+
+    df = loader.poll()
+    assert sorted(df["part"].unique()) == [0, 1, 2, 4]
+    assert len(loader.errors) == 1
+    assert loader.progress == (5, 5)
+    assert loader.poll() is None
+
+
+def test_progressive_load_cancel():
+    release = threading.Event()
+
+    def load(part):
+        release.wait(5)
+        return pd.DataFrame({"part": [part]})
+
+    loader = ProgressiveLoad(load, range(10), max_workers=1).start()
+    loader.cancel()
+    release.set()
+    while not loader.done:
+        time.sleep(0.01)
+
+    # only the part already running when cancelled is loaded
+    assert len(loader.poll()) <= 1
+
+
+def test_progressive_load_restart():
+    # the bookkeeping of QuickLookComponent: one load per filter, cancelled and replaced on a new request
+    release = threading.Event()
+    loads, drawn = {}, []
+
+    def load_first(part):
+        release.wait(5)
+        return pd.DataFrame({"request": ["first"] * 10, "part": part})
+
+    def load_second(part):
+        return pd.DataFrame({"request": ["second"] * 10, "part": part})
+
+    def poll_loads():
+        for filt, load in list(loads.items()):
+            df = load.poll()
+            if df is None:
+                continue
+            if load.done:
+                del loads[filt]
+            drawn.append(df)
+
+    first = ProgressiveLoad(load_first, range(4), min_interval=0, max_workers=2).start()
+    loads["HSC-G"] = first
+    poll_loads()
+
+    # a new selection cancels the running load before starting its own
+    loads.pop("HSC-G").cancel()
+    loads["HSC-G"] = ProgressiveLoad(load_second, range(3), min_interval=0).start()
+    release.set()
+    while loads:
+        poll_loads()
+        time.sleep(0.01)
+
+    # the parts of the first load that were already running still finish, but are never drawn
+    while not first.done:
+        time.sleep(0.01)
+    assert first.progress == (4, 4) and len(first.poll()) <= 20
+    assert drawn and all((df["request"] == "second").all() for df in drawn)
+    assert sorted(drawn[-1]["part"].unique()) == [0, 1, 2]
+
+
+def test_persisted_load():
+    df = pd.DataFrame({"x": np.arange(1000)})
+    with Client(processes=False, n_workers=1, dashboard_address=None):
+        loader = PersistedLoad(dd.from_pandas(df, npartitions=4)).start()
+        while not loader.done:
+            time.sleep(0.01)
+        assert loader.progress == (4, 4)
+
+        ddf = loader.poll()
+        assert isinstance(ddf, dd.DataFrame)
+        assert ddf["x"].sum().compute() == df["x"].sum()
+        assert loader.poll() is None
+
+
+def test_progressive_load_without_parts():
+    empty = pd.DataFrame({"part": pd.Series(dtype="int64")})
+    loader = ProgressiveLoad(lambda part: None, [], min_interval=60, empty=empty).start()
+    assert loader.done and loader.progress == (0, 0)
+
+    # the first poll delivers the empty result, so that the load can be completed
+    assert loader.poll() is empty
+    assert loader.poll() is None
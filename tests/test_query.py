@@ -0,0 +1,56 @@
+import numpy as np
+import pandas as pd
+
+from lsst_dashboard.query import apply_predicates, query_columns, split_query
+
+
+def make_frame(n=1000, seed=0):
+    rng = np.random.RandomState(seed)
+    return pd.DataFrame(
+        {
+            "psfMag": rng.uniform(18, 26, n),
+            "qaBad_flag": rng.rand(n) < 0.3,
+            "tract": rng.choice([9615, 9697, 9813], n),
+            "patch": rng.choice(["1,1", "1,2"], n),
+            "ra": rng.uniform(0, 1, n),
+        }
+    )
+
+
+def test_split_query():
+    df = make_frame()
+    dtypes = df.dtypes
+    assert split_query("qaBad_flag==False & psfMag < 23", dtypes) == (
+        [("qaBad_flag", "==", False), ("psfMag", "<", 23.0)],
+        None,
+    )
+    assert split_query("~qaBad_flag & 20 <= psfMag < 23 & tract in [9615, 9697]", dtypes)[0] == [
+        ("qaBad_flag", "==", False),
+        ("psfMag", ">=", 20.0),
+        ("psfMag", "<", 23.0),
+        ("tract", "in", [9615, 9697]),
+    ]
+    # disjunctions, calls, unknown columns and mistyped values stay in memory
+    assert split_query("psfMag < 23 | qaBad_flag", dtypes)[0] == []
+    assert split_query("tract == 1.5 & other > 1", dtypes)[0] == []
+    assert split_query("`psfMag` > 1", dtypes) == ([], "`psfMag` > 1")
+    assert split_query("", dtypes) == ([], None)
+
+
+def test_split_query_equivalent():
+    df = make_frame()
+    for expr in [
+        "qaBad_flag==False & psfMag < 23",
+        "(psfMag > 20 | ra < 0.1) & patch == '1,2' & tract != 9813",
+        "22 > psfMag and qaBad_flag & ra.abs() < 0.5",
+    ]:
+        predicates, remainder = split_query(expr, df.dtypes)
+        assert predicates
+        result = apply_predicates(df, predicates)
+        if remainder:
+            result = result.query(remainder)
+        pd.testing.assert_frame_equal(result, df.query(expr))
+
+
+def test_query_columns():
+    assert query_columns("qaBad_flag & (psfMag < 23 | ra.abs() > 1)") == ["qaBad_flag", "psfMag", "ra"]
@@ -0,0 +1,71 @@
+import threading
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from lsst_dashboard.query import apply_predicates
+from lsst_dashboard.server import DataClient, DataServer, parse_address
+
+
+class FakeDataset:
+    def __init__(self):
+        rng = np.random.default_rng(0)
+        self.df = pd.DataFrame(
+            {
+                "tract": np.repeat([9697, 9813], 5000),
+                "ra": rng.uniform(0, 1, 10000),
+                "psfMag": rng.uniform(16, 26, 10000),
+            }
+        )
+        self.reads = 0
+
+    def read_coadd_columns(self, filter_name, tracts, columns, predicates=(), coadd_version=None):
+        self.reads += 1
+        df = self.df[self.df["tract"].isin(tracts)]
+        return apply_predicates(df, predicates)[columns].reset_index(drop=True)
+
+
+class FakeService:
+    def __init__(self):
+        self.datasets = {}
+
+    def get_dataset(self, path, coadd_version="unforced", **kwargs):
+        return self.datasets.setdefault((path, coadd_version), FakeDataset())
+
+    def release_dataset(self, dataset):
+        pass
+
+
+@pytest.fixture
+def server():
+    server = DataServer(port=0, service=FakeService())
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield server
+    server.shutdown()
+
+
+def test_read(server):
+    client = DataClient(server.address)
+    df = client.read("/data/rerun", "unforced", "HSC-G", [9813], ["ra", "psfMag"], [("psfMag", "<", 20)])
+
+    expected = server.service.get_dataset("/data/rerun").df
+    expected = expected[(expected["tract"] == 9813) & (expected["psfMag"] < 20)]
+    assert list(df.columns) == ["ra", "psfMag"]
+    np.testing.assert_array_equal(df["ra"].to_numpy(), expected["ra"].to_numpy())
+
+    # clients share the datasets of the server
+    DataClient(server.address).read("/data/rerun", "unforced", "HSC-G", [9697], ["ra"])
+    assert server.service.get_dataset("/data/rerun").reads == 2
+
+
+def test_read_error(server):
+    with pytest.raises(RuntimeError, match="KeyError"):
+        DataClient(server.address).read("/data/rerun", "unforced", "HSC-G", [9813], ["missing"])
+
+
+def test_parse_address():
+    assert parse_address("localhost:1234") == ("localhost", 1234)
+    assert parse_address(":1234") == ("127.0.0.1", 1234)
+    assert parse_address("localhost") == ("localhost", 52100)
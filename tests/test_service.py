@@ -0,0 +1,91 @@
+import os
+
+import pandas as pd
+
+from lsst_dashboard.service import DataService
+
+
+class FakeDataset:
+    path = "/data/rerun"
+    coadd_version = "unforced"
+
+
+class StubDataset:
+    def __init__(self, path, coadd_version="unforced", **kwargs):
+        self.path = path
+        self.coadd_version = coadd_version
+        self.kwargs = kwargs
+        self.connected = False
+
+    def connect(self):
+        self.connected = True
+
+
+def test_shared_frames():
+    service = DataService()
+    key = service.frame_key(FakeDataset(), "HSC-G", [9813, 9697], ["base_Footprint_nPix"])
+    assert key == service.frame_key(FakeDataset(), "HSC-G", [9697, 9813], ["base_Footprint_nPix"], "")
+    assert service.acquire(key) is None
+
+    first = pd.DataFrame({"x": [1, 2]})
+    assert service.share(key, first) is first
+    # a second session loading the same selection gets the first copy
+    assert service.share(key, pd.DataFrame({"x": [1, 2]})) is first
+    assert service.acquire(key) is first
+    assert service.refcount(key) == 3
+
+    for _ in range(3):
+        service.release(key)
+    assert service.refcount(key) == 0
+    assert service.acquire(key) is None
+
+
+def _write_metadata(repo, content):
+    path = repo / "analysisCoaddTable_unforced.by-dataset-metadata.json"
+    path.write_text(content)
+    # make sure the modification time changes even on coarse clocks
+    stat = path.stat()
+    os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns + len(content) * 10 ** 9))
+
+
+def test_shared_datasets(tmp_path):
+    _write_metadata(tmp_path, "{}")
+    service = DataService(dataset_cls=StubDataset)
+
+    first = service.get_dataset(tmp_path, cache_dir="/tmp/cache")
+    assert first.connected and first.kwargs == {"cache_dir": "/tmp/cache"}
+    # a second session (e.g. through another path to the repository) shares it
+    assert service.get_dataset(tmp_path / ".") is first
+    assert service.get_dataset(tmp_path, coadd_version="forced") is not first
+
+
+def test_dataset_reconnects_after_update(tmp_path):
+    _write_metadata(tmp_path, "{}")
+    service = DataService(dataset_cls=StubDataset)
+    first = service.get_dataset(tmp_path)
+    old_key = service.frame_key(first, "HSC-G", [9813], ["x"])
+
+    _write_metadata(tmp_path, '{"partitions": {}}')
+    second = service.get_dataset(tmp_path)
+    assert second is not first and second.connected
+    assert service.get_dataset(tmp_path) is second
+    # selections of the outdated dataset are not shared with the new one
+    assert service.frame_key(second, "HSC-G", [9813], ["x"]) != old_key
+
+    # releasing the outdated dataset does not affect the new one
+    service.release_dataset(first)
+    assert service.get_dataset(tmp_path) is second
+
+
+def test_unused_datasets_are_evicted(tmp_path):
+    _write_metadata(tmp_path, "{}")
+    service = DataService(dataset_cls=StubDataset)
+    first = service.get_dataset(tmp_path)
+    assert service.get_dataset(tmp_path) is first
+
+    service.release_dataset(first)
+    assert service.get_dataset(tmp_path) is first
+    service.release_dataset(first)
+    service.release_dataset(first)
+    # the last session released it, so the next one connects again
+    assert service.get_dataset(tmp_path) is not first
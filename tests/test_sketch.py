@@ -0,0 +1,47 @@
+import numpy as np
+import pandas as pd
+
+from lsst_dashboard.sketch import TableSketch, rollup
+
+PERCENTILES = [0.01, 0.25, 0.5, 0.75, 0.99]
+
+
+def _frame(n, seed):
+    rng = np.random.default_rng(seed)
+    df = pd.DataFrame({"a": rng.normal(size=n), "b": rng.exponential(size=n), "flag": rng.random(n) < 0.5})
+    df.loc[::7, "b"] = np.nan
+    df.loc[::11, "a"] = np.inf
+    return df
+
+
+def test_table_sketch_matches_describe():
+    df = _frame(50000, 0)
+    sketch = TableSketch()
+    for start in range(0, len(df), 4000):
+        sketch.update(df.iloc[start : start + 4000])
+
+    result = sketch.describe(PERCENTILES)
+    expected = df.replace(np.inf, np.nan).dropna(how="any").describe(percentiles=PERCENTILES)
+
+    assert list(result.columns) == ["a", "b"]
+    assert list(result.index) == list(expected.index)
+    for stat in ["count", "mean", "std", "min", "max"]:
+        np.testing.assert_allclose(result.loc[stat], expected.loc[stat])
+    np.testing.assert_allclose(result.loc[["1%", "50%", "99%"]], expected.loc[["1%", "50%", "99%"]], atol=0.05)
+
+
+def test_rollup_merges_sketches():
+    frames = {("HSC-G", 9813): _frame(3000, 1), ("HSC-G", 9697): _frame(2000, 2), ("HSC-R", 9813): _frame(10, 3)}
+    sketches = {}
+    for key, df in frames.items():
+        sketches[key] = TableSketch()
+        sketches[key].update(df)
+
+    rolled = rollup(sketches, ["filter", "tract"], ["filter"])
+
+    assert set(rolled) == {("HSC-G",), ("HSC-R",)}
+    combined = pd.concat([frames[("HSC-G", 9813)], frames[("HSC-G", 9697)]])
+    expected = combined.replace(np.inf, np.nan).dropna(how="any").describe()
+    result = rolled[("HSC-G",)].describe()
+    for stat in ["count", "mean", "std", "min", "max"]:
+        np.testing.assert_allclose(result.loc[stat], expected.loc[stat])
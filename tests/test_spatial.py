@@ -0,0 +1,60 @@
+import numpy as np
+import pandas as pd
+import pyarrow.parquet as pq
+import pytest
+
+from lsst_dashboard.spatial import Box, Cone, Polygon, add_hpix, ang2pix_nest, coverage_table, degrade
+
+
+def random_positions(n, seed=0):
+    rng = np.random.RandomState(seed)
+    return rng.uniform(0, 360, n), np.rad2deg(np.arcsin(rng.uniform(-1, 1, n)))
+
+
+def test_ang2pix_nest():
+    ra, dec = random_positions(100000)
+    for order in [0, 4, 12]:
+        pix = ang2pix_nest(order, ra, dec)
+        assert pix.min() >= 0 and pix.max() < 12 * 4 ** order
+    assert (degrade(ang2pix_nest(12, ra, dec), 12, 4) == ang2pix_nest(4, ra, dec)).all()
+    assert ang2pix_nest(4, [np.nan], [0.0])[0] == -1
+
+    hp = pytest.importorskip("healpy")
+    assert (ang2pix_nest(12, ra, dec) == hp.ang2pix(4096, ra, dec, nest=True, lonlat=True)).all()
+
+
+def test_regions():
+    ra, dec = random_positions(200000, seed=1)
+    regions = [
+        Cone(0.5, 10, 2),
+        Box(359, 2, -5, 5),
+        Polygon([358, 3, 1, 359], [-2, -2, 4, 3]),
+    ]
+    for region in regions:
+        inside = region.contains(ra, dec)
+        assert inside.any()
+        # the bounds of a region contain all of its points
+        assert region.overlaps_box(ra[inside], ra[inside], dec[inside], dec[inside]).all()
+
+    assert Cone(0, 0, 1).contains([0.5, 359.5, 2], [0, 0, 0]).tolist() == [True, True, False]
+    assert Box(359, 1, -1, 1).contains([0.5, 358, 359.5], [0, 0, 2]).tolist() == [True, False, False]
+
+
+def test_coverage_table(tmp_path):
+    ra, dec = random_positions(50000, seed=2)
+    df = add_hpix(pd.DataFrame({"ra": ra, "dec": dec})).sort_values("hpix")
+    filename = str(tmp_path / "part.parquet")
+    df.to_parquet(filename, row_group_size=1000, index=False)
+
+    coverage = coverage_table(pq.ParquetFile(filename), "part.parquet")
+    assert coverage["count"].sum() == len(df)
+
+    region = Cone(120, 30, 3)
+    row_groups = coverage.loc[
+        region.overlaps_box(coverage["ra_min"], coverage["ra_max"], coverage["dec_min"], coverage["dec_max"]),
+        "row_group",
+    ].unique()
+    # only a few row groups are read, and they contain every object in the region
+    assert len(row_groups) < 10
+    subset = pq.ParquetFile(filename).read_row_groups(sorted(row_groups)).to_pandas()
+    assert region.contains(subset["ra"], subset["dec"]).sum() == region.contains(df["ra"], df["dec"]).sum()
@@ -0,0 +1,64 @@
+import numpy as np
+import pandas as pd
+
+from lsst_dashboard.stats import STATISTICS, SummaryStats, read_stats_table
+
+
+def _stats_table(keys, seed=0):
+    """Stats table indexed by (*keys, statistic), like the partitioners write, in shuffled order
+    """
+    rng = np.random.default_rng(seed)
+    index = pd.MultiIndex.from_tuples(
+        [(*key, s) for key in keys for s in STATISTICS + ["std", "50%"]],
+        names=["filter", "tract", "visit", "statistic"][: len(keys[0])] + ["statistic"],
+    )
+    df = pd.DataFrame(
+        {"psfMag": rng.normal(size=len(index)), "metric": rng.normal(size=len(index))}, index=index
+    )
+    return df.sample(frac=1, random_state=seed)
+
+
+def _mask_select(df, filt, tracts=None):
+    """Reference result of `SummaryStats.select` with boolean masks
+    """
+    keep = df.index.get_level_values("filter") == filt
+    if tracts:
+        keep &= df.index.get_level_values("tract").isin(tracts)
+    return df[keep].droplevel([lvl for lvl in df.index.names if lvl != "statistic"])
+
+
+def _sorted(df):
+    return df.reset_index().sort_values(list(df.reset_index().columns)).reset_index(drop=True)
+
+
+def test_select(tmp_path):
+    coadd = _stats_table([(f, t) for f in ["HSC-G", "HSC-R"] for t in [9697, 9813, 9615]])
+    visit = _stats_table(
+        [(f, t, v) for f in ["HSC-G", "HSC-R"] for t in [9697, 9813] for v in [1, 2, 3]], seed=1
+    )
+    coadd.to_parquet(tmp_path / "coadd.parq")
+    tables = {"coadd_unforced": read_stats_table(tmp_path / "coadd.parq"), "visit": visit.sort_index()}
+    assert set(tables["coadd_unforced"].index.unique(level="statistic")) == set(STATISTICS)
+    stats = SummaryStats(tables)
+
+    cases = [
+        ("coadd_unforced", "HSC-R", None),
+        ("coadd_unforced", "HSC-R", []),
+        ("coadd_unforced", "HSC-G", [9813, 9697]),
+        # tracts missing from the table are ignored
+        ("coadd_unforced", "HSC-G", [9813, 1234]),
+        ("coadd_unforced", "HSC-G", [1234]),
+        ("visit", "HSC-R", None),
+        ("visit", "HSC-G", [9813]),
+    ]
+    for name, filt, tracts in cases:
+        result = stats.select(name, filt, tracts)
+        expected = _mask_select(tables[name], filt, tracts)
+        assert list(result.index.names) == ["statistic"]
+        assert len(result) == len(expected)
+        pd.testing.assert_frame_equal(_sorted(result), _sorted(expected))
+
+    # min over the selected tracts, as used for the plot ranges
+    result = stats.select("coadd_unforced", "HSC-G", [9697, 9813])
+    expected = _mask_select(tables["coadd_unforced"], "HSC-G", [9697, 9813])
+    assert result["psfMag"]["min"].min() == expected.loc["min", "psfMag"].min()
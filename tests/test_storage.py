@@ -0,0 +1,83 @@
+import os
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+from lsst_dashboard.query import apply_predicates
+from lsst_dashboard.storage import arrow_to_pandas, partition_values, read_arrow_partitions
+
+
+class DirectoryStore(object):
+    """Stand-in for a storefact store of a local directory
+    """
+
+    def __init__(self, root):
+        self.root = root
+
+    def open(self, key):
+        return open(os.path.join(self.root, key), "rb")
+
+
+def _write_partitions(root, n_rows=3000, row_group_size=500):
+    """Writes a kartothek-like partitioned table; returns its `partition_frame` and the full frame
+    """
+    rng = np.random.default_rng(0)
+    records, frames = [], []
+    for filt in ["HSC-G", "HSC-R"]:
+        for tract in [9697, 9813]:
+            # sorted by psfMag, so that row group statistics can skip most of each file
+            df = pd.DataFrame(
+                {
+                    "psfMag": np.sort(rng.uniform(16, 26, n_rows)),
+                    "metric": rng.normal(0, 1, n_rows),
+                    "patch": rng.choice(["1,1", "1,2", "2,1"], n_rows),
+                }
+            )
+            key = f"table/filter={filt}/tract={tract}/part.parquet"
+            os.makedirs(os.path.join(root, os.path.dirname(key)), exist_ok=True)
+            pq.write_table(pa.Table.from_pandas(df), os.path.join(root, key), row_group_size=row_group_size)
+            records.append(dict(label=f"{filt}-{tract}", file=key, **partition_values(key)))
+            frames.append(df.assign(filter=filt, tract=tract))
+    partitions = pd.DataFrame.from_records(records).set_index("label").astype({"tract": "int64"})
+    return partitions, pd.concat(frames, ignore_index=True)
+
+
+def test_read_arrow_partitions(tmp_path):
+    partitions, df = _write_partitions(str(tmp_path))
+    store = DirectoryStore(str(tmp_path))
+    partitions = partitions[partitions["filter"] == "HSC-R"]
+
+    columns = ["psfMag", "metric", "filter", "tract"]
+    filters = [("psfMag", "<", 18.0), ("patch", "!=", "2,1")]
+    table = read_arrow_partitions(partitions, store, columns=columns, filters=filters)
+    result = arrow_to_pandas(table)
+
+    expected = pd.concat(
+        [
+            pd.read_parquet(tmp_path / key, filters=filters).assign(filter=filt, tract=tract)
+            for key, filt, tract in zip(partitions["file"], partitions["filter"], partitions["tract"])
+        ],
+        ignore_index=True,
+    )[columns]
+    assert len(result) == len(expected) > 0
+    assert list(result.columns) == columns
+    assert result["filter"].dtype == "category" and result["tract"].dtype == np.int64
+    pd.testing.assert_frame_equal(result.astype({"filter": str}), expected)
+
+    # the same rows as filtering the full table in memory
+    in_memory = apply_predicates(df[df["filter"] == "HSC-R"], filters)
+    assert len(in_memory) == len(result)
+    assert np.isclose(in_memory["metric"].sum(), result["metric"].sum())
+
+
+def test_read_arrow_partitions_all_columns(tmp_path):
+    partitions, df = _write_partitions(str(tmp_path))
+    table = read_arrow_partitions(partitions, DirectoryStore(str(tmp_path)), max_workers=2)
+    result = arrow_to_pandas(table)
+    assert set(result.columns) == set(df.columns)
+    assert len(result) == len(df)
+    assert np.isclose(result["psfMag"].sum(), df["psfMag"].sum())
+
+    assert read_arrow_partitions(partitions.iloc[:0], DirectoryStore(str(tmp_path))) is None